@@ -14,6 +14,12 @@ def create_app():
     app.config.from_object("config")
 
     db.init_app(app)
+
+    # Perfil del motor SQLite (WAL, busy_timeout, mmap...) según DB_PROFILE
+    from app.services.sqlite_profile import configure_engine
+    with app.app_context():
+        configure_engine(db.engine, app.config['SQLITE_PROFILES'][app.config['DB_PROFILE']])
+
     migrate.init_app(app, db)
     login_manager.init_app(app)
     login_manager.login_view = "admin.login"
@@ -32,6 +38,9 @@ def create_app():
     from app.routes.miembro import miembro_bp 
     from app.routes.auth import auth_bp
     from app.routes.mensajes import mensajero_bp    
+    from app.routes.eventos import eventos_bp
+    from app.routes.uploads import uploads_bp
+    from app.routes.busqueda import busqueda_bp
 
 
 
@@ -44,13 +53,65 @@ def create_app():
     app.register_blueprint(miembro_bp)  
     app.register_blueprint(auth_bp)
     app.register_blueprint(mensajero_bp)
+    app.register_blueprint(eventos_bp)
+    app.register_blueprint(uploads_bp)
+    app.register_blueprint(busqueda_bp)
+
+    # Contador de notificaciones no leídas para el layout
+    from app.services.notifications import inject_unread_notifications
+    app.context_processor(inject_unread_notifications)
+
+    # Snapshot de KPIs del dashboard, actualizado en cada flush
+    from app.services.kpis import register_kpi_listeners
+    register_kpi_listeners()
+
+    # Eventos en vivo (SSE): se publican en cada flush y se reparten por proceso
+    from app.services.events import event_bus, register_event_listeners
+    event_bus.init_app(app)
+    register_event_listeners()
+
+    # Estáticos con huella de contenido (dist/manifest.json, ver `flask assets build`)
+    from app.services.assets import asset_manifest
+    asset_manifest.init_app(app)
+
+    # Archivos subidos por contenido: conteo de referencias, caché immutable y `flask blobs`
+    from app.services.blob_store import init_blob_store
+    init_blob_store(app)
+
+    # Cola de trabajos en la base: hilo inline tras el commit, `flask worker` y `flask jobs`
+    from app.services.jobs import job_queue
+    job_queue.init_app(app)
+
+    # Miniaturas y WebP de las fotos, generadas en la cola de trabajos
+    from app.services.image_variants import image_variants
+    image_variants.init_app(app)
+
+    # Caché y pool de procesos para los PDF de incidencias
+    from app.services.pdf_render import incident_pdf_cache
+    incident_pdf_cache.init_app(app)
+
+    # Comandos de mantenimiento (flask <comando>)
+    from app.services.query_plans import check_query_plans_command
+    app.cli.add_command(check_query_plans_command)
+    from app.services.search import search_cli
+    app.cli.add_command(search_cli)
+
+    # Texto de documentos y adjuntos para la búsqueda: extracción en la cola y `flask texts`
+    from app.services.text_extraction import text_extractor
+    text_extractor.init_app(app)
+
+    # Conteo de consultas por request, N+1 y presupuestos (QUERY_AUDIT / QUERY_BUDGETS)
+    from app.services.query_audit import init_query_audit
+    init_query_audit(app)
     
 
 
-    with app.app_context():
-        from .models import AdminUser, ContactMessage  # importa aquí
-        @login_manager.user_loader
-        def load_user(user_id):
-            return AdminUser.query.get(int(user_id))
+    # Usuario + roles en una sola consulta, cacheados entre requests
+    from app.services.identity import identity_cache
+    identity_cache.init_app(app)
+
+    @login_manager.user_loader
+    def load_user(user_id):
+        return identity_cache.load(int(user_id))
 
     return app
@@ -7,6 +7,9 @@ from . import db  # ✅ ya no genera loop
 # Tabla de los mensajes
 class ContactMessage(db.Model):
     __tablename__ = "mensajes"
+    __table_args__ = (
+        db.Index('ix_mensajes_fecha', 'fecha'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(100), nullable=False)
@@ -26,6 +29,9 @@ class AdminUser(UserMixin, db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
 
+    # Contador cacheado de notificaciones no leídas (lo mantiene app/services/notifications.py)
+    unread_notifications = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
     # Relación con los roles (muchos a muchos)
     roles = db.relationship('Role', secondary='user_roles', backref=db.backref('users', lazy='dynamic'))
 
@@ -109,6 +115,10 @@ class Project(db.Model):
 
 class ProjectUserRole(db.Model):
     __tablename__ = 'project_user_role'
+    __table_args__ = (
+        # La PK (project_id, user_id) no sirve para buscar por usuario
+        db.Index('ix_project_user_role_user_id', 'user_id'),
+    )
     
     project_id = db.Column(db.Integer, db.ForeignKey('projects.id', ondelete='CASCADE'), primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('admin_users.id', ondelete='CASCADE'), primary_key=True)
@@ -139,6 +149,9 @@ class ProjectInvitation(db.Model):
 
 class ProjectDocument(db.Model):
     __tablename__ = 'project_documents'
+    __table_args__ = (
+        db.Index('ix_project_documents_project_upload', 'project_id', 'upload_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     project_id = db.Column(db.Integer, db.ForeignKey('projects.id', ondelete='CASCADE'), nullable=False)
@@ -158,6 +171,11 @@ class ProjectDocument(db.Model):
 
 class ProjectTask(db.Model):
     __tablename__ = 'project_tasks'
+    __table_args__ = (
+        db.Index('ix_project_tasks_project_status', 'project_id', 'status'),
+        db.Index('ix_project_tasks_responsible_start', 'responsible_user_id', 'start_date'),
+        db.Index('ix_project_tasks_status', 'status'),  # tareas completadas de todos los proyectos
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(128), nullable=False)  # Nombre de la tarea
@@ -178,6 +196,9 @@ class ProjectTask(db.Model):
 
 class ProjectProgress(db.Model):
     __tablename__ = 'project_progress'
+    __table_args__ = (
+        db.Index('ix_project_progress_project_date', 'project_id', 'date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     project_id = db.Column(db.Integer, db.ForeignKey('projects.id', ondelete='CASCADE'), nullable=False)
@@ -195,6 +216,9 @@ class ProjectProgress(db.Model):
 
 class ProgressPhoto(db.Model):
     __tablename__ = 'progress_photos'
+    __table_args__ = (
+        db.Index('ix_progress_photos_progress_id', 'progress_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     progress_id = db.Column(db.Integer, db.ForeignKey('project_progress.id', ondelete='CASCADE'), nullable=False)
@@ -209,6 +233,9 @@ class ProgressPhoto(db.Model):
 
 class DailyChecklist(db.Model):
     __tablename__ = 'daily_checklists'
+    __table_args__ = (
+        db.Index('ix_daily_checklists_project_active', 'project_id', 'is_active'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     project_id = db.Column(db.Integer, db.ForeignKey('projects.id', ondelete='CASCADE'), nullable=False)
@@ -223,11 +250,16 @@ class DailyChecklist(db.Model):
 
 class ChecklistCompletion(db.Model):
     __tablename__ = 'checklist_completion'
+    __table_args__ = (
+        db.Index('ix_checklist_completion_user_date', 'user_id', 'date'),
+        # Un estado por ítem, usuario y día: destino del INSERT ... ON CONFLICT al guardar
+        db.Index('ix_checklist_completion_item_user_date', 'checklist_id', 'user_id', 'date', unique=True),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     checklist_id = db.Column(db.Integer, db.ForeignKey('daily_checklists.id', ondelete='CASCADE'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('admin_users.id', ondelete='CASCADE'), nullable=False)
-    date = db.Column(db.Date, default=datetime.utcnow().date)
+    date = db.Column(db.Date, default=lambda: datetime.now(ZoneInfo("America/Santiago")).date())  # día en Chile, por fila
     completed = db.Column(db.Boolean, default=False)
 
     checklist = db.relationship('DailyChecklist', backref=db.backref('completions', lazy=True))
@@ -239,6 +271,10 @@ class ChecklistCompletion(db.Model):
 
 class Comment(db.Model):
     __tablename__ = 'comments'
+    __table_args__ = (
+        # (task_id, rowid): el feed de comentarios pagina y ordena por id dentro de la tarea
+        db.Index('ix_comments_task_id', 'task_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
@@ -263,6 +299,10 @@ class Comment(db.Model):
 
 class IncidentReport(db.Model):
     __tablename__ = 'incident_reports'
+    __table_args__ = (
+        db.Index('ix_incident_reports_project_reporter_datetime', 'project_id', 'reporter_id', 'report_datetime'),
+        db.Index('ix_incident_reports_report_datetime', 'report_datetime'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     
@@ -303,6 +343,7 @@ class IncidentReport(db.Model):
     # 7️⃣ Evidencia
     photo_path = db.Column(db.String(255), nullable=True)
     attachment_path = db.Column(db.String(255), nullable=True)
+    attachment_name = db.Column(db.String(255), nullable=True)  # nombre con que se subió el adjunto
     evidence_comment = db.Column(db.String(255), nullable=True)
 
     # 8️⃣ Seguimiento (administrador)
@@ -322,6 +363,11 @@ class IncidentReport(db.Model):
 
 class TechnicalReport(db.Model):
     __tablename__ = 'technical_reports'
+    __table_args__ = (
+        db.Index('ix_technical_reports_user_created', 'user_id', 'created_at'),
+        db.Index('ix_technical_reports_project_id', 'project_id'),
+        db.Index('ix_technical_reports_report_date', 'report_date'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(150), nullable=False)
@@ -353,6 +399,7 @@ class TechnicalReport(db.Model):
 
     # Archivo PDF o adicional
     attachment_path = db.Column(db.String(255), nullable=True)
+    attachment_name = db.Column(db.String(255), nullable=True)  # nombre con que se subió el adjunto
 
     user_id = db.Column(db.Integer, db.ForeignKey('admin_users.id'), nullable=False)
 
@@ -382,6 +429,10 @@ class ConfigTemplate(db.Model):
 
 class ApprovalFlow(db.Model):
     __tablename__ = 'approval_flows'
+    __table_args__ = (
+        db.Index('ix_approval_flows_responsible_created', 'responsible_id', 'created_at'),
+        db.Index('ix_approval_flows_project_task_id', 'project_task_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
@@ -400,6 +451,12 @@ class ApprovalFlow(db.Model):
 
 class SystemNotification(db.Model):
     __tablename__ = 'system_notifications'
+    __table_args__ = (
+        # Cubre el conteo de no leídas y el listado ordenado por fecha de cada usuario
+        db.Index('ix_system_notifications_user_read_created', 'user_id', 'read', 'created_at'),
+        # Listado paginado por (created_at, id) de cada usuario
+        db.Index('ix_system_notifications_user_created', 'user_id', 'created_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(150), nullable=False)
@@ -411,4 +468,108 @@ class SystemNotification(db.Model):
     user = db.relationship('AdminUser', backref='system_notifications')
 
     def __repr__(self):
-        return f"<SystemNotification {self.title}>"
\ No newline at end of file
+        return f"<SystemNotification {self.title}>"
+
+# Indicadores precalculados del dashboard de control (ver app/services/kpis.py)
+class KpiSnapshot(db.Model):
+    __tablename__ = 'kpi_snapshot'
+
+    key = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.Float, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<KpiSnapshot {self.key}={self.value}>"
+
+# Eventos para el stream SSE de cada usuario (ver app/services/events.py)
+class StreamEvent(db.Model):
+    __tablename__ = 'stream_events'
+    __table_args__ = (
+        # (channel, rowid): reanudar un canal desde Last-Event-ID
+        db.Index('ix_stream_events_channel', 'channel'),
+        db.Index('ix_stream_events_created_at', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    channel = db.Column(db.String(40), nullable=False)  # user:<id>, task:<id> o identity
+    event = db.Column(db.String(30), nullable=False)
+    data = db.Column(db.Text, nullable=False)  # JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<StreamEvent {self.id} {self.channel} {self.event}>"
+
+
+# Archivos subidos, guardados una sola vez por contenido (ver app/services/blob_store.py)
+class StoredBlob(db.Model):
+    __tablename__ = 'stored_blobs'
+    __table_args__ = (
+        db.Index('ix_stored_blobs_path', 'path', unique=True),
+    )
+
+    sha256 = db.Column(db.String(64), primary_key=True)
+    path = db.Column(db.String(255), nullable=False)  # relativa a static: blobs/ab/cd/<sha256>.<ext>
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # filas que apuntan al archivo
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<StoredBlob {self.sha256[:12]} refs={self.ref_count}>"
+
+
+# Texto extraído de documentos y adjuntos de reportes, por fragmentos, para la búsqueda
+# (ver app/services/text_extraction.py). Cada fila pertenece a un documento o a un reporte.
+class DocumentText(db.Model):
+    __tablename__ = 'document_texts'
+    __table_args__ = (
+        db.UniqueConstraint('document_id', 'chunk', name='uq_document_texts_document_chunk'),
+        db.UniqueConstraint('report_id', 'chunk', name='uq_document_texts_report_chunk'),
+        db.UniqueConstraint('template_id', 'chunk', name='uq_document_texts_template_chunk'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id', ondelete='CASCADE'), nullable=True)  # las plantillas no tienen
+    document_id = db.Column(db.Integer, db.ForeignKey('project_documents.id', ondelete='CASCADE'), nullable=True)
+    report_id = db.Column(db.Integer, db.ForeignKey('technical_reports.id', ondelete='CASCADE'), nullable=True)
+    template_id = db.Column(db.Integer, db.ForeignKey('config_templates.id', ondelete='CASCADE'), nullable=True)
+    sha256 = db.Column(db.String(64), nullable=False)  # del archivo del que salió el texto; '' si falló
+    chunk = db.Column(db.Integer, nullable=False)  # posición del fragmento, desde 0
+    title = db.Column(db.String(255), nullable=False)
+    content = db.Column(db.Text, nullable=False, default='')
+    extracted_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        if self.document_id:
+            owner = f"document_id={self.document_id}"
+        elif self.report_id:
+            owner = f"report_id={self.report_id}"
+        else:
+            owner = f"template_id={self.template_id}"
+        return f"<DocumentText {owner} chunk={self.chunk}>"
+
+
+# Cola de trabajos en segundo plano (ver app/services/jobs.py)
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_ready', 'status', 'priority', 'run_at'),
+        db.Index('ix_jobs_idempotency_key', 'idempotency_key', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    task = db.Column(db.String(100), nullable=False)  # nombre registrado con @task
+    payload = db.Column(db.Text, nullable=False, default='{}')  # argumentos en JSON
+    priority = db.Column(db.Integer, nullable=False, default=0)  # mayor = antes
+    status = db.Column(db.String(20), nullable=False, default='pendiente')  # pendiente, en_curso, completado, fallido
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # no antes de (reintentos)
+    idempotency_key = db.Column(db.String(200), nullable=True)
+    locked_by = db.Column(db.String(100), nullable=True)  # worker que lo tomó
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.task} {self.status}>"
@@ -5,21 +5,25 @@ from flask import Blueprint, redirect, render_template, url_for, flash
 from flask_login import current_user, login_required
 import pytz
 from sqlalchemy import func
+from sqlalchemy.orm import joinedload, selectinload
 from app.forms import AssignUserForm, CreateUserForm, ProjectForm
 from app.models import AdminUser, ApprovalFlow, ConfigTemplate, ContactMessage, IncidentReport, Project, ProjectInvitation, ProjectTask, ProjectUserRole, Role, SystemNotification, TechnicalReport, UserRoles
 from app import db
+from app.services.kpis import dashboard_kpis, progress_histogram
+from app.services.permissions import requires
+from app.services.notifications import mark_all_read, unread_count
+from app.services.pagination import paginate_keyset
 from werkzeug.security import generate_password_hash
 from flask import request
 from werkzeug.utils import secure_filename
 
-# PDF generation imports
-from io import BytesIO
-from flask import send_file
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import cm
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
+# PDF de incidencias (render cacheado, ver app/services/pdf_render.py)
+from flask import Response, jsonify, stream_with_context
+from app.services.blob_store import store_upload
+from app.services.dossier import dossier_entries, stream_dossier
+from app.services.downloads import send_download
+from app.services.pdf_render import incident_payload, incident_pdf_cache
+from app.services.jobs import enqueue
 import os
 from flask import current_app
 
@@ -37,19 +41,17 @@ def admin_dashboard():
 @login_required
 def usuarios():
     # Obtener todos los usuarios con sus roles
-    usuarios = AdminUser.query.all()  
+    usuarios = AdminUser.query.options(selectinload(AdminUser.roles)).all()
     # Renderizar la plantilla con la lista de usuarios
     return render_template('admin/usuarios.html', usuarios=usuarios)  
 
 # Ruta para crear un nuevo usuario
+# Solo el admin puede crear usuarios
 @admin_bp.route('/admin/crear_usuario', methods=['GET', 'POST'])
 @login_required
+@requires(role='admin', redirect_to='admin.admin_dashboard',
+          message="No tienes permisos para acceder a esta página.")
 def crear_usuario():
-    # Solo el admin puede crear usuarios
-    if not current_user.has_role('admin'):
-        flash("No tienes permisos para acceder a esta página.", 'danger')
-        return redirect(url_for('admin.admin_dashboard'))
-    
     form = CreateUserForm()
 
     form.rol.choices = [(role.id, role.name) for role in Role.query.all()]
@@ -106,15 +108,10 @@ def nuevo_proyecto():
         )
 
         # 📂 Manejo de archivos (presupuesto y cronograma)
-        for field, folder in [('budget_file', 'presupuestos'), ('schedule_file', 'cronogramas')]:
-            file = getattr(form, field).data
-            if file:
-                filename = secure_filename(file.filename)
-                upload_path = os.path.join(current_app.root_path, 'static', 'uploads', folder)
-                os.makedirs(upload_path, exist_ok=True)
-                file_path = os.path.join(upload_path, filename)
-                file.save(file_path)
-                setattr(project, field, f'uploads/{folder}/{filename}')
+        for field in ('budget_file', 'schedule_file'):
+            file_path = store_upload(getattr(form, field).data)
+            if file_path:
+                setattr(project, field, file_path)
 
         # 💾 Guardar en base de datos
         db.session.add(project)
@@ -158,15 +155,10 @@ def edit_project(project_id):
         project.admin_comment = form.admin_comment.data
 
         # 📂 Reemplazar archivos si se suben nuevos
-        for field, folder in [('budget_file', 'presupuestos'), ('schedule_file', 'cronogramas')]:
-            file = getattr(form, field).data
-            if file:
-                filename = secure_filename(file.filename)
-                upload_path = os.path.join(current_app.root_path, 'static', 'uploads', folder)
-                os.makedirs(upload_path, exist_ok=True)
-                file_path = os.path.join(upload_path, filename)
-                file.save(file_path)
-                setattr(project, field, f'uploads/{folder}/{filename}')
+        for field in ('budget_file', 'schedule_file'):
+            file_path = store_upload(getattr(form, field).data)
+            if file_path:
+                setattr(project, field, file_path)
 
         db.session.commit()
         flash('✅ Proyecto actualizado correctamente.', 'success')
@@ -250,11 +242,33 @@ def assign_user_to_project():
 @login_required
 def project_details(project_id):
     project = Project.query.get_or_404(project_id)
-    users_in_project = ProjectUserRole.query.filter_by(project_id=project.id).all()  # Obtener los usuarios asignados
+    users_in_project = (  # Obtener los usuarios asignados
+        ProjectUserRole.query
+        .options(joinedload(ProjectUserRole.user), joinedload(ProjectUserRole.role))
+        .filter_by(project_id=project.id)
+        .all()
+    )
     roles = Role.query.all()  # Obtener todos los roles disponibles
     return render_template('admin/detalles_proyecto.html', project=project, users_in_project=users_in_project, roles=roles)
 
 
+# Dossier del proyecto: ZIP con documentos, reportes, fotos de avance e incidencias,
+# generado en streaming (no se arma en memoria ni en disco)
+@admin_bp.route('/proyectos/<int:project_id>/dossier.zip')
+@login_required
+@requires(role='admin', redirect_to='admin.admin_dashboard',
+          message="No tienes permisos para descargar el dossier.")
+def descargar_dossier(project_id):
+    project = Project.query.get_or_404(project_id)
+    entries = dossier_entries(project, current_app.static_folder)
+    filename = f"dossier_{secure_filename(project.name) or project.id}.zip"
+    return Response(
+        stream_with_context(stream_dossier(entries)),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"', 'X-Accel-Buffering': 'no'},
+    )
+
+
 
 
 
@@ -271,14 +285,14 @@ def listar_incidencias():
     estado = request.args.get('estado')
     gravedad = request.args.get('gravedad')
 
-    query = IncidentReport.query.join(Project).order_by(IncidentReport.report_datetime.desc())
+    query = IncidentReport.query.join(Project)
 
     if estado:
         query = query.filter(IncidentReport.status == estado)
     if gravedad:
         query = query.filter(IncidentReport.severity == gravedad)
 
-    incidencias = query.all()
+    incidencias = paginate_keyset(query, IncidentReport.report_datetime, IncidentReport.id)
     usuarios = AdminUser.query.all()  
 
     return render_template('admin/incidencias.html', incidencias=incidencias, usuarios=usuarios, estado=estado, gravedad=gravedad)
@@ -304,7 +318,10 @@ def actualizar_incidencia(incident_id):
     else:
         incidencia.closure_date = None
 
+    # El PDF cambió: la versión nueva se renderiza en la cola, que también borra las viejas
+    enqueue('pdf.incidencia', {'incident_id': incidencia.id})
     db.session.commit()
+
     flash('Incidencia actualizada correctamente.', 'success')
     return redirect(url_for('admin.listar_incidencias'))
 
@@ -321,97 +338,33 @@ def ver_incidencia(incident_id):
 @admin_bp.route('/incidencias/pdf/<int:incident_id>')
 @login_required
 def descargar_incidencia_pdf(incident_id):
-    incidencia = IncidentReport.query.get_or_404(incident_id)
-    proyecto = Project.query.get(incidencia.project_id)
+    incidencia = (
+        IncidentReport.query
+        .options(joinedload(IncidentReport.project), joinedload(IncidentReport.responsible_user))
+        .get_or_404(incident_id)
+    )
 
-    # Crear PDF en memoria
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=2*cm, leftMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm)
-    styles = getSampleStyleSheet()
-    story = []
-
-    # Header
-    story.append(Paragraph(f"<b>Reporte de Incidencia #{incidencia.id}</b>", styles['Title']))
-    story.append(Spacer(1, 12))
-    story.append(Paragraph(f"<b>Proyecto:</b> {proyecto.name}", styles['Normal']))
-    story.append(Paragraph(f"<b>Fecha de reporte:</b> {incidencia.report_datetime.strftime('%d/%m/%Y %H:%M')}", styles['Normal']))
-    story.append(Spacer(1, 12))
-
-    # Información básica
-    data_info = [
-        ["Reportado por", incidencia.reporter_name],
-        ["Cargo", incidencia.reporter_role or "No especificado"],
-        ["Correo", incidencia.reporter_email],
-        ["Teléfono", incidencia.reporter_phone or "No especificado"],
-        ["Ubicación", incidencia.location],
-        ["Tipo de incidente", incidencia.incident_type],
-        ["Fecha y hora del incidente", incidencia.incident_datetime.strftime("%d/%m/%Y %H:%M")],
-    ]
-    table = Table(data_info, colWidths=[6*cm, 10*cm])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
-        ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
-        ('VALIGN', (0,0), (-1,-1), 'TOP'),
-        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-    ]))
-    story.append(table)
-    story.append(Spacer(1, 12))
-
-    # Descripción
-    story.append(Paragraph("<b>Descripción del incidente:</b>", styles['Heading3']))
-    story.append(Paragraph(incidencia.description, styles['Normal']))
-    story.append(Spacer(1, 12))
-
-    # Acciones
-    story.append(Paragraph("<b>Acciones correctivas inmediatas:</b>", styles['Heading3']))
-    story.append(Paragraph(incidencia.corrective_actions or "No registradas", styles['Normal']))
-    story.append(Spacer(1, 8))
-
-    story.append(Paragraph("<b>Causa raíz:</b>", styles['Heading3']))
-    story.append(Paragraph(incidencia.root_cause or "No determinada", styles['Normal']))
-    story.append(Spacer(1, 8))
-
-    story.append(Paragraph("<b>Acciones preventivas:</b>", styles['Heading3']))
-    story.append(Paragraph(incidencia.preventive_actions or "No registradas", styles['Normal']))
-    story.append(Spacer(1, 12))
-
-    # Seguimiento
-    story.append(Paragraph("<b>Seguimiento</b>", styles['Heading2']))
-    responsable = incidencia.responsible_user.nombre if incidencia.responsible_user else "No asignado"
-    cierre = incidencia.closure_date.strftime("%d/%m/%Y %H:%M") if incidencia.closure_date else "No cerrada"
-    data_seguimiento = [
-        ["Gravedad", incidencia.severity.capitalize()],
-        ["Estado", incidencia.status.capitalize()],
-        ["Responsable asignado", responsable],
-        ["Fecha de cierre", cierre],
-    ]
-    table2 = Table(data_seguimiento, colWidths=[6*cm, 10*cm])
-    table2.setStyle(TableStyle([
-        ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
-        ('VALIGN', (0,0), (-1,-1), 'TOP'),
-    ]))
-    story.append(table2)
-
-    # Generar PDF
-    doc.build(story)
-    buffer.seek(0)
+    # Se sirve desde la caché si esta versión de la incidencia ya se renderizó
+    path, version = incident_pdf_cache.get(incident_payload(incidencia))
 
     filename = f"incidencia_{incidencia.id}.pdf"
-    return send_file(buffer, as_attachment=True, download_name=filename, mimetype='application/pdf')
+    return send_download(path, download_name=filename, mimetype='application/pdf', etag=version)
 
 
 # Listar todos los reportes técnicos
 @admin_bp.route('/reportes', methods=['GET'])
 @login_required
+@requires(role='admin', redirect_to='editor.listar_reportes',
+          message="No tienes permiso para acceder a esta sección.")
 def ver_reportes():
-    if not current_user.has_role('admin'):
-        flash("No tienes permiso para acceder a esta sección.", "danger")
-        return redirect(url_for('editor.listar_reportes'))
-
-    reportes = TechnicalReport.query.order_by(TechnicalReport.report_date.desc()).all()
+    reportes = paginate_keyset(
+        TechnicalReport.query.options(joinedload(TechnicalReport.project)),
+        TechnicalReport.report_date, TechnicalReport.id,
+    )
+    total_reportes = TechnicalReport.query.count()
     proyectos = Project.query.all()
 
-    return render_template('admin/reportes.html', reportes=reportes, proyectos=proyectos)
+    return render_template('admin/reportes.html', reportes=reportes, total_reportes=total_reportes, proyectos=proyectos)
 
 
 # Ruta para ver las plantillas de configuración
@@ -425,8 +378,21 @@ def plantillas():
 @admin_bp.route('/flujos_aprobacion')
 @login_required
 def flujos_aprobacion():
-    flows = ApprovalFlow.query.order_by(ApprovalFlow.created_at.desc()).all()
-    completed_tasks = ProjectTask.query.filter_by(status='completada').all()
+    flows = (
+        ApprovalFlow.query
+        .options(
+            joinedload(ApprovalFlow.task).joinedload(ProjectTask.project),
+            joinedload(ApprovalFlow.responsible),
+        )
+        .order_by(ApprovalFlow.created_at.desc())
+        .all()
+    )
+    completed_tasks = (
+        ProjectTask.query
+        .options(joinedload(ProjectTask.project))
+        .filter_by(status='completada')
+        .all()
+    )
 
     # Solo usuarios con rol "editor"
     users = (
@@ -452,18 +418,7 @@ def nueva_plantilla():
     description = request.form.get('description')
     file = request.files.get('file')
 
-    if file:
-        upload_dir = os.path.join(current_app.root_path, 'static', 'uploads', 'plantillas')
-        os.makedirs(upload_dir, exist_ok=True)
-
-        filename = file.filename.replace(" ", "_")
-        file_path_abs = os.path.join(upload_dir, filename)
-
-        file.save(file_path_abs)
-
-        file_path = f"uploads/plantillas/{filename}"
-    else:
-        file_path = None
+    file_path = store_upload(file)
 
     new_template = ConfigTemplate(name=name, description=description, file_path=file_path)
     db.session.add(new_template)
@@ -501,37 +456,37 @@ def nuevo_flujo():
 def notificaciones():
     from app.models import SystemNotification
 
-    # Todas las notificaciones del usuario actual
-    notificaciones = (
-        SystemNotification.query
-        .filter_by(user_id=current_user.id)
-        .order_by(SystemNotification.created_at.desc())
-        .all()
+    # Notificaciones del usuario actual, de a una página
+    notificaciones = paginate_keyset(
+        SystemNotification.query.filter_by(user_id=current_user.id),
+        SystemNotification.created_at, SystemNotification.id,
     )
 
-    SystemNotification.query.filter_by(user_id=current_user.id, read=False).update({"read": True})
+    # Se separan de la sesión para que el commit no las expire y la plantilla no las recargue una a una
+    for n in notificaciones:
+        db.session.expunge(n)
+
+    mark_all_read(current_user.id)
     db.session.commit()
 
     return render_template('admin/notificaciones.html', notificaciones=notificaciones)
 
 
+# Contador de notificaciones no leídas (para refrescar la campana sin recargar)
+@admin_bp.route('/notificaciones/no_leidas')
+@login_required
+def notificaciones_no_leidas():
+    return jsonify(unread=unread_count(current_user.id))
+
+
 
 from sqlalchemy import func, case
 
 @admin_bp.route('/dashboard_control')
 @login_required
 def dashboard_control():
-    # --- KPIs principales ---
-    total_proyectos = Project.query.count()
-    proyectos_activos = Project.query.filter_by(status='activo').count()
-    proyectos_finalizados = Project.query.filter_by(status='finalizado').count()
-    proyectos_atrasados = Project.query.filter(Project.end_date < datetime.utcnow(), Project.status != 'finalizado').count()
-
-    progreso_promedio = db.session.query(func.avg(Project.progress)).scalar() or 0
-    tareas_completadas = ProjectTask.query.filter_by(status='completada').count()
-    reportes_tecnicos = TechnicalReport.query.count()
-    incidentes = IncidentReport.query.count()
-    proyectos = Project.query.with_entities(Project.name, Project.progress).all()
+    # --- KPIs principales (snapshot precalculado, ver app/services/kpis.py) ---
+    kpis = dashboard_kpis()
 
     # --- Desempeño por editor ---
     desempeño_editores = (
@@ -551,15 +506,15 @@ def dashboard_control():
 
     return render_template(
         'admin/dashboard_control.html',
-        total_proyectos=total_proyectos,
-        proyectos_activos=proyectos_activos,
-        proyectos_finalizados=proyectos_finalizados,
-        proyectos_atrasados=proyectos_atrasados,
-        progreso_promedio=round(progreso_promedio, 1),
-        tareas_completadas=tareas_completadas,
-        reportes_tecnicos=reportes_tecnicos,
-        incidentes=incidentes,
-        proyectos=proyectos,
+        total_proyectos=int(kpis['total_proyectos']),
+        proyectos_activos=int(kpis['proyectos_activos']),
+        proyectos_finalizados=int(kpis['proyectos_finalizados']),
+        proyectos_atrasados=int(kpis['proyectos_atrasados']),
+        progreso_promedio=round(kpis['progreso_promedio'], 1),
+        tareas_completadas=int(kpis['tareas_completadas']),
+        reportes_tecnicos=int(kpis['reportes_tecnicos']),
+        incidentes=int(kpis['incidentes']),
+        histograma_progreso=progress_histogram(kpis),
         desempeño_editores=desempeño_editores
     )
 
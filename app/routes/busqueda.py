@@ -0,0 +1,103 @@
+from flask import Blueprint, render_template, request, url_for
+from flask_login import current_user, login_required
+from app.services.permissions import get_permissions
+from app.services.search import SOURCES, search
+
+busqueda_bp = Blueprint('busqueda', __name__, url_prefix='/buscar')
+
+# Roles que ven todos los proyectos (igual que los paneles de admin y editor)
+ALL_PROJECTS_ROLES = ('admin', 'editor')
+
+KIND_LABELS = {
+    'proyecto': 'Proyecto',
+    'tarea': 'Tarea',
+    'reporte': 'Reporte técnico',
+    'incidencia': 'Incidencia',
+    'avance': 'Avance',
+    'comentario': 'Comentario',
+    'documento': 'Documento',
+    'adjunto': 'Adjunto de reporte',
+    'plantilla': 'Plantilla',
+}
+
+# Vista de destino de cada tipo de resultado según el panel del usuario. Cada rol solo
+# busca en los tipos de su tabla: los demás no tienen vista que se los muestre
+RESULT_LINKS = {
+    'admin': {
+        'proyecto': lambda r: url_for('admin.project_details', project_id=r['project_id']),
+        'tarea': lambda r: url_for('editor.task_comments', project_id=r['project_id'], task_id=r['task_id']),
+        'comentario': lambda r: url_for('editor.task_comments', project_id=r['project_id'], task_id=r['task_id'])
+        if r['task_id'] else None,
+        'reporte': lambda r: url_for('editor.ver_reporte', reporte_id=r['id']),
+        'incidencia': lambda r: url_for('admin.ver_incidencia', incident_id=r['id']),
+        'documento': lambda r: url_for('editor.view_documents', project_id=r['project_id']),
+        'adjunto': lambda r: url_for('editor.ver_reporte', reporte_id=r['id']),
+        'plantilla': lambda r: url_for('admin.plantillas'),
+    },
+    'editor': {
+        'proyecto': lambda r: url_for('editor.view_tasks', project_id=r['project_id']),
+        'tarea': lambda r: url_for('editor.task_comments', project_id=r['project_id'], task_id=r['task_id']),
+        'comentario': lambda r: url_for('editor.task_comments', project_id=r['project_id'], task_id=r['task_id'])
+        if r['task_id'] else None,
+        'reporte': lambda r: url_for('editor.ver_reporte', reporte_id=r['id']),
+        'avance': lambda r: url_for('editor.listar_avances', project_id=r['project_id']),
+        'documento': lambda r: url_for('editor.view_documents', project_id=r['project_id']),
+        'adjunto': lambda r: url_for('editor.ver_reporte', reporte_id=r['id']),
+        'plantilla': lambda r: url_for('editor.ver_plantillas'),
+    },
+    'miembro': {
+        'proyecto': lambda r: url_for('miembro.listar_avances', project_id=r['project_id']),
+        'tarea': lambda r: url_for('miembro.comentarios_tarea', tarea_id=r['task_id']),
+        'comentario': lambda r: url_for('miembro.comentarios_tarea', tarea_id=r['task_id']) if r['task_id'] else None,
+        'incidencia': lambda r: url_for('miembro.ver_incidencia_detalle', incident_id=r['id']),
+        'avance': lambda r: url_for('miembro.listar_avances', project_id=r['project_id']),
+    },
+    'lector': {
+        'proyecto': lambda r: url_for('lector.dashboard'),
+        'documento': lambda r: url_for('lector.view_documents', project_id=r['project_id']),
+    },
+    'invitado': {
+        'proyecto': lambda r: url_for('invitado.ver_proyecto', project_id=r['project_id']),
+        'avance': lambda r: url_for('invitado.listar_avances', project_id=r['project_id']),
+        'documento': lambda r: url_for('invitado.view_documents', project_id=r['project_id']),
+    },
+}
+
+
+def _panel(perms):
+    for role in ('admin', 'editor', 'miembro', 'lector'):
+        if perms.has_role(role):
+            return role
+    return 'invitado'
+
+
+def _result_url(result, links):
+    link = links.get(result['kind']) or links.get('proyecto')
+    return link(result) or links['proyecto'](result)
+
+
+# Búsqueda de texto completo en los proyectos a los que el usuario tiene acceso
+@busqueda_bp.route('')
+@login_required
+def buscar():
+    query = request.args.get('q', '').strip()
+    perms = get_permissions()
+    links = RESULT_LINKS[_panel(perms)]
+    kind = request.args.get('tipo')
+    kinds = {kind} if kind in links else set(links)
+
+    if perms.has_role(*ALL_PROJECTS_ROLES):
+        project_ids, owner_id = None, None
+    else:
+        # Como en sus paneles: tareas y comentarios de las tareas a su cargo, sus incidencias
+        project_ids, owner_id = perms.accessible_project_ids, current_user.id
+    results = search(query, project_ids=project_ids, kinds=kinds, owner_id=owner_id) if query else []
+
+    for result in results:
+        result['url'] = _result_url(result, links)
+        result['label'] = KIND_LABELS[result['kind']]
+
+    return render_template(
+        'buscar.html', query=query, kind=kind if kind in links else None, results=results,
+        kinds=[(s.kind, KIND_LABELS[s.kind]) for s in SOURCES if s.kind in links],
+    )
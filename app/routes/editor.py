@@ -1,15 +1,24 @@
 from asyncio import Task
 from datetime import datetime
-import os
 from zoneinfo import ZoneInfo
-from flask import Blueprint, abort, app, current_app, flash, redirect, render_template, send_from_directory, url_for
+from flask import Blueprint, abort, app, current_app, flash, redirect, render_template, url_for
 from flask_login import current_user, login_required
 from werkzeug.utils import secure_filename
 from app import db
 from app.forms import NuevoChecklistItemForm, ProgressForm
+from app.services.blob_store import is_blob, resolve_upload, store_upload, upload_name
+from app.services.chunked_upload import UploadError, receive_upload
+from app.services.comment_feed import feed_response, recent_comments
+from app.services.downloads import send_download
+from app.services.image_variants import image_variants
+from app.services.jobs import enqueue
+from app.services.notifications import notify
+from app.services.pagination import paginate_keyset
+from app.services.permissions import TASK_WATCHER_ROLES, get_permissions, requires
 from app.models import AdminUser, ApprovalFlow, Comment, ConfigTemplate, DailyChecklist, ProgressPhoto, Project, ProjectDocument, ProjectProgress, ProjectTask, ProjectUserRole, TechnicalReport
 from flask import request
 import pytz
+from sqlalchemy.orm import joinedload, selectinload
 
 ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'gif', 'dwg', 'dxf', 'zip'}
 
@@ -31,16 +40,17 @@ def editor_dashboard():
 def upload_document(project_id):
     project = Project.query.get_or_404(project_id)
     if request.method == 'POST':
-        file = request.files.get('file')
         description = request.form.get('description')
 
-        if file:
-            filename = secure_filename(file.filename)
-            file_path = os.path.join('app','static', 'uploads', filename) 
+        # Archivo subido por partes (upload_id) o en el mismo formulario
+        try:
+            upload = receive_upload(current_user.id)
+        except UploadError as error:
+            flash(error.message, 'danger')
+            return redirect(url_for('editor.upload_document', project_id=project.id))
 
-            # Crear el directorio si no existe
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            file.save(file_path)
+        if upload:
+            file_path, filename = upload
 
             # Crear el nuevo registro en la base de datos para el archivo subido
             document = ProjectDocument(
@@ -64,18 +74,18 @@ def upload_document(project_id):
 def view_documents(project_id):
     project = Project.query.get_or_404(project_id)
 
-    documents = ProjectDocument.query.filter_by(project_id=project.id).all()
+    documents = paginate_keyset(
+        ProjectDocument.query.filter_by(project_id=project.id),
+        ProjectDocument.upload_date, ProjectDocument.id,
+    )
 
     if request.method == 'POST':
         file = request.files.get('file')
         description = request.form.get('description')
 
-        if file:
+        if file and file.filename:
             filename = secure_filename(file.filename)
-            file_path = os.path.join('uploads', str(project.id), filename)
-
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            file.save(file_path)
+            file_path = store_upload(file)
 
             document = ProjectDocument(
                 project_id=project.id,
@@ -101,18 +111,19 @@ def edit_document(project_id, document_id):
     if request.method == 'POST':
         
         description = request.form.get('description')
-        file = request.files.get('file')
 
         # Actualizar solo la descripción si no se sube un nuevo archivo
         document.description = description
 
-        # Si se sube un nuevo archivo, reemplazar el anterior
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            file_path = os.path.join('app','static', 'uploads', filename)  
-            
-            file.save(file_path)
-                          
+        # Si se sube un nuevo archivo (por partes o en el formulario), reemplazar el anterior
+        try:
+            upload = receive_upload(current_user.id, allowed=allowed_file)
+        except UploadError as error:
+            flash(error.message, 'danger')
+            return redirect(url_for('editor.edit_document', project_id=project_id, document_id=document_id))
+
+        if upload:
+            file_path, filename = upload
             document.file_path = file_path
             document.file_name = filename
 
@@ -134,18 +145,13 @@ def download_document(project_id, document_id):
         flash('No tienes permiso para descargar este documento.', 'danger')
         return redirect(url_for('editor.view_documents', project_id=project_id))
 
-    # Recupera el nombre del archivo desde el path guardado
-    filename = os.path.basename(document.file_path) 
-
-    # Verificar si el archivo realmente existe
-    file_path = os.path.join(current_app.root_path, 'static', 'uploads', filename)
-    if not os.path.exists(file_path):
+    # Verificar si el archivo realmente existe (almacén de blobs o ruta antigua)
+    file_path = resolve_upload(current_app.static_folder, document.file_path)
+    if file_path is None:
         flash('El archivo no existe.', 'danger')
         return redirect(url_for('editor.view_documents', project_id=project_id))
 
-    return send_from_directory(
-        os.path.join(current_app.root_path, 'static', 'uploads'), filename, as_attachment=True
-    )
+    return send_download(file_path, download_name=document.file_name)
 
 # Ruta para ver las tareas del proyecto
 @editor_bp.route('/project/<int:project_id>/tasks')
@@ -154,7 +160,12 @@ def view_tasks(project_id):
     project = Project.query.get_or_404(project_id)
 
     # Obtener las tareas del proyecto
-    tasks = ProjectTask.query.filter_by(project_id=project.id).all()
+    tasks = (
+        ProjectTask.query
+        .options(joinedload(ProjectTask.responsible_user))
+        .filter_by(project_id=project.id)
+        .all()
+    )
 
     return render_template('editor/view_tasks.html', project=project, tasks=tasks)
 
@@ -248,24 +259,20 @@ def delete_task(project_id, task_id):
 # Listar los ítems del checklist de un proyecto
 @editor_bp.route('/proyecto/<int:project_id>/checklist')
 @login_required
+@requires(role='editor')
 def checklist_items(project_id):
     project = Project.query.get_or_404(project_id)
 
-    if not current_user.has_role("editor"):
-        abort(403)
-
     items = DailyChecklist.query.filter_by(project_id=project.id).all()
     return render_template("editor/checklist_items.html", project=project, items=items)
 
 # Agregar nuevo ítem al checklist
 @editor_bp.route('/proyecto/<int:project_id>/checklist/nuevo', methods=['GET', 'POST'])
 @login_required
+@requires(role='editor')
 def nuevo_checklist_item(project_id):
     project = Project.query.get_or_404(project_id)
 
-    if not current_user.has_role("editor"):
-        abort(403)
-
     form = NuevoChecklistItemForm()
 
     if form.validate_on_submit():
@@ -288,13 +295,11 @@ def nuevo_checklist_item(project_id):
 # Desactivar o activar ítem
 @editor_bp.route('/proyecto/<int:project_id>/checklist/<int:item_id>/toggle')
 @login_required
+@requires(role='editor')
 def toggle_checklist_item(project_id, item_id):
     project = Project.query.get_or_404(project_id)
     item = DailyChecklist.query.get_or_404(item_id)
 
-    if not current_user.has_role("editor"):
-        abort(403)
-
     item.is_active = not item.is_active
     db.session.commit()
     flash("Estado del ítem actualizado ", "info")
@@ -304,10 +309,8 @@ def toggle_checklist_item(project_id, item_id):
 # Listar avances de todos los proyectos
 @editor_bp.route('/avances/proyectos')
 @login_required
+@requires(role='editor')
 def listar_proyectos():
-    if not current_user.has_role("editor"):
-        abort(403)
-
     proyectos = Project.query.all() 
     return render_template("editor/avance_obra.html", proyectos=proyectos)
 
@@ -315,22 +318,23 @@ def listar_proyectos():
 # Listar avances de un proyecto específico
 @editor_bp.route('/avances/proyecto/<int:project_id>')
 @login_required
+@requires(role='editor')
 def listar_avances(project_id):
-    if not current_user.has_role("editor"):
-        abort(403)
-
     project = Project.query.get_or_404(project_id)
-    avances = ProjectProgress.query.filter_by(project_id=project.id).order_by(ProjectProgress.date.desc()).all()
+    avances = paginate_keyset(
+        ProjectProgress.query
+        .options(joinedload(ProjectProgress.user), selectinload(ProjectProgress.photos))
+        .filter_by(project_id=project.id),
+        ProjectProgress.date, ProjectProgress.id,
+    )
     return render_template("editor/avances.html", project=project, avances=avances)
 
 
 # Registrar avance en cualquier proyecto
 @editor_bp.route('/avances/proyecto/<int:project_id>/nuevo', methods=['GET', 'POST'])
 @login_required
+@requires(role='editor')
 def nuevo_avance(project_id):
-    if not current_user.has_role("editor"):
-        abort(403)
-
     project = Project.query.get_or_404(project_id)
     form = ProgressForm()
 
@@ -347,39 +351,45 @@ def nuevo_avance(project_id):
             date=ahora_chile   # 👈 aquí se guarda la hora local
         )
         db.session.add(avance)
-        db.session.commit()
+        db.session.flush()
 
         # Guardar fotos
+        photo_paths = []
         if form.photos.data:
-            upload_folder = os.path.join(current_app.root_path, "static/uploads")
-            os.makedirs(upload_folder, exist_ok=True)
-
             for photo in form.photos.data:
-                if photo:
-                    filename = secure_filename(photo.filename)
-                    file_path = os.path.join(upload_folder, filename)
-                    photo.save(file_path)
-
+                file_path = store_upload(photo)
+                if file_path:
                     foto = ProgressPhoto(
                         progress_id=avance.id,
-                        file_path=f"uploads/{filename}"
+                        file_path=file_path
                     )
                     db.session.add(foto)
+                    photo_paths.append(file_path)
 
+        # Miniaturas y WebP en la cola, en la misma transacción que el avance y sus fotos
+        image_variants.schedule(*photo_paths)
         db.session.commit()
         flash("Avance registrado correctamente ✅", "success")
         return redirect(url_for('editor.listar_avances', project_id=project.id))
 
     return render_template("editor/nuevo_avance.html", form=form, project=project)
 
+def _task_or_404(project_id, task_id, *options):
+    """Tarea del proyecto de la URL; admin y editor ven todas, el resto solo las suyas."""
+    task = db.get_or_404(ProjectTask, task_id, options=options)
+    if task.project_id != project_id:
+        abort(404)
+    if not get_permissions().has_role(*TASK_WATCHER_ROLES) and task.responsible_user_id != current_user.id:
+        abort(403, description="No tienes permiso para acceder a esta tarea.")
+    return task
+
+
 # Ruta para ver y agregar comentarios a una tarea
 @editor_bp.route('/project/<int:project_id>/task/<int:task_id>/comments', methods=['GET', 'POST'])
 @login_required
 def task_comments(project_id, task_id):
-    from sqlalchemy import select
-
-    project = Project.query.get_or_404(project_id)
-    task = ProjectTask.query.get_or_404(task_id)
+    task = _task_or_404(project_id, task_id, joinedload(ProjectTask.project))
+    project = task.project
 
     if request.method == 'POST':
         content = request.form.get('content')
@@ -399,20 +409,32 @@ def task_comments(project_id, task_id):
         flash("Comentario agregado correctamente.", "success")
         return redirect(url_for('editor.task_comments', project_id=project.id, task_id=task.id))
 
-    stmt = select(Comment).where(Comment.task_id == task.id).order_by(Comment.created_at.asc())
-    comments = db.session.execute(stmt).scalars().all()
+    # Últimos comentarios; la página pide los nuevos (y los anteriores) a task_comments_feed
+    comments, has_older = recent_comments(task.id)
 
-    if request.args.get("ajax"):
-        return render_template('editor/_comments_partial.html', comments=comments)
+    return render_template('editor/task_comments.html', project=project, task=task,
+                           comments=comments, has_older=has_older)
 
-    return render_template('editor/task_comments.html', project=project, task=task, comments=comments)
+
+# Comentarios más nuevos (?after=id, 304 si no hay) o anteriores (?before=id) de una tarea
+@editor_bp.route('/project/<int:project_id>/task/<int:task_id>/comments/feed')
+@login_required
+def task_comments_feed(project_id, task_id):
+    _task_or_404(project_id, task_id)
+    return feed_response(task_id, 'editor/_comments_partial.html', 'comments')
 
 
 
 @editor_bp.route('/reportes')
 @login_required
 def listar_reportes():
-    reportes = TechnicalReport.query.filter_by(user_id=current_user.id).order_by(TechnicalReport.created_at.desc()).all()
+    reportes = (
+        TechnicalReport.query
+        .options(joinedload(TechnicalReport.project))
+        .filter_by(user_id=current_user.id)
+        .order_by(TechnicalReport.created_at.desc())
+        .all()
+    )
     return render_template('editor/listar_reportes.html', reportes=reportes)
 
 
@@ -455,24 +477,10 @@ def nuevo_reporte():
         archivo = request.files.get('attachment')
 
         # --- Manejo de archivos adjuntos ---
-        attachment_path = None
-        if archivo and archivo.filename:
-            filename = secure_filename(archivo.filename)
-            upload_folder = os.path.join(current_app.root_path, 'static', 'uploads', 'reportes')
-            os.makedirs(upload_folder, exist_ok=True)
-            path = os.path.join(upload_folder, filename)
-            archivo.save(path)
-            attachment_path = f'uploads/reportes/{filename}'
+        attachment_path = store_upload(archivo)
 
         # --- Manejo de fotos de evidencia ---
-        evidence_photo_path = None
-        if evidence_photo and evidence_photo.filename:
-            photo_filename = secure_filename(evidence_photo.filename)
-            photo_folder = os.path.join(current_app.root_path, 'static', 'uploads', 'reportes')
-            os.makedirs(photo_folder, exist_ok=True)
-            photo_path = os.path.join(photo_folder, photo_filename)
-            evidence_photo.save(photo_path)
-            evidence_photo_path = f'uploads/reportes/{photo_filename}'
+        evidence_photo_path = store_upload(evidence_photo)
 
         # --- Crear el reporte ---
         reporte = TechnicalReport(
@@ -482,6 +490,7 @@ def nuevo_reporte():
             user_id=current_user.id,
             created_at=ahora_chile,
             attachment_path=attachment_path,
+            attachment_name=upload_name(archivo),
             inspector=inspector,
             report_date=datetime.strptime(report_date, "%Y-%m-%d") if report_date else None,
             period=period,
@@ -523,16 +532,11 @@ def descargar_reporte_archivo(reporte_id):
         flash('Este reporte no tiene archivo adjunto.', 'warning')
         return redirect(url_for('editor.ver_reporte', reporte_id=reporte.id))
 
-    upload_folder = os.path.join(current_app.root_path, 'static')
-    file_path = os.path.join(upload_folder, reporte.attachment_path)
-
-    if not os.path.exists(file_path):
-        abort(404, description=f"Archivo no encontrado: {file_path}")
-
-    directory = os.path.dirname(file_path)
-    filename = os.path.basename(file_path)
+    file_path = resolve_upload(current_app.static_folder, reporte.attachment_path)
+    if file_path is None:
+        abort(404, description=f"Archivo no encontrado: {reporte.attachment_path}")
 
-    return send_from_directory(directory, filename, as_attachment=True)
+    return send_download(file_path, download_name=reporte.attachment_name)
 
 
 @editor_bp.route('/reportes/editar/<int:reporte_id>', methods=['GET', 'POST'])
@@ -572,22 +576,13 @@ def editar_reporte(reporte_id):
         # ✅ Imagen de evidencia (si se reemplaza)
         evidence_photo = request.files.get('evidence_photos')
         if evidence_photo and evidence_photo.filename:
-            filename = secure_filename(evidence_photo.filename)
-            upload_folder = os.path.join(current_app.root_path, 'static', 'uploads', 'fotos')
-            os.makedirs(upload_folder, exist_ok=True)
-            file_path = os.path.join(upload_folder, filename)
-            evidence_photo.save(file_path)
-            reporte.evidence_photos = f'uploads/fotos/{filename}'
+            reporte.evidence_photos = store_upload(evidence_photo)
 
         # ✅ Documento adjunto (si se reemplaza)
         archivo = request.files.get('attachment')
         if archivo and archivo.filename:
-            filename = secure_filename(archivo.filename)
-            upload_folder = os.path.join(current_app.root_path, 'static', 'uploads', 'reportes')
-            os.makedirs(upload_folder, exist_ok=True)
-            file_path = os.path.join(upload_folder, filename)
-            archivo.save(file_path)
-            reporte.attachment_path = f'uploads/reportes/{filename}'
+            reporte.attachment_path = store_upload(archivo)
+            reporte.attachment_name = upload_name(archivo)
 
         # ✅ Guardar cambios
         try:
@@ -607,10 +602,11 @@ def editar_reporte(reporte_id):
 def eliminar_reporte(reporte_id):
     reporte = TechnicalReport.query.get_or_404(reporte_id)
 
-    if reporte.attachment_path:
-        file_path = os.path.join(current_app.root_path, 'static', reporte.attachment_path)
-        if os.path.exists(file_path):
-            os.remove(file_path)
+    # Los archivos del almacén pueden estar compartidos: los borra `flask blobs gc`
+    # cuando ya nadie los usa. Uno anterior al almacén se borra en la cola, y solo si
+    # el borrado del reporte llega a hacer commit
+    if reporte.attachment_path and not is_blob(reporte.attachment_path):
+        enqueue('archivos.borrar', {'path': reporte.attachment_path}, key=f'archivos.borrar:{reporte.attachment_path}')
 
     # Borramos el registro de la base de datos
     db.session.delete(reporte)
@@ -656,11 +652,8 @@ def actualizar_flujo(flow_id):
     # Actualizar estado del flujo
     flow.status = nuevo_estado
     flow.reviewed_at = datetime.utcnow()
-    db.session.commit()
 
     # ✅ Crear notificación para el administrador o creador del proyecto
-    from app.models import SystemNotification
-
     # Definir destinatario: el creador del proyecto
     admin_id = flow.task.project.creator_id if flow.task and flow.task.project else None
 
@@ -670,14 +663,9 @@ def actualizar_flujo(flow_id):
             f"El editor {current_user.nombre} ha marcado como "
             f"'{nuevo_estado}' la tarea '{flow.task.name}' del proyecto '{flow.task.project.name}'."
         )
+        notify(admin_id, titulo, mensaje)
 
-        noti = SystemNotification(
-            title=titulo,
-            message=mensaje,
-            user_id=admin_id
-        )
-        db.session.add(noti)
-        db.session.commit()
+    db.session.commit()
 
     flash(f"✅ Flujo '{flow.name}' marcado como {nuevo_estado}.", "success")
     return redirect(url_for('editor.flujos_asignados'))
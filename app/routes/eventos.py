@@ -0,0 +1,42 @@
+from flask import Blueprint, Response, request
+from flask_login import current_user, login_required
+from sqlalchemy import select
+from app import db
+from app.models import ProjectTask
+from app.services.events import event_bus, task_channel, user_channel
+from app.services.permissions import TASK_WATCHER_ROLES, get_permissions
+
+eventos_bp = Blueprint('eventos', __name__, url_prefix='/eventos')
+
+
+def _task_channels(task_ids):
+    """Canales task:<id> que el usuario actual puede escuchar."""
+    if not task_ids:
+        return []
+    if get_permissions().has_role(*TASK_WATCHER_ROLES):
+        allowed = task_ids
+    else:
+        # El miembro solo sigue las tareas de las que es responsable
+        allowed = db.session.scalars(
+            select(ProjectTask.id)
+            .where(ProjectTask.id.in_(task_ids), ProjectTask.responsible_user_id == current_user.id)
+        ).all()
+    return [task_channel(task_id) for task_id in allowed]
+
+
+# Stream SSE del usuario: sus notificaciones, flujos y tareas, más las tareas de ?tasks=1,2
+@eventos_bp.route('/stream')
+@login_required
+def stream():
+    task_ids = [int(t) for t in request.args.get('tasks', '').split(',') if t.isdigit()]
+    channels = [user_channel(current_user.id)] + _task_channels(task_ids)
+
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    if last_event_id is None:
+        last_event_id = request.args.get('last_event_id', type=int)
+
+    return Response(
+        event_bus.stream(channels, last_event_id),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
@@ -1,52 +1,51 @@
-from flask import abort, request
+from flask import request
 from app.models import Project
 from flask import Blueprint, render_template
 from flask_login import login_required, current_user
-from app.models import ProjectUserRole, ProjectTask, ProjectDocument, ProjectProgress
+from app.models import ProjectDocument, ProjectProgress
 from datetime import datetime    
 import os
 from werkzeug.utils import secure_filename
 from app import db
+from sqlalchemy.orm import joinedload, selectinload
+from app.services.blob_store import store_upload
+from app.services.chunked_upload import UploadError, receive_upload
+from app.services.permissions import get_permissions, requires
+from app.services.project_metrics import project_metrics
 from flask import flash, redirect, url_for
 
 # Crear blueprint para 'invitado'
 invitado_bp = Blueprint('invitado', __name__, url_prefix='/invitado')
 
+# Nombres de rol de proyecto que dan acceso de invitado
+GUEST_ROLES = ('invitado', 'guest')
+
 @invitado_bp.route('/dashboard')
 @login_required
 def dashboard_invitado():
     """Panel del invitado: lista todos los proyectos asignados con métricas básicas."""
 
-    relaciones = ProjectUserRole.query.filter_by(user_id=current_user.id).all()
-    relaciones_validas = [
-        rel for rel in relaciones if rel.role.name.lower() in ('invitado', 'guest')
-    ]
+    project_ids = get_permissions().project_ids_with_role(*GUEST_ROLES)
 
     # Si no tiene proyectos asignados
-    if not relaciones_validas:
+    if not project_ids:
         return render_template('invitado/dashboard_invitado.html', no_projects=True)
 
-    # Crear lista con métricas por proyecto
-    proyectos_data = []
-    for rel in relaciones_validas:
-        proyecto = rel.project
-
-        tareas_total = ProjectTask.query.filter_by(project_id=proyecto.id).count()
-        tareas_completadas = ProjectTask.query.filter_by(project_id=proyecto.id, status='completada').count()
-        tareas_pendientes = tareas_total - tareas_completadas
-
-        progreso = proyecto.progress or 0
-        documentos_total = ProjectDocument.query.filter_by(project_id=proyecto.id).count()
-        ultimo_avance = ProjectProgress.query.filter_by(project_id=proyecto.id).order_by(ProjectProgress.date.desc()).first()
+    # Crear lista con métricas por proyecto (una consulta para todos)
+    proyectos = Project.query.filter(Project.id.in_(project_ids)).all()
+    metricas = project_metrics(project_ids)
 
+    proyectos_data = []
+    for proyecto in proyectos:
+        m = metricas[proyecto.id]
         proyectos_data.append({
             "proyecto": proyecto,
-            "progreso": progreso,
-            "tareas_total": tareas_total,
-            "tareas_completadas": tareas_completadas,
-            "tareas_pendientes": tareas_pendientes,
-            "documentos_total": documentos_total,
-            "ultimo_avance": ultimo_avance.date.strftime('%d/%m/%Y') if ultimo_avance else "—"
+            "progreso": proyecto.progress or 0,
+            "tareas_total": m["tareas_total"],
+            "tareas_completadas": m["tareas_completadas"],
+            "tareas_pendientes": m["tareas_pendientes"],
+            "documentos_total": m["documentos_total"],
+            "ultimo_avance": m["ultimo_avance"].strftime('%d/%m/%Y') if m["ultimo_avance"] else "—"
         })
 
     return render_template(
@@ -55,32 +54,43 @@ def dashboard_invitado():
         proyectos_data=proyectos_data
     )
 
+# Seguridad: si el usuario no está asignado como invitado a este proyecto, vuelve al panel
 @invitado_bp.route('/proyecto/<int:project_id>')
 @login_required
+@requires(project_role=GUEST_ROLES, redirect_to='invitado.dashboard_invitado',
+          message='No tienes acceso a este proyecto.')
 def ver_proyecto(project_id):
     """Detalle del proyecto específico al que el invitado tiene acceso."""
-    rel = ProjectUserRole.query.filter_by(user_id=current_user.id, project_id=project_id).first()
-
-    # Seguridad: si el usuario no está asignado como invitado a este proyecto, mostramos mensaje
-    if not rel or rel.role.name.lower() not in ('invitado', 'guest'):
-        return render_template('invitado/dashboard_invitado.html', no_projects=True)
-
-    proyecto = rel.project
+    proyecto = Project.query.get_or_404(project_id)
 
     # Consultas a la BD
-    tareas_total = ProjectTask.query.filter_by(project_id=proyecto.id).count()
-    tareas_completadas = ProjectTask.query.filter_by(project_id=proyecto.id, status='completada').count()
-    tareas_pendientes = tareas_total - tareas_completadas
+    m = project_metrics([proyecto.id])[proyecto.id]
+    tareas_total = m['tareas_total']
+    tareas_completadas = m['tareas_completadas']
+    tareas_pendientes = m['tareas_pendientes']
 
     progreso = proyecto.progress or 0
-    documentos_total = ProjectDocument.query.filter_by(project_id=proyecto.id).count()
+    documentos_total = m['documentos_total']
     documentos = ProjectDocument.query.filter_by(project_id=proyecto.id).order_by(ProjectDocument.upload_date.desc()).limit(5).all()
 
-    ultimos_avances = ProjectProgress.query.filter_by(project_id=proyecto.id).order_by(ProjectProgress.date.desc()).limit(10).all()
+    ultimos_avances = (
+        ProjectProgress.query
+        .options(joinedload(ProjectProgress.user))
+        .filter_by(project_id=proyecto.id)
+        .order_by(ProjectProgress.date.desc())
+        .limit(10)
+        .all()
+    )
 
-    # Gráfico de progreso en el tiempo
-    avances = ProjectProgress.query.filter_by(project_id=proyecto.id).order_by(ProjectProgress.date.asc()).all()
-    fechas = [a.date.strftime('%d/%m') for a in avances]
+    # Gráfico de progreso en el tiempo: solo las fechas, sin cargar cada avance
+    fechas = [
+        fecha.strftime('%d/%m')
+        for fecha in db.session.scalars(
+            db.select(ProjectProgress.date)
+            .where(ProjectProgress.project_id == proyecto.id)
+            .order_by(ProjectProgress.date.asc())
+        )
+    ]
     progreso_por_fecha = list(range(1, len(fechas) + 1))
 
     return render_template(
@@ -104,19 +114,21 @@ def ver_proyecto(project_id):
 # Ruta para subir un documento
 @invitado_bp.route('/project/<int:project_id>/upload_document', methods=['GET', 'POST'])
 @login_required
+@requires(project_role=GUEST_ROLES)
 def upload_document(project_id):
     project = Project.query.get_or_404(project_id)
     if request.method == 'POST':
-        file = request.files.get('file')
         description = request.form.get('description')
 
-        if file:
-            filename = secure_filename(file.filename)
-            file_path = os.path.join('app','static', 'uploads', filename) 
+        # Archivo subido por partes (upload_id) o en el mismo formulario
+        try:
+            upload = receive_upload(current_user.id)
+        except UploadError as error:
+            flash(error.message, 'danger')
+            return redirect(url_for('invitado.upload_document', project_id=project.id))
 
-            # Crear el directorio si no existe
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            file.save(file_path)
+        if upload:
+            file_path, filename = upload
 
             # Crear el nuevo registro en la base de datos para el archivo subido
             document = ProjectDocument(
@@ -137,6 +149,7 @@ def upload_document(project_id):
 # Ruta para ver los documentos del proyecto
 @invitado_bp.route('/project/<int:project_id>/documents', methods=['GET', 'POST'])
 @login_required
+@requires(project_role=GUEST_ROLES)
 def view_documents(project_id):
     project = Project.query.get_or_404(project_id)
 
@@ -146,12 +159,9 @@ def view_documents(project_id):
         file = request.files.get('file')
         description = request.form.get('description')
 
-        if file:
+        if file and file.filename:
             filename = secure_filename(file.filename)
-            file_path = os.path.join('uploads', str(project.id), filename)
-
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            file.save(file_path)
+            file_path = store_upload(file)
 
             document = ProjectDocument(
                 project_id=project.id,
@@ -172,7 +182,8 @@ def view_documents(project_id):
 @invitado_bp.route('/documentos')
 @login_required
 def documentos_invitado():
-    projects = Project.query.all()  
+    project_ids = get_permissions().project_ids_with_role(*GUEST_ROLES)
+    projects = Project.query.filter(Project.id.in_(project_ids)).all()
     return render_template('invitado/documentos.html', projects=projects)
 
 
@@ -180,21 +191,24 @@ def documentos_invitado():
 # Listar avances de todos los proyectos
 @invitado_bp.route('/avances/proyectos')
 @login_required
+@requires(role='invitado')
 def listar_proyectos():
-    if not current_user.has_role("invitado"):
-        abort(403)
-
-    proyectos = Project.query.all() 
+    project_ids = get_permissions().project_ids_with_role(*GUEST_ROLES)
+    proyectos = Project.query.filter(Project.id.in_(project_ids)).all()
     return render_template("invitado/avance_obra.html", proyectos=proyectos)
 
 
 # Listar avances de un proyecto específico
 @invitado_bp.route('/avances/proyecto/<int:project_id>')
 @login_required
+@requires(role='invitado', project_role=GUEST_ROLES)
 def listar_avances(project_id):
-    if not current_user.has_role("invitado"):
-        abort(403)
-
     project = Project.query.get_or_404(project_id)
-    avances = ProjectProgress.query.filter_by(project_id=project.id).order_by(ProjectProgress.date.desc()).all()
+    avances = (
+        ProjectProgress.query
+        .options(joinedload(ProjectProgress.user), selectinload(ProjectProgress.photos))
+        .filter_by(project_id=project.id)
+        .order_by(ProjectProgress.date.desc())
+        .all()
+    )
     return render_template("invitado/avances.html", project=project, avances=avances)
@@ -1,8 +1,11 @@
 from flask import Blueprint, render_template
 from flask_login import login_required
-from sqlalchemy import func, and_
 from app.models import Project, ProjectDocument, ProjectProgress, TechnicalReport
 from app import db
+from app.services.blob_store import store_upload
+from app.services.permissions import requires
+from app.services.project_metrics import project_metrics
+from app.services.query_helpers import top_n_per_group
 from flask import request, redirect, url_for, flash
 from flask_login import current_user
 import os
@@ -12,12 +15,17 @@ from werkzeug.utils import secure_filename
 # Crear blueprint para 'lector'
 lector_bp = Blueprint('lector', __name__, url_prefix='/lector')
 
+# El lector ve todos los proyectos; el admin también puede entrar a sus vistas
+READER_ROLES = ('lector', 'admin')
+
 @lector_bp.route('/')
 def inicio():
     return redirect(url_for('lector.dashboard'))
 
 # Ruta de inicio para el lector
 @lector_bp.route('/documentos')
+@login_required
+@requires(role=READER_ROLES)
 def lector_documentos():
     projects = Project.query.all()  
     return render_template('lector/inicio.html', projects=projects)
@@ -27,6 +35,7 @@ def lector_documentos():
 # Ruta para ver los documentos del proyecto
 @lector_bp.route('/project/<int:project_id>/documents', methods=['GET', 'POST'])
 @login_required
+@requires(role=READER_ROLES)
 def view_documents(project_id):
     project = Project.query.get_or_404(project_id)
 
@@ -36,12 +45,9 @@ def view_documents(project_id):
         file = request.files.get('file')
         description = request.form.get('description')
 
-        if file:
+        if file and file.filename:
             filename = secure_filename(file.filename)
-            file_path = os.path.join('uploads', str(project.id), filename)
-
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            file.save(file_path)
+            file_path = store_upload(file)
 
             document = ProjectDocument(
                 project_id=project.id,
@@ -62,49 +68,30 @@ def view_documents(project_id):
 # Ruta para el dashboard del lector
 @lector_bp.route('/dashboard')
 @login_required
+@requires(role=READER_ROLES)
 def dashboard():
     proyectos = Project.query.filter_by(archived=False).all()
 
-    # Subquery para obtener la FECHA más reciente de avance por proyecto
-    sub = (
-        db.session.query(
-            ProjectProgress.project_id,
-            func.max(ProjectProgress.date).label('max_date')
-        )
-        .group_by(ProjectProgress.project_id)
-        .subquery()
+    # Los 3 avances más recientes de cada proyecto (con sus fotos) en una sola consulta;
+    # el primero de cada lista es el último avance
+    recientes_por_proyecto = top_n_per_group(
+        ProjectProgress,
+        ProjectProgress.project_id,
+        (ProjectProgress.date.desc(), ProjectProgress.id.desc()),
+        3,
+        ProjectProgress.project_id.in_([p.id for p in proyectos]),
+        load=('photos',),
     )
 
-    # Avance más reciente por proyecto
-    ultimos_avances = (
-        db.session.query(ProjectProgress)
-        .join(
-            sub,
-            and_(
-                ProjectProgress.project_id == sub.c.project_id,
-                ProjectProgress.date == sub.c.max_date,
-            ),
-        )
-        .all()
-    )
-    ultimo_por_proyecto = {a.project_id: a for a in ultimos_avances}
-
-    # Obtener los 3 avances más recientes por proyecto
-    recientes_por_proyecto = {}
-    for p in proyectos:
-        recent = (
-            ProjectProgress.query
-            .filter_by(project_id=p.id)
-            .order_by(ProjectProgress.date.desc())
-            .limit(3)
-            .all()
-        )
-        recientes_por_proyecto[p.id] = recent
+    # Tareas y documentos de todos los proyectos en una sola consulta
+    metricas = project_metrics(p.id for p in proyectos)
 
     # Construir resumenes para el dashboard
     resumenes = []
     for p in proyectos:
-        ultimo = ultimo_por_proyecto.get(p.id)
+        recientes = recientes_por_proyecto.get(p.id, [])
+        ultimo = recientes[0] if recientes else None
+        m = metricas.get(p.id, {})
         resumenes.append({
             "id": p.id,
             "nombre": p.name,
@@ -115,7 +102,10 @@ def dashboard():
             "presupuesto_file": p.budget_file,
             "ultimo_avance_desc": ultimo.description if ultimo else "Sin avances",
             "ultimo_avance_fecha": ultimo.date if ultimo else None,
-            "recientes": recientes_por_proyecto.get(p.id, []),  
+            "recientes": recientes,
+            "tareas_total": m.get("tareas_total", 0),
+            "tareas_completadas": m.get("tareas_completadas", 0),
+            "documentos_total": m.get("documentos_total", 0),
         })
 
     return render_template('lector/dashboard.html', resumenes=resumenes)
\ No newline at end of file
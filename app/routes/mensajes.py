@@ -3,6 +3,8 @@ from flask import render_template
 from flask_login import login_required
 from app.models import ContactMessage
 from app import db
+from app.services.pagination import paginate_keyset
+from sqlalchemy import case, func
 from flask import redirect, url_for, flash
 
 mensajero_bp = Blueprint('mensajero', __name__, url_prefix='/mensajero')
@@ -11,8 +13,13 @@ mensajero_bp = Blueprint('mensajero', __name__, url_prefix='/mensajero')
 @mensajero_bp.route("/")
 @login_required
 def dashboard():
-    mensajes = ContactMessage.query.order_by(ContactMessage.fecha.desc()).all()
-    return render_template("admin/inicio.html", mensajes=mensajes)
+    mensajes = paginate_keyset(ContactMessage.query, ContactMessage.fecha, ContactMessage.id)
+    # Totales de todos los mensajes, no solo de la página
+    totales = db.session.query(
+        func.count().label('total'),
+        func.coalesce(func.sum(case((ContactMessage.leido.is_(True), 1), else_=0)), 0).label('leidos'),
+    ).select_from(ContactMessage).one()
+    return render_template("admin/inicio.html", mensajes=mensajes, totales=totales)
 
 # Ruta para marcar un mensaje como leído/no leído
 @mensajero_bp.route("/mensaje/<int:id>/toggle", methods=["POST"])
@@ -1,39 +1,43 @@
 from datetime import datetime
 import os
-from flask import Blueprint, abort, current_app, flash, redirect, render_template, url_for
+from flask import Blueprint, abort, flash, redirect, render_template, url_for
 from flask_login import current_user, login_required
 from app import db
-from app.models import IncidentReport, Project, ProjectTask, ProjectUserRole
+from app.models import IncidentReport, Project, ProjectTask
 from flask import request
 from app.models import ProjectProgress, ProgressPhoto, DailyChecklist, ChecklistCompletion
 from app.forms import IncidentReportForm, ProgressForm, ChecklistForm
-from werkzeug.utils import secure_filename
 from app.models import Comment
+from app.services.blob_store import store_upload, upload_name
+from app.services.checklist import checklist_today, save_checklist
+from app.services.permissions import get_permissions, requires
+from app.services.image_variants import image_variants
+from app.services.comment_feed import feed_response, recent_comments
+from app.services.pagination import paginate_keyset
+from sqlalchemy.orm import joinedload, selectinload
 from datetime import datetime
 import pytz
 
 # Crear blueprint para 'miembro'
 miembro_bp = Blueprint('miembro', __name__, url_prefix='/miembro')
 
+# Roles de proyecto que pueden registrar avances, checklist e incidencias
+MEMBER_ROLES = ('miembro',)
+
+# Solo permitir a usuarios con rol 'miembro'
 @miembro_bp.route('/')
 @login_required
+@requires(role='miembro', redirect_to='main.index',
+          message='Acceso denegado. Solo los miembros pueden ver este panel.')
 def miembro_dashboard():
-    # Solo permitir a usuarios con rol 'miembro'
-    if not any(role.name == 'miembro' for role in current_user.roles):
-        flash('Acceso denegado. Solo los miembros pueden ver este panel.', 'danger')
-        return redirect(url_for('main.index'))
-
     return redirect(url_for('miembro.tareas_asignadas'))
 
 
 @miembro_bp.route('/tareas')
 @login_required
+@requires(role='miembro', redirect_to='main.index',
+          message='Acceso denegado. Solo los miembros pueden ver sus tareas.')
 def tareas_asignadas():
-    # Verifica si el usuario tiene rol de miembro
-    if not any(role.name == 'miembro' for role in current_user.roles):
-        flash('Acceso denegado. Solo los miembros pueden ver sus tareas.', 'danger')
-        return redirect(url_for('main.index'))
-
     # Obtener tareas asignadas al usuario
     tareas = (
         db.session.query(ProjectTask)
@@ -75,13 +79,16 @@ def actualizar_estado_tarea(tarea_id):
 # Ruta para ver avances de un proyecto
 @miembro_bp.route('/proyecto/<int:project_id>/avances')
 @login_required
+@requires(project_role=MEMBER_ROLES)
 def listar_avances(project_id):
     from flask_login import current_user
 
     project = Project.query.get_or_404(project_id)
 
     # Mostrar solo los avances del usuario actual
-    avances = ProjectProgress.query.filter_by(
+    avances = ProjectProgress.query.options(
+        joinedload(ProjectProgress.user), selectinload(ProjectProgress.photos)
+    ).filter_by(
         project_id=project_id,
         user_id=current_user.id
     ).order_by(ProjectProgress.date.desc()).all()
@@ -98,6 +105,7 @@ import pytz
 # Ruta para registrar avance
 @miembro_bp.route('/proyecto/<int:project_id>/avances/nuevo', methods=['GET', 'POST'])
 @login_required
+@requires(project_role=MEMBER_ROLES)
 def nuevo_avance(project_id):
     project = Project.query.get_or_404(project_id)
     form = ProgressForm()
@@ -115,25 +123,23 @@ def nuevo_avance(project_id):
             date=ahora_chile   # 👈 aquí se guarda la hora local
         )
         db.session.add(avance)
-        db.session.commit()
+        db.session.flush()
 
         # Guardar fotos
+        photo_paths = []
         if form.photos.data:
-            upload_folder = os.path.join(current_app.root_path, "static/uploads")
-            os.makedirs(upload_folder, exist_ok=True)
-
             for photo in form.photos.data:
-                if photo:
-                    filename = secure_filename(photo.filename)
-                    file_path = os.path.join(upload_folder, filename)
-                    photo.save(file_path)
-
+                file_path = store_upload(photo)
+                if file_path:
                     foto = ProgressPhoto(
                         progress_id=avance.id,
-                        file_path=f"uploads/{filename}"
+                        file_path=file_path
                     )
                     db.session.add(foto)
+                    photo_paths.append(file_path)
 
+        # Miniaturas y WebP en la cola, en la misma transacción que el avance y sus fotos
+        image_variants.schedule(*photo_paths)
         db.session.commit()
         flash("Avance registrado correctamente ✅", "success")
         return redirect(url_for('miembro.listar_avances', project_id=project.id))
@@ -144,13 +150,20 @@ def nuevo_avance(project_id):
 # Ruta para ver y completar checklist diaria
 @miembro_bp.route('/proyecto/<int:project_id>/checklist', methods=['GET', 'POST'])
 @login_required
+@requires(project_role=MEMBER_ROLES)
 def checklist(project_id):
     project = Project.query.get_or_404(project_id)
     items = DailyChecklist.query.filter_by(project_id=project.id, is_active=True).all()
     form = ChecklistForm()
+    today = checklist_today()
 
-    from datetime import date
-    today = date.today()
+    if request.method == 'POST':
+        # Todos los ítems en un solo INSERT ... ON CONFLICT, sin consultar antes lo guardado
+        states = {item.id: request.form.get(f"item_{item.id}") == "on" for item in items}
+        save_checklist(current_user.id, today, states)
+        db.session.commit()
+        flash("Checklist guardado ✅", "success")
+        return redirect(url_for('miembro.checklist', project_id=project.id))
 
     # Crear un diccionario con el estado de cada ítem para este usuario
     completions = {
@@ -161,31 +174,6 @@ def checklist(project_id):
         ).all()
     }
 
-    if request.method == 'POST':
-        for item in items:
-            checked = request.form.get(f"item_{item.id}") == "on"
-
-            completion = ChecklistCompletion.query.filter_by(
-                checklist_id=item.id,
-                user_id=current_user.id,
-                date=today
-            ).first()
-
-            if completion:
-                completion.completed = checked
-            else:
-                completion = ChecklistCompletion(
-                    checklist_id=item.id,
-                    user_id=current_user.id,
-                    date=today,
-                    completed=checked
-                )
-                db.session.add(completion)
-
-        db.session.commit()
-        flash("Checklist guardado ✅", "success")
-        return redirect(url_for('miembro.checklist', project_id=project.id))
-
     return render_template("miembro/checklist.html", form=form, project=project, items=items, completions=completions)
 
 
@@ -193,12 +181,7 @@ def checklist(project_id):
 @miembro_bp.route('/proyectos')
 @login_required
 def mis_proyectos():
-    proyectos = (
-        Project.query
-        .join(ProjectUserRole)
-        .filter(ProjectUserRole.user_id == current_user.id)
-        .all()
-    )
+    proyectos = Project.query.filter(Project.id.in_(get_permissions().accessible_project_ids)).all()
 
     return render_template("miembro/mis_proyectos.html", proyectos=proyectos)
 
@@ -234,12 +217,24 @@ def comentarios_tarea(tarea_id):
         flash("Comentario agregado correctamente.", "success")
         return redirect(url_for('miembro.comentarios_tarea', tarea_id=tarea.id))
 
-    comentarios = Comment.query.filter_by(task_id=tarea.id).order_by(Comment.created_at.asc()).all()
+    # Últimos comentarios; la página pide los nuevos (y los anteriores) a comentarios_tarea_feed
+    comentarios, has_older = recent_comments(tarea.id)
 
-    if request.args.get("ajax"):
-        return render_template('miembro/_comentarios_partial.html', comentarios=comentarios)
+    return render_template('miembro/tarea_comentarios.html', tarea=tarea,
+                           comentarios=comentarios, has_older=has_older)
 
-    return render_template('miembro/tarea_comentarios.html', tarea=tarea, comentarios=comentarios)
+
+# Comentarios más nuevos (?after=id, 304 si no hay) o anteriores (?before=id) de una tarea
+@miembro_bp.route('/tarea/<int:tarea_id>/comentarios/feed')
+@login_required
+def comentarios_tarea_feed(tarea_id):
+    responsable = db.session.scalar(
+        db.select(ProjectTask.responsible_user_id).where(ProjectTask.id == tarea_id)
+    )
+    if responsable != current_user.id:
+        abort(403, description="No tienes permiso para acceder a esta tarea.")
+
+    return feed_response(tarea_id, 'miembro/_comentarios_partial.html', 'comentarios')
 
 # Configuración para subir archivos
 UPLOAD_FOLDER = os.path.join("app", "static", "uploads", "incidencias")
@@ -251,6 +246,7 @@ def allowed_file(filename):
 # Ruta para crear nueva incidencia
 @miembro_bp.route('/incidencias/nueva/<int:project_id>', methods=['GET', 'POST'])
 @login_required
+@requires(project_role=MEMBER_ROLES)
 def nueva_incidencia(project_id):
     proyecto = Project.query.get_or_404(project_id)
     form = IncidentReportForm()
@@ -260,22 +256,14 @@ def nueva_incidencia(project_id):
         # Archivos
         photo_file = form.photo.data
         attachment_file = form.attachment.data
-        photo_path, attachment_path = None, None
-
-        upload_dir = os.path.join(current_app.root_path, "static", "uploads", "incidencias")
-        os.makedirs(upload_dir, exist_ok=True)
+        photo_path, attachment_path, attachment_name = None, None, None
 
         if photo_file and allowed_file(photo_file.filename):
-            filename = secure_filename(photo_file.filename)
-            abs_path = os.path.join(upload_dir, filename)
-            photo_file.save(abs_path)
-            photo_path = f"uploads/incidencias/{filename}" 
+            photo_path = store_upload(photo_file)
 
         if attachment_file and allowed_file(attachment_file.filename):
-            filename = secure_filename(attachment_file.filename)
-            abs_path = os.path.join(upload_dir, filename)
-            attachment_file.save(abs_path)
-            attachment_path = f"uploads/incidencias/{filename}"
+            attachment_path = store_upload(attachment_file)
+            attachment_name = upload_name(attachment_file)
 
         incidencia = IncidentReport(
             reporter_id=current_user.id,
@@ -301,10 +289,12 @@ def nueva_incidencia(project_id):
             preventive_actions=form.preventive_actions.data,
             photo_path=photo_path,
             attachment_path=attachment_path,
+            attachment_name=attachment_name,
             evidence_comment=form.evidence_comment.data
         )
 
         db.session.add(incidencia)
+        image_variants.schedule(photo_path)
         db.session.commit()
         flash("✅ Incidencia registrada exitosamente", "success")
         return redirect(url_for("miembro.ver_incidencias_proyecto", project_id=project_id))
@@ -318,25 +308,19 @@ def nueva_incidencia(project_id):
 @miembro_bp.route('/incidencias')
 @login_required
 def incidencias_home():
-    proyectos = (
-        Project.query
-        .join(ProjectUserRole)
-        .filter(ProjectUserRole.user_id == current_user.id)
-        .all()
-    )
+    proyectos = Project.query.filter(Project.id.in_(get_permissions().accessible_project_ids)).all()
 
     return render_template("miembro/incidencias.html", proyectos=proyectos)
 
 # Ruta para ver incidencias de un proyecto específico
 @miembro_bp.route('/incidencias/ver/<int:project_id>')
 @login_required
+@requires(project_role=MEMBER_ROLES)
 def ver_incidencias_proyecto(project_id):
     proyecto = Project.query.get_or_404(project_id)
-    incidencias = (
-        IncidentReport.query
-        .filter_by(project_id=project_id, reporter_id=current_user.id)
-        .order_by(IncidentReport.report_datetime.desc())
-        .all()
+    incidencias = paginate_keyset(
+        IncidentReport.query.filter_by(project_id=project_id, reporter_id=current_user.id),
+        IncidentReport.report_datetime, IncidentReport.id,
     )
 
     return render_template(
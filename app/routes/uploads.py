@@ -0,0 +1,58 @@
+from flask import Blueprint, jsonify, request
+from flask_login import current_user, login_required
+from app.services.chunked_upload import UploadError, cancel_upload, get_upload, start_upload, write_chunk
+from app.services.permissions import requires
+
+# Protocolo de subida por partes (ver app/services/chunked_upload.py). Las vistas de
+# cada rol siguen decidiendo qué hacer con el archivo al recibir el formulario.
+uploads_bp = Blueprint('uploads', __name__, url_prefix='/uploads')
+
+# Roles de las vistas que reciben subidas por partes (documentos de editor e invitado)
+UPLOAD_ROLES = ('admin', 'editor', 'invitado')
+
+
+@uploads_bp.errorhandler(UploadError)
+def upload_error(error):
+    body = {'error': error.message}
+    if error.offset is not None:
+        body['offset'] = error.offset
+    return jsonify(body), error.status
+
+
+# Inicia una subida: {filename, size, sha256?}
+@uploads_bp.route('', methods=['POST'])
+@login_required
+@requires(role=UPLOAD_ROLES)
+def iniciar():
+    data = request.get_json(silent=True) or {}
+    upload = start_upload(current_user.id, data.get('filename'), data.get('size'), data.get('sha256'))
+    return jsonify(upload), 201
+
+
+# Estado de la subida (offset confirmado), para reanudar tras un corte
+@uploads_bp.route('/<upload_id>', methods=['GET'])
+@login_required
+@requires(role=UPLOAD_ROLES)
+def estado(upload_id):
+    return jsonify(get_upload(upload_id, current_user.id))
+
+
+# Recibe una parte: cuerpo crudo, headers Upload-Offset y X-Chunk-Sha256
+@uploads_bp.route('/<upload_id>', methods=['PUT'])
+@login_required
+@requires(role=UPLOAD_ROLES)
+def recibir_parte(upload_id):
+    offset = request.headers.get('Upload-Offset', type=int)
+    if offset is None:
+        raise UploadError('Falta el header Upload-Offset.')
+    upload = write_chunk(upload_id, current_user.id, offset, request.content_length,
+                         request.stream, request.headers.get('X-Chunk-Sha256'))
+    return jsonify(upload)
+
+
+@uploads_bp.route('/<upload_id>', methods=['DELETE'])
+@login_required
+@requires(role=UPLOAD_ROLES)
+def cancelar(upload_id):
+    cancel_upload(upload_id, current_user.id)
+    return '', 204
@@ -0,0 +1,292 @@
+"""Archivos estáticos con huella de contenido, precomprimidos y cacheables para siempre.
+
+`flask assets build` recorre app/static (salvo los archivos subidos) y escribe en
+static/dist/ una copia de cada archivo con el hash del contenido en el nombre
+(logo.png -> dist/logo.1a2b3c4d.png), más `dist/manifest.json` con la equivalencia:
+
+- las imágenes se achican a su tamaño máximo de uso (IMAGE_MAX_SIZE) y se
+  recomprimen; los PNG con transparencia pasan a paleta. Cada imagen lleva además un
+  hermano `.webp`;
+- CSS, JS, SVG y demás texto llevan un hermano `.gz` (nivel 9); en los CSS, las
+  url(...) relativas (fuentes, imágenes) se reescriben a los archivos con huella.
+
+El CSS de la aplicación no se compila en el navegador: `flask assets css` corre
+Tailwind sobre app/assets/tailwind.css, que recorre las plantillas y deja solo las
+clases usadas en static/css/app.css. Chart.js y la fuente Inter están en static/vendor.
+
+Con el manifiesto presente, url_for('static', filename='logo.png') apunta al archivo
+con huella, que se sirve con Cache-Control immutable: una visita repetida no vuelve a
+pedirlo. La vista static entrega el `.webp` a los navegadores que lo aceptan y el
+`.gz` a los que aceptan gzip (en producción nginx puede hacer lo mismo con
+gzip_static). Sin manifiesto (desarrollo) todo queda como antes.
+"""
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import subprocess
+import click
+from flask import abort, current_app, request, send_from_directory
+from flask.cli import AppGroup
+from PIL import Image
+from werkzeug.security import safe_join
+from app.services.downloads import send_download
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Carpetas de static que no son assets de la aplicación
+EXCLUDED_DIRS = {'uploads', 'blobs', DIST}
+
+# Archivos subidos y manuales: pueden pesar cientos de MB, van por la capa de descargas
+DOWNLOAD_DIRS = ('uploads/', 'blobs/', 'manuales/')
+
+# Lado mayor en px según cómo se muestra cada imagen (el resto usa DEFAULT_IMAGE_MAX)
+IMAGE_MAX_SIZE = {
+    'favicon.png': 64,
+    'logo.png': 768,     # hasta w-64 (256 px) en la portada, ancho de columna en "Funcionalidades"
+    'kodesk.png': 256,
+    'logos/': 512,
+}
+DEFAULT_IMAGE_MAX = 1600
+
+TAILWIND_SOURCE = os.path.join('assets', 'tailwind.css')   # relativo a app/
+STYLESHEET = 'css/app.css'
+
+RASTER_EXTENSIONS = {'.png', '.jpg', '.jpeg'}
+GZIP_EXTENSIONS = {'.css', '.js', '.mjs', '.svg', '.json', '.map', '.txt', '.html', '.xml', '.ttf', '.otf', '.ico'}
+
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+def _max_size(relative):
+    for prefix, size in IMAGE_MAX_SIZE.items():
+        if relative == prefix or (prefix.endswith('/') and relative.startswith(prefix)):
+            return size
+    return DEFAULT_IMAGE_MAX
+
+
+def _optimize_image(source, relative):
+    """(bytes de la imagen recomprimida, bytes del WebP)."""
+    with Image.open(source) as image:
+        image.load()
+        extension = os.path.splitext(relative)[1].lower()
+        limit = _max_size(relative)
+        image.thumbnail((limit, limit), Image.LANCZOS)
+
+        webp = io.BytesIO()
+        image.save(webp, 'WEBP', quality=85, method=4)
+
+        out = io.BytesIO()
+        if extension == '.png':
+            if image.mode in ('RGBA', 'LA', 'P'):
+                # Logos e íconos: 256 colores con transparencia alcanzan y pesan mucho menos
+                image.convert('RGBA').quantize(256, method=Image.Quantize.FASTOCTREE).save(out, 'PNG', optimize=True)
+            else:
+                image.save(out, 'PNG', optimize=True)
+        else:
+            image.convert('RGB').save(out, 'JPEG', quality=82, optimize=True, progressive=True)
+
+    data = out.getvalue()
+    original = os.path.getsize(source)
+    # Si la imagen ya estaba mejor comprimida, se deja la original
+    if len(data) >= original:
+        with open(source, 'rb') as fh:
+            data = fh.read()
+    return data, webp.getvalue()
+
+
+def _fingerprinted(relative, data):
+    stem, extension = os.path.splitext(relative)
+    digest = hashlib.sha256(data).hexdigest()[:8]
+    return f'{DIST}/{stem}.{digest}{extension}'
+
+
+def _rewrite_css_urls(css, relative, manifest):
+    """Apunta las url(...) relativas de un CSS a los archivos con huella de dist/."""
+    base = posixpath.dirname(relative)
+
+    def replace(match):
+        quote, url = match.groups()
+        if url.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return match.group(0)
+        path, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+        hashed = manifest.get(posixpath.normpath(posixpath.join(base, path)))
+        if not hashed:
+            return match.group(0)
+        # El CSS con huella queda en dist/<carpeta original>/: la URL sigue siendo relativa
+        target = posixpath.relpath(hashed, posixpath.join(DIST, base))
+        return f'url({quote}{target}{suffix}{quote})'
+
+    return CSS_URL.sub(replace, css)
+
+
+def _write(static_folder, relative, data):
+    target = os.path.join(static_folder, relative)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'wb') as fh:
+        fh.write(data)
+
+
+def build_assets(static_folder, clean=False):
+    """Genera static/dist y su manifiesto; devuelve (manifiesto, bytes originales, bytes generados)."""
+    sources = []
+    for directory, dirs, files in os.walk(static_folder):
+        relative_dir = os.path.relpath(directory, static_folder).replace(os.sep, '/')
+        if relative_dir == '.':
+            dirs[:] = [d for d in dirs if d not in EXCLUDED_DIRS]
+            relative_dir = ''
+        for name in sorted(files):
+            sources.append((os.path.join(directory, name), f'{relative_dir}/{name}' if relative_dir else name))
+    # Los CSS al final: sus url(...) necesitan la huella de lo que referencian
+    sources.sort(key=lambda item: item[1].lower().endswith('.css'))
+
+    manifest = {}
+    before, after = 0, 0
+    for source, relative in sources:
+        extension = os.path.splitext(relative)[1].lower()
+
+        webp = None
+        if extension in RASTER_EXTENSIONS:
+            data, webp = _optimize_image(source, relative)
+        else:
+            with open(source, 'rb') as fh:
+                data = fh.read()
+            if extension == '.css':
+                data = _rewrite_css_urls(data.decode('utf-8'), relative, manifest).encode('utf-8')
+
+        hashed = _fingerprinted(relative, data)
+        _write(static_folder, hashed, data)
+        if webp is not None and len(webp) < len(data):
+            _write(static_folder, f'{hashed}.webp', webp)
+        if extension in GZIP_EXTENSIONS:
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) < len(data):
+                _write(static_folder, f'{hashed}.gz', compressed)
+
+        manifest[relative] = hashed
+        before += os.path.getsize(source)
+        after += len(data)
+
+    dist = os.path.join(static_folder, DIST)
+    if clean:
+        # Solo lo que referencia el manifiesto nuevo (y sus hermanos .gz/.webp)
+        keep = {os.path.join(static_folder, path) for path in manifest.values()}
+        for directory, _, files in os.walk(dist):
+            for name in files:
+                full = os.path.join(directory, name)
+                base = full[:-3] if full.endswith('.gz') else full[:-5] if full.endswith('.webp') else full
+                if base not in keep and full != os.path.join(dist, MANIFEST):
+                    os.remove(full)
+
+    with open(os.path.join(dist, MANIFEST), 'w') as fh:
+        json.dump(manifest, fh, indent=1, sort_keys=True)
+    return manifest, before, after
+
+
+class AssetManifest:
+    def __init__(self):
+        self.files = {}
+
+    def init_app(self, app):
+        self.load(app.static_folder)
+        app.url_defaults(self._fingerprint)
+        app.view_functions['static'] = serve_static
+        app.cli.add_command(assets_cli)
+
+    def load(self, static_folder):
+        try:
+            with open(os.path.join(static_folder, DIST, MANIFEST)) as fh:
+                self.files = json.load(fh)
+        except FileNotFoundError:
+            self.files = {}
+
+    def _fingerprint(self, endpoint, values):
+        if endpoint == 'static' and self.files:
+            hashed = self.files.get(values.get('filename'))
+            if hashed:
+                values['filename'] = hashed
+
+
+asset_manifest = AssetManifest()
+
+
+def _accepts_webp():
+    return any(value == 'image/webp' for value, _ in request.accept_mimetypes)
+
+
+def serve_static(filename):
+    """Vista static: los archivos de dist/ van con caché immutable y su variante precomprimida.
+
+    Subidas y manuales pasan por send_download (proxy con X-Accel-Redirect, o Range y
+    ETag desde el worker).
+    """
+    if filename.startswith(DOWNLOAD_DIRS):
+        path = safe_join(current_app.static_folder, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        return send_download(path, as_attachment=False, max_age=current_app.get_send_file_max_age(filename))
+    if not filename.startswith(f'{DIST}/'):
+        return current_app.send_static_file(filename)
+
+    static_folder = current_app.static_folder
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    variant, vary, encoding = None, None, None
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in RASTER_EXTENSIONS:
+        vary = 'Accept'
+        if _accepts_webp() and os.path.isfile(os.path.join(static_folder, f'{filename}.webp')):
+            variant, mimetype = f'{filename}.webp', 'image/webp'
+    elif extension in GZIP_EXTENSIONS:
+        vary = 'Accept-Encoding'
+        if 'gzip' in request.accept_encodings and os.path.isfile(os.path.join(static_folder, f'{filename}.gz')):
+            variant, encoding = f'{filename}.gz', 'gzip'
+
+    response = send_from_directory(static_folder, variant or filename, mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if vary:
+        response.vary.add(vary)
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = IMMUTABLE_MAX_AGE
+    response.cache_control.immutable = True
+    return response
+
+
+assets_cli = AppGroup('assets', help='Archivos estáticos con huella de contenido.')
+
+
+@assets_cli.command('build')
+@click.option('--clean', is_flag=True, help='Borra de dist/ lo que no está en el manifiesto nuevo.')
+def build_command(clean):
+    """Recomprime, agrega huellas y precomprime los archivos de app/static."""
+    static_folder = current_app.static_folder
+    manifest, before, after = build_assets(static_folder, clean=clean)
+    asset_manifest.load(static_folder)
+    click.echo(f'{len(manifest)} archivos: {before / 1048576:.1f} MB → {after / 1048576:.1f} MB en {DIST}/')
+
+
+@assets_cli.command('css')
+@click.option('--watch', is_flag=True, help='Recompila al cambiar las plantillas (desarrollo).')
+def css_command(watch):
+    """Compila static/css/app.css con Tailwind, solo con las clases que usan las plantillas."""
+    source = os.path.join(current_app.root_path, TAILWIND_SOURCE)
+    output = os.path.join(current_app.static_folder, STYLESHEET)
+    command = [current_app.config['TAILWIND_CLI'], '--input', source, '--output', output, '--minify']
+    if watch:
+        command.append('--watch')
+    try:
+        subprocess.run(command, check=True)
+    except FileNotFoundError:
+        raise click.ClickException(
+            f"No se encontró {command[0]!r}: instala tailwindcss-bin (requirements-dev.txt) o ajusta TAILWIND_CLI."
+        )
+    except subprocess.CalledProcessError as error:
+        raise click.ClickException(f'Tailwind terminó con código {error.returncode}.')
+    click.echo(f'{STYLESHEET}: {os.path.getsize(output) / 1024:.0f} KB (corre `flask assets build` para publicarlo)')
@@ -0,0 +1,356 @@
+"""Almacén de archivos subidos direccionado por contenido.
+
+Cada archivo se guarda una sola vez en static/blobs/ab/cd/<sha256>.<ext>, donde el
+SHA-256 se calcula mientras se copia el stream de la subida. Dos archivos distintos
+con el mismo nombre ya no se pisan, y el mismo plano subido a cinco proyectos ocupa
+disco una sola vez. Las columnas de ruta de los modelos guardan esa ruta relativa a
+static, así que las plantillas siguen usando url_for('static', filename=...); como
+la URL cambia si cambia el contenido, se sirve con Cache-Control immutable.
+
+`stored_blobs` lleva la cuenta de filas que apuntan a cada archivo (ref_count), que
+un listener after_flush mantiene al crear, cambiar o borrar esas filas. `flask blobs
+gc` recalcula las cuentas y borra los archivos sin referencias; `flask blobs import`
+pasa los archivos subidos antes del almacén.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from collections import Counter
+from datetime import datetime, timedelta
+import click
+from flask import current_app, request
+from flask.cli import AppGroup
+from sqlalchemy import event, func, inspect, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm.base import NO_VALUE
+from werkzeug.utils import secure_filename
+from app import db
+from app.models import ConfigTemplate, IncidentReport, ProgressPhoto, Project, ProjectDocument, StoredBlob, TechnicalReport
+from app.services.jobs import PRIORITY_LOW, task
+
+BLOB_PREFIX = 'blobs/'
+READ_BLOCK = 1024 * 1024
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Columnas que guardan rutas de archivos subidos
+REFERENCES = {
+    Project: ('budget_file', 'schedule_file'),
+    ProjectDocument: ('file_path',),
+    ProgressPhoto: ('file_path',),
+    IncidentReport: ('photo_path', 'attachment_path'),
+    TechnicalReport: ('attachment_path', 'evidence_photos'),
+    ConfigTemplate: ('file_path',),
+}
+
+# Columnas con el nombre original del archivo de una columna de REFERENCES
+ORIGINAL_NAMES = {
+    (IncidentReport, 'attachment_path'): 'attachment_name',
+    (TechnicalReport, 'attachment_path'): 'attachment_name',
+}
+
+
+def is_blob(path):
+    return bool(path) and path.startswith(BLOB_PREFIX)
+
+
+def blob_path(sha256, extension=''):
+    return f'{BLOB_PREFIX}{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}'
+
+
+def _absolute(path):
+    return os.path.join(current_app.static_folder, path)
+
+
+def _extension(filename):
+    extension = os.path.splitext(secure_filename(filename or ''))[1].lower()
+    return extension if len(extension) <= 10 else ''
+
+
+def resolve_upload(static_folder, stored_path):
+    """Ruta real de un archivo subido, o None si no está en disco.
+
+    Las rutas anteriores al almacén varían según la vista que subió el archivo:
+    relativas a static ('uploads/...'), con el prefijo 'app/static/' o con
+    separadores de Windows.
+    """
+    if not stored_path:
+        return None
+    path = stored_path.replace('\\', '/')
+    for prefix in ('app/static/', 'static/'):
+        if path.startswith(prefix):
+            path = path[len(prefix):]
+    candidates = [os.path.join(static_folder, path)]
+    if not is_blob(path):
+        candidates.append(os.path.join(static_folder, 'uploads', os.path.basename(path)))
+    return next((c for c in candidates if os.path.isfile(c)), None)
+
+
+# --- Escritura -------------------------------------------------------------------
+
+def _staging_dir():
+    directory = _absolute(os.path.join(BLOB_PREFIX, 'tmp'))
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def _copy_hashing(stream, dest):
+    """Copia `stream` a `dest` por bloques; devuelve (sha256, bytes)."""
+    digest = hashlib.sha256()
+    size = 0
+    while block := stream.read(READ_BLOCK):
+        digest.update(block)
+        dest.write(block)
+        size += len(block)
+    return digest.hexdigest(), size
+
+
+def _register(staged, sha256, size, filename):
+    """Deja `staged` en su ruta por contenido (o lo descarta si ya existe) y devuelve la ruta."""
+    existing = db.session.execute(select(StoredBlob.path).where(StoredBlob.sha256 == sha256)).scalar()
+    if existing is not None:
+        # Se vuelve a usar: gc no lo toca hasta que pase el margen desde ahora
+        db.session.execute(
+            update(StoredBlob).where(StoredBlob.sha256 == sha256).values(created_at=datetime.utcnow())
+        )
+    path = existing or blob_path(sha256, _extension(filename))
+    target = _absolute(path)
+    if os.path.exists(target):
+        os.remove(staged)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.chmod(staged, 0o644)
+        shutil.move(staged, target)
+
+    if existing is None:
+        # Dos subidas simultáneas del mismo contenido: la segunda no inserta
+        db.session.execute(
+            sqlite_insert(StoredBlob)
+            .values(sha256=sha256, path=path, size=size, ref_count=0, created_at=datetime.utcnow())
+            .on_conflict_do_nothing()
+        )
+    return path
+
+
+def store_stream(stream, filename):
+    """Guarda el contenido de `stream` y devuelve su ruta relativa a static."""
+    fd, staged = tempfile.mkstemp(dir=_staging_dir())
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            sha256, size = _copy_hashing(stream, fh)
+        return _register(staged, sha256, size, filename)
+    except BaseException:
+        if os.path.exists(staged):
+            os.remove(staged)
+        raise
+
+
+def store_upload(file):
+    """Guarda un FileStorage del formulario; None si no se subió archivo."""
+    if not file or not file.filename:
+        return None
+    return store_stream(file.stream, file.filename)
+
+
+def upload_name(file):
+    """Nombre con que se subió el FileStorage, para mostrarlo y descargarlo; la ruta solo tiene el hash."""
+    if not file or not file.filename:
+        return None
+    return secure_filename(file.filename) or None
+
+
+def store_file(source, filename, move=False):
+    """Guarda un archivo que ya está en disco; con `move` se lo lleva en vez de copiarlo."""
+    if not move:
+        with open(source, 'rb') as fh:
+            return store_stream(fh, filename)
+    digest = hashlib.sha256()
+    size = 0
+    with open(source, 'rb') as fh:
+        while block := fh.read(READ_BLOCK):
+            digest.update(block)
+            size += len(block)
+    fd, staged = tempfile.mkstemp(dir=_staging_dir())
+    os.close(fd)
+    shutil.move(source, staged)
+    return _register(staged, digest.hexdigest(), size, filename)
+
+
+# --- Conteo de referencias -------------------------------------------------------
+
+def _reference_deltas(session):
+    deltas = Counter()
+    for obj in session.new:
+        for column in REFERENCES.get(type(obj), ()):
+            value = getattr(obj, column)
+            if is_blob(value):
+                deltas[value] += 1
+    for obj in session.dirty:
+        state = inspect(obj)
+        for column in REFERENCES.get(type(obj), ()):
+            history = state.attrs[column].history
+            for value in history.added:
+                if is_blob(value):
+                    deltas[value] += 1
+            for value in history.deleted:
+                if is_blob(value):
+                    deltas[value] -= 1
+    for obj in session.deleted:
+        state = inspect(obj)
+        for column in REFERENCES.get(type(obj), ()):
+            value = state.attrs[column].loaded_value
+            if value is not NO_VALUE and is_blob(value):
+                deltas[value] -= 1
+    return {path: delta for path, delta in deltas.items() if delta}
+
+
+def _count_after_flush(session, flush_context):
+    deltas = _reference_deltas(session)
+    if not deltas:
+        return
+    connection = session.connection()
+    for path, delta in deltas.items():
+        connection.execute(
+            update(StoredBlob).where(StoredBlob.path == path).values(ref_count=StoredBlob.ref_count + delta)
+        )
+
+
+def register_blob_listeners():
+    if not event.contains(db.session, 'after_flush', _count_after_flush):
+        event.listen(db.session, 'after_flush', _count_after_flush)
+
+
+def _immutable_cache(response):
+    # La URL de un blob incluye su hash: el contenido detrás de ella nunca cambia
+    if request.endpoint == 'static' and (request.view_args or {}).get('filename', '').startswith(BLOB_PREFIX):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+
+def init_blob_store(app):
+    register_blob_listeners()
+    app.after_request(_immutable_cache)
+    app.cli.add_command(blobs_cli)
+
+
+@task('archivos.borrar', priority=PRIORITY_LOW)
+def delete_legacy_file(path):
+    """Borra un archivo subido antes del almacén; los blobs solo los borra `flask blobs gc`."""
+    if is_blob(path):
+        return
+    target = os.path.join(current_app.static_folder, path.replace('\\', '/'))
+    if os.path.isfile(target):
+        os.remove(target)
+
+
+# --- Mantenimiento ---------------------------------------------------------------
+
+def recount_references():
+    """Recalcula ref_count desde las columnas de ruta; devuelve cuántas cuentas cambiaron."""
+    totals = Counter()
+    for model, columns in REFERENCES.items():
+        for column in columns:
+            attr = getattr(model, column)
+            rows = db.session.execute(
+                select(attr, func.count()).where(attr.like(f'{BLOB_PREFIX}%')).group_by(attr)
+            )
+            for path, count in rows:
+                totals[path] += count
+
+    changed = 0
+    for path, current in db.session.execute(select(StoredBlob.path, StoredBlob.ref_count)).all():
+        if current != totals.get(path, 0):
+            db.session.execute(
+                update(StoredBlob).where(StoredBlob.path == path).values(ref_count=totals.get(path, 0))
+            )
+            changed += 1
+    db.session.commit()
+    return changed
+
+
+def collect_garbage(grace_hours):
+    """Borra los blobs sin referencias y los archivos huérfanos más viejos que `grace_hours`.
+
+    El margen cubre las subidas cuyo registro todavía no se confirmó.
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=grace_hours)
+    removed, freed = 0, 0
+    for blob in db.session.scalars(
+        select(StoredBlob).where(StoredBlob.ref_count <= 0, StoredBlob.created_at < cutoff)
+    ).all():
+        target = _absolute(blob.path)
+        if os.path.exists(target):
+            freed += os.path.getsize(target)
+            os.remove(target)
+        db.session.delete(blob)
+        removed += 1
+    db.session.commit()
+
+    # Archivos sin fila (subidas cuya transacción se revirtió), derivados de blobs ya
+    # borrados (<sha256>.thumb.webp...) y restos de tmp
+    known = set(db.session.scalars(select(StoredBlob.sha256)).all())
+    root = _absolute(BLOB_PREFIX)
+    cutoff_ts = cutoff.timestamp()
+    for directory, _, files in os.walk(root):
+        for name in files:
+            full = os.path.join(directory, name)
+            if name[:64] not in known and os.path.getmtime(full) < cutoff_ts:
+                freed += os.path.getsize(full)
+                os.remove(full)
+                removed += 1
+    return removed, freed
+
+
+def import_legacy(remove_legacy=False):
+    """Pasa al almacén los archivos con rutas antiguas; devuelve (importados, faltantes, bytes liberables)."""
+    imported, missing = 0, 0
+    legacy_files = {}
+    for model, columns in REFERENCES.items():
+        for obj in db.session.scalars(select(model)).all():
+            for column in columns:
+                value = getattr(obj, column)
+                if not value or is_blob(value):
+                    continue
+                source = resolve_upload(current_app.static_folder, value)
+                if source is None:
+                    missing += 1
+                    continue
+                name_column = ORIGINAL_NAMES.get((model, column))
+                if name_column and not getattr(obj, name_column):
+                    setattr(obj, name_column, os.path.basename(source))
+                setattr(obj, column, store_file(source, source))
+                legacy_files[source] = os.path.getsize(source)
+                imported += 1
+        db.session.commit()
+
+    if remove_legacy:
+        for source in legacy_files:
+            os.remove(source)
+    return imported, missing, sum(legacy_files.values())
+
+
+blobs_cli = AppGroup('blobs', help='Almacén de archivos subidos por contenido.')
+
+
+@blobs_cli.command('import')
+@click.option('--remove-legacy', is_flag=True, help='Borra los archivos originales una vez importados.')
+def import_command(remove_legacy):
+    """Mueve al almacén los archivos subidos con rutas anteriores."""
+    imported, missing, legacy_bytes = import_legacy(remove_legacy)
+    stored = db.session.execute(select(func.coalesce(func.sum(StoredBlob.size), 0))).scalar()
+    click.echo(f'{imported} referencias importadas, {missing} archivos faltantes')
+    click.echo(f'{legacy_bytes / 1048576:.1f} MB en rutas antiguas → {stored / 1048576:.1f} MB en el almacén')
+    if not remove_legacy:
+        click.echo('Los originales siguen en disco (usa --remove-legacy para borrarlos).')
+
+
+@blobs_cli.command('gc')
+@click.option('--grace-hours', default=24, show_default=True, help='Edad mínima de lo que se borra.')
+def gc_command(grace_hours):
+    """Recalcula las referencias y borra los archivos que nadie usa."""
+    changed = recount_references()
+    removed, freed = collect_garbage(grace_hours)
+    click.echo(f'{changed} cuentas corregidas, {removed} archivos borrados ({freed / 1048576:.1f} MB)')
@@ -0,0 +1,56 @@
+"""Checklist diaria: día local de la checklist y guardado de todos los ítems en una sentencia.
+
+Al inicio del turno toda la cuadrilla envía su checklist a la vez. Cada envío es un
+único INSERT ... ON CONFLICT DO UPDATE con una fila por ítem: no se lee antes lo
+guardado y la transacción de escritura dura una sola sentencia. El índice único
+(checklist_id, user_id, date) es el que resuelve el conflicto.
+`python bench_checklist.py` compara este camino con el de una consulta por ítem.
+"""
+from datetime import datetime
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+from sqlalchemy import bindparam
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app import db
+from app.models import ChecklistCompletion
+
+CHECKLIST_TZ = ZoneInfo('America/Santiago')
+
+
+def checklist_today():
+    """Día de la checklist en hora de Chile, calculado en cada request."""
+    return datetime.now(CHECKLIST_TZ).date()
+
+
+@lru_cache(maxsize=64)
+def _upsert_statement(rows):
+    # Una sentencia por cantidad de ítems, con parámetros: SQLAlchemy la compila una vez
+    # (armarla con los valores adentro cuesta más que ejecutarla)
+    table = ChecklistCompletion.__table__
+    user_id = bindparam('user_id', type_=table.c.user_id.type)
+    day = bindparam('date', type_=table.c.date.type)
+    stmt = sqlite_insert(table).values([
+        {'checklist_id': bindparam(f'checklist_id_{n}', type_=table.c.checklist_id.type),
+         'user_id': user_id, 'date': day,
+         'completed': bindparam(f'completed_{n}', type_=table.c.completed.type)}
+        for n in range(rows)
+    ])
+    return stmt.on_conflict_do_update(
+        index_elements=['checklist_id', 'user_id', 'date'],
+        set_={'completed': stmt.excluded.completed},
+    )
+
+
+def completion_upsert(user_id, day, states):
+    """(sentencia, parámetros) que dejan `states` ({checklist_id: completado}) como estado del día."""
+    params = {'user_id': user_id, 'date': day}
+    for n, (checklist_id, completed) in enumerate(states.items()):
+        params[f'checklist_id_{n}'] = checklist_id
+        params[f'completed_{n}'] = completed
+    return _upsert_statement(len(states)), params
+
+
+def save_checklist(user_id, day, states):
+    """Guarda el estado de todos los ítems; no hace commit."""
+    if states:
+        db.session.execute(*completion_upsert(user_id, day, states))
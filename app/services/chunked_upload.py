@@ -0,0 +1,262 @@
+"""Subida de archivos grandes por partes, reanudable.
+
+Protocolo (rutas en app/routes/uploads.py):
+
+1. `POST /uploads` con {filename, size} crea la subida y devuelve su id y el tamaño
+   de parte que acepta el servidor.
+2. `PUT /uploads/<id>` con el cuerpo crudo de una parte, el header `Upload-Offset`
+   (byte donde empieza) y opcionalmente `X-Chunk-Sha256`. La parte se lee por bloques
+   a un archivo propio del request y solo si llegó completa y con el checksum correcto
+   se agrega al archivo de ensamblado; si el offset no coincide con lo recibido se
+   responde 409 con el offset correcto.
+3. `GET /uploads/<id>` devuelve el offset confirmado: tras un corte, el cliente sigue
+   desde ahí en vez de empezar de cero.
+4. El formulario de la vista se envía con `upload_id` en lugar del archivo y la vista
+   llama a `receive_upload`, que pasa el archivo completo al almacén de blobs.
+
+Cada subida vive en UPLOAD_TMP_DIR/<id>/ (meta.json + data.part) y se borra al
+finalizar, al cancelarla o cuando pasan UPLOAD_EXPIRY_HOURS sin actividad. Un cliente
+que reintenta tras un corte puede tener dos PUT de la misma parte en curso: todo lo que
+lee o cambia meta.json y data.part se hace con el lock exclusivo de la subida, y un
+request que falla nunca toca data.part. Cada usuario tiene a lo sumo UPLOAD_MAX_OPEN
+subidas abiertas.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from flask import current_app, request
+from werkzeug.utils import secure_filename
+from app.services.blob_store import store_file, store_upload
+
+READ_BLOCK = 1024 * 1024
+
+
+class UploadError(Exception):
+    """Error del protocolo; `status` es el código HTTP y `offset` el confirmado, si aplica."""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.offset = offset
+
+
+def _root():
+    return current_app.config['UPLOAD_TMP_DIR']
+
+
+def _upload_dir(upload_id):
+    # El id es un uuid hex: cualquier otra cosa no corresponde a una subida
+    if not upload_id or len(upload_id) != 32 or not all(c in '0123456789abcdef' for c in upload_id):
+        raise UploadError('Subida no encontrada.', 404)
+    return os.path.join(_root(), upload_id)
+
+
+def _read_meta(upload_id, user_id):
+    path = os.path.join(_upload_dir(upload_id), 'meta.json')
+    try:
+        with open(path) as fh:
+            meta = json.load(fh)
+    except FileNotFoundError:
+        raise UploadError('Subida no encontrada o expirada.', 404)
+    if meta['user_id'] != user_id:
+        raise UploadError('Subida no encontrada.', 404)
+    return meta
+
+
+@contextmanager
+def _locked(upload_id):
+    """Lock exclusivo de la subida entre procesos (meta.json se reemplaza, por eso va aparte)."""
+    try:
+        fh = open(os.path.join(_upload_dir(upload_id), 'lock'), 'a')
+    except FileNotFoundError:
+        raise UploadError('Subida no encontrada o expirada.', 404)
+    with fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        yield
+
+
+def _write_meta(meta):
+    directory = _upload_dir(meta['id'])
+    tmp = os.path.join(directory, 'meta.json.tmp')
+    with open(tmp, 'w') as fh:
+        json.dump(meta, fh)
+    os.replace(tmp, os.path.join(directory, 'meta.json'))
+
+
+def status(meta):
+    return {'id': meta['id'], 'filename': meta['filename'], 'size': meta['size'], 'offset': meta['offset'],
+            'chunk_size': current_app.config['UPLOAD_CHUNK_SIZE']}
+
+
+def purge_expired():
+    """Borra las subidas sin actividad desde hace más de UPLOAD_EXPIRY_HOURS."""
+    root = _root()
+    if not os.path.isdir(root):
+        return
+    cutoff = time.time() - current_app.config['UPLOAD_EXPIRY_HOURS'] * 3600
+    for name in os.listdir(root):
+        directory = os.path.join(root, name)
+        try:
+            if os.path.getmtime(directory) < cutoff:
+                shutil.rmtree(directory, ignore_errors=True)
+        except FileNotFoundError:
+            pass
+
+
+def _open_uploads(user_id):
+    root = _root()
+    count = 0
+    for name in os.listdir(root) if os.path.isdir(root) else ():
+        try:
+            with open(os.path.join(root, name, 'meta.json')) as fh:
+                count += json.load(fh)['user_id'] == user_id
+        except (FileNotFoundError, NotADirectoryError, ValueError, KeyError):
+            pass
+    return count
+
+
+def start_upload(user_id, filename, size, sha256=None):
+    """Crea una subida vacía y devuelve su estado."""
+    filename = secure_filename(filename or '')
+    if not filename:
+        raise UploadError('Nombre de archivo inválido.')
+    if not isinstance(size, int) or size <= 0:
+        raise UploadError('Tamaño de archivo inválido.')
+    if size > current_app.config['UPLOAD_MAX_SIZE']:
+        raise UploadError('El archivo supera el tamaño máximo permitido.', 413)
+
+    purge_expired()
+    if _open_uploads(user_id) >= current_app.config['UPLOAD_MAX_OPEN']:
+        raise UploadError('Tienes demasiadas subidas en curso; termina o cancela alguna.', 429)
+    meta = {'id': uuid.uuid4().hex, 'user_id': user_id, 'filename': filename, 'size': size,
+            'sha256': (sha256 or '').lower() or None, 'offset': 0, 'created': time.time()}
+    directory = _upload_dir(meta['id'])
+    os.makedirs(directory)
+    open(os.path.join(directory, 'data.part'), 'wb').close()
+    open(os.path.join(directory, 'lock'), 'wb').close()
+    _write_meta(meta)
+    return status(meta)
+
+
+def get_upload(upload_id, user_id):
+    return status(_read_meta(upload_id, user_id))
+
+
+def _check_offset(meta, offset, length):
+    if offset != meta['offset']:
+        raise UploadError('El offset no coincide con lo recibido.', 409, meta['offset'])
+    if offset + length > meta['size']:
+        raise UploadError('La parte excede el tamaño declarado del archivo.')
+
+
+def write_chunk(upload_id, user_id, offset, length, stream, checksum=None):
+    """Recibe una parte leyendo `stream` por bloques y devuelve el estado actualizado.
+
+    La parte se lee sin lock a un archivo temporal (un cliente lento no frena a los
+    demás) y solo si llegó completa y con el checksum correcto se agrega a data.part,
+    con el lock tomado y el offset vuelto a comprobar.
+    """
+    if length is None or length <= 0:
+        raise UploadError('Falta Content-Length de la parte.', 411)
+    if length > current_app.config['UPLOAD_CHUNK_SIZE']:
+        raise UploadError('La parte supera el tamaño permitido.', 413)
+    # Rechaza temprano un offset viejo, antes de leer el cuerpo
+    _check_offset(_read_meta(upload_id, user_id), offset, length)
+
+    directory = _upload_dir(upload_id)
+    try:
+        fd, chunk_path = tempfile.mkstemp(dir=directory, prefix='parte-')
+    except FileNotFoundError:
+        raise UploadError('Subida no encontrada o expirada.', 404)
+    try:
+        digest = hashlib.sha256()
+        received = 0
+        with os.fdopen(fd, 'wb') as chunk:
+            while received < length:
+                block = stream.read(min(READ_BLOCK, length - received))
+                if not block:
+                    break
+                digest.update(block)
+                chunk.write(block)
+                received += len(block)
+        if received != length:
+            raise UploadError('La parte llegó incompleta.', 400, offset)
+        if checksum and digest.hexdigest() != checksum.lower():
+            raise UploadError('El checksum de la parte no coincide.', 422, offset)
+
+        with _locked(upload_id):
+            # Otro request con la misma parte pudo terminar mientras se leía esta
+            meta = _read_meta(upload_id, user_id)
+            _check_offset(meta, offset, length)
+            with open(os.path.join(directory, 'data.part'), 'r+b') as fh, open(chunk_path, 'rb') as chunk:
+                # Solo un append que se cortó antes de actualizar meta.json deja bytes de más
+                fh.truncate(offset)
+                fh.seek(offset)
+                shutil.copyfileobj(chunk, fh, READ_BLOCK)
+            meta['offset'] = offset + length
+            _write_meta(meta)
+    finally:
+        if os.path.exists(chunk_path):
+            os.remove(chunk_path)
+    return status(meta)
+
+
+def cancel_upload(upload_id, user_id):
+    with _locked(upload_id):
+        _read_meta(upload_id, user_id)
+        shutil.rmtree(_upload_dir(upload_id), ignore_errors=True)
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        while block := fh.read(READ_BLOCK):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def finalize_upload(upload_id, user_id):
+    """Pasa el archivo ensamblado al almacén de blobs; devuelve (ruta relativa a static, nombre)."""
+    with _locked(upload_id):
+        meta = _read_meta(upload_id, user_id)
+        if meta['offset'] != meta['size']:
+            raise UploadError('La subida está incompleta.', 409, meta['offset'])
+        part = os.path.join(_upload_dir(upload_id), 'data.part')
+        if os.path.getsize(part) != meta['size']:
+            raise UploadError('El archivo ensamblado no tiene el tamaño declarado.', 409, meta['offset'])
+        if meta['sha256'] and _file_sha256(part) != meta['sha256']:
+            raise UploadError('El archivo recibido no coincide con el checksum declarado.', 422)
+
+        path = store_file(part, meta['filename'], move=True)
+        shutil.rmtree(_upload_dir(upload_id), ignore_errors=True)
+    return path, meta['filename']
+
+
+def receive_upload(user_id, allowed=None):
+    """(ruta en el almacén, nombre original) del archivo del formulario, o None si no hay.
+
+    Acepta una subida por partes ya completa (campo `upload_id`) o un campo `file`
+    clásico, que sigue limitado por MAX_CONTENT_LENGTH. `allowed` es un predicado
+    sobre el nombre de archivo.
+    """
+    upload_id = request.form.get('upload_id')
+    if upload_id:
+        filename = _read_meta(upload_id, user_id)['filename']
+        if allowed and not allowed(filename):
+            raise UploadError('Tipo de archivo no permitido.')
+        return finalize_upload(upload_id, user_id)
+
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return None
+    filename = secure_filename(file.filename)
+    if allowed and not allowed(filename):
+        raise UploadError('Tipo de archivo no permitido.')
+    return store_upload(file), filename
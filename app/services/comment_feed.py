@@ -0,0 +1,68 @@
+"""Feed incremental de comentarios de una tarea.
+
+La página de comentarios muestra los últimos COMMENTS_PAGE_SIZE y luego solo pide
+deltas: `?after=<id>` devuelve los comentarios más nuevos que ese id (304 si no hay
+ninguno) y `?before=<id>` una página de comentarios anteriores ("cargar anteriores").
+El cursor es el id del comentario: los ids crecen en orden de inserción, mientras que
+created_at mezcla horas UTC y locales según la ruta que creó el comentario.
+"""
+from flask import current_app, jsonify, render_template, request
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+from app import db
+from app.models import Comment
+
+# Tope de comentarios nuevos por respuesta incremental
+MAX_DELTA = 200
+
+
+def _fetch(task_id, *criteria, newest_first, limit):
+    stmt = (
+        select(Comment)
+        .options(joinedload(Comment.user))
+        .where(Comment.task_id == task_id, *criteria)
+        .order_by(Comment.id.desc() if newest_first else Comment.id.asc())
+        .limit(limit + 1)
+    )
+    rows = db.session.execute(stmt).scalars().all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return (rows[::-1] if newest_first else rows), more
+
+
+def recent_comments(task_id, before=None, limit=None):
+    """(comentarios en orden cronológico, hay_anteriores): la página más reciente o la anterior a `before`."""
+    limit = limit or current_app.config['COMMENTS_PAGE_SIZE']
+    criteria = (Comment.id < before,) if before else ()
+    return _fetch(task_id, *criteria, newest_first=True, limit=limit)
+
+
+def comments_after(task_id, after):
+    """Comentarios con id mayor que `after`, en orden cronológico."""
+    rows, _ = _fetch(task_id, Comment.id > after, newest_first=False, limit=MAX_DELTA)
+    return rows
+
+
+def feed_response(task_id, partial, var_name):
+    """Respuesta JSON del feed: html del parcial con los comentarios y los cursores.
+
+    `partial` es la plantilla que renderiza la lista y `var_name` el nombre de la
+    variable que espera.
+    """
+    after = request.args.get('after', type=int)
+    before = request.args.get('before', type=int)
+
+    if after is not None:
+        comments = comments_after(task_id, after)
+        if not comments:
+            return '', 304
+        has_older = None  # no cambia con un delta
+    else:
+        comments, has_older = recent_comments(task_id, before=before)
+
+    return jsonify(
+        html=render_template(partial, **{var_name: comments}),
+        newest=comments[-1].id if comments else after,
+        oldest=comments[0].id if comments else before,
+        has_older=has_older,
+    )
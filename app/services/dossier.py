@@ -0,0 +1,144 @@
+"""Dossier de un proyecto: ZIP con todos sus archivos, generado en streaming.
+
+El ZIP se escribe sobre un destino sin seek y cada bloque comprimido se entrega al
+cliente apenas se produce, así que la memoria del worker no depende del tamaño del
+dossier (un bloque de lectura más lo que zlib tenga pendiente). Los formatos que ya
+vienen comprimidos (fotos, PDF, zip, documentos de Office) se guardan sin volver a
+comprimir. Al final va `manifiesto.csv` con una fila por archivo.
+"""
+import csv
+import io
+import os
+import zipfile
+from datetime import datetime
+from sqlalchemy.orm import joinedload
+from app.models import IncidentReport, ProgressPhoto, ProjectDocument, ProjectProgress, TechnicalReport
+from app.services.blob_store import is_blob, resolve_upload
+
+CHUNK_SIZE = 1024 * 1024
+
+# Extensiones que ya vienen comprimidas: se guardan tal cual (ZIP_STORED)
+STORED_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic',
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar',
+    '.pdf', '.docx', '.xlsx', '.pptx', '.odt', '.ods',
+    '.mp3', '.mp4', '.mov', '.avi', '.mkv',
+}
+
+MANIFEST_HEADER = ['tipo', 'id', 'archivo_zip', 'ruta_original', 'bytes', 'fecha', 'autor', 'descripcion', 'estado']
+
+
+def _fecha(value):
+    return value.strftime('%Y-%m-%d %H:%M') if value else ''
+
+
+def dossier_entries(project, static_folder):
+    """[(nombre en el zip, fila del manifiesto, ruta en disco o None)] de todos los archivos del proyecto.
+
+    Se arma dentro del request; el generador del ZIP ya no toca la sesión.
+    """
+    entries = []
+
+    def add(folder, tipo, row_id, stored_path, fecha=None, autor='', descripcion='', name=None):
+        if not stored_path:
+            return
+        base = os.path.basename((name or stored_path).replace('\\', '/'))
+        if not name and is_blob(stored_path):
+            # Las rutas del almacén son <sha256>.<ext>: sin nombre original se usa el tipo
+            base = f'{tipo}{os.path.splitext(base)[1]}'
+        name = f"{row_id}_{base}"
+        entries.append((f'{folder}/{name}', {
+            'tipo': tipo, 'id': row_id, 'ruta_original': stored_path, 'fecha': _fecha(fecha),
+            'autor': autor or '', 'descripcion': descripcion or '',
+        }, resolve_upload(static_folder, stored_path)))
+
+    add('proyecto', 'cronograma', project.id, project.schedule_file)
+    add('proyecto', 'presupuesto', project.id, project.budget_file)
+
+    for doc in ProjectDocument.query.options(joinedload(ProjectDocument.user)).filter_by(project_id=project.id).order_by(ProjectDocument.id):
+        add('documentos', 'documento', doc.id, doc.file_path, doc.upload_date,
+            doc.user.nombre if doc.user else '', doc.description, name=doc.file_name)
+
+    for rep in TechnicalReport.query.options(joinedload(TechnicalReport.user)).filter_by(project_id=project.id).order_by(TechnicalReport.id):
+        autor = rep.user.nombre if rep.user else ''
+        add('reportes', 'reporte_adjunto', rep.id, rep.attachment_path, rep.created_at, autor, rep.title,
+            name=rep.attachment_name)
+        add('reportes', 'reporte_evidencia', rep.id, rep.evidence_photos, rep.created_at, autor, rep.title)
+
+    photos = (
+        ProgressPhoto.query
+        .join(ProjectProgress, ProjectProgress.id == ProgressPhoto.progress_id)
+        .filter(ProjectProgress.project_id == project.id)
+        .order_by(ProgressPhoto.id)
+        .add_entity(ProjectProgress)
+        .options(joinedload(ProjectProgress.user))
+    )
+    for photo, avance in photos:
+        add(f'avances/{avance.id}', 'foto_avance', photo.id, photo.file_path, photo.upload_date,
+            avance.user.nombre if avance.user else '', avance.description)
+
+    for inc in IncidentReport.query.filter_by(project_id=project.id).order_by(IncidentReport.id):
+        add('incidencias', 'incidencia_foto', inc.id, inc.photo_path, inc.report_datetime,
+            inc.reporter_name, inc.incident_type)
+        add('incidencias', 'incidencia_adjunto', inc.id, inc.attachment_path, inc.report_datetime,
+            inc.reporter_name, inc.incident_type, name=inc.attachment_name)
+
+    return entries
+
+
+class _StreamSink(io.RawIOBase):
+    """Destino sin seek para ZipFile: acumula lo escrito hasta que el generador lo retira."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_dossier(entries):
+    """Generador de bytes del ZIP con los archivos de `entries` y el manifiesto."""
+    sink = _StreamSink()
+    manifest = io.StringIO()
+    writer = csv.DictWriter(manifest, fieldnames=MANIFEST_HEADER)
+    writer.writeheader()
+
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        for arcname, row, path in entries:
+            if path is None:
+                writer.writerow({**row, 'archivo_zip': '', 'bytes': '', 'estado': 'faltante'})
+                continue
+
+            size = os.path.getsize(path)
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            if os.path.splitext(path)[1].lower() in STORED_EXTENSIONS:
+                info.compress_type = zipfile.ZIP_STORED
+            else:
+                info.compress_type = zipfile.ZIP_DEFLATED
+
+            with open(path, 'rb') as src, zf.open(info, 'w', force_zip64=size > zipfile.ZIP64_LIMIT // 2) as dest:
+                while chunk := src.read(CHUNK_SIZE):
+                    dest.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+            writer.writerow({**row, 'archivo_zip': arcname, 'bytes': size, 'estado': 'incluido'})
+
+        info = zipfile.ZipInfo('manifiesto.csv', datetime.now().timetuple()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        zf.writestr(info, manifest.getvalue().encode('utf-8-sig'))
+    # Al cerrar se escribe el directorio central
+    yield sink.drain()
@@ -0,0 +1,94 @@
+"""Entrega de archivos del disco: documentos, adjuntos, evidencias, PDF y manuales.
+
+Con DOWNLOAD_OFFLOAD definido, la vista solo valida permisos y arma los headers; la
+transferencia la hace el proxy de adelante y el worker de gunicorn queda libre:
+
+- 'X-Accel-Redirect' (nginx): se responde con la URI interna que corresponde al
+  archivo según DOWNLOAD_ACCEL_LOCATIONS, por ejemplo
+
+      location /_protegido/static/ { internal; alias /srv/construdesk/app/static/; }
+      location /_protegido/cache/  { internal; alias /srv/construdesk/cache/; }
+
+- 'X-Sendfile' o 'X-LIGHTTPD-send-file' (Apache mod_xsendfile, lighttpd): se
+  responde con la ruta absoluta en ese header.
+
+El proxy resuelve Range, ETag y If-Modified-Since por su cuenta. Sin proxy (o si el
+archivo no cae en ninguna ubicación configurada) la respuesta sale del propio worker,
+condicional: ETag (el SHA-256 para los blobs), 304, Range con 206 y 416. gunicorn
+manda el cuerpo con sendfile(2), también el de un rango: el archivo se entrega ya
+posicionado en el byte inicial y gunicorn corta en el Content-Length.
+"""
+import os
+import re
+from urllib.parse import quote
+from flask import current_app, request
+from werkzeug.utils import send_file as werkzeug_send_file
+
+READ_BLOCK = 1024 * 1024
+SHA256_NAME = re.compile(r'^[0-9a-f]{64}$')
+
+
+def _accel_uri(path):
+    """URI interna de nginx para `path`, o None si no está bajo ninguna ubicación."""
+    for prefix, root in current_app.config['DOWNLOAD_ACCEL_LOCATIONS'].items():
+        root = os.path.realpath(root)
+        if os.path.commonpath([path, root]) == root:
+            relative = os.path.relpath(path, root).replace(os.sep, '/')
+            return prefix.rstrip('/') + '/' + quote(relative)
+    return None
+
+
+def _etag(path):
+    # Los blobs se llaman por su SHA-256: es un ETag fuerte que no depende del mtime
+    stem = os.path.basename(path).split('.', 1)[0]
+    return stem if SHA256_NAME.match(stem) else True
+
+
+def _sendfile_range(response, path):
+    """206 servido por gunicorn con sendfile: archivo posicionado en el inicio del rango.
+
+    werkzeug envuelve la respuesta parcial en un iterador que lee por bloques; gunicorn
+    en cambio usa sendfile(2) con cualquier file_wrapper y respeta el offset del archivo
+    y el Content-Length. Otros servidores no garantizan el corte, así que quedan con el
+    iterador de werkzeug.
+    """
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    if not file_wrapper or not request.environ.get('SERVER_SOFTWARE', '').startswith('gunicorn'):
+        return response
+    fh = open(path, 'rb')
+    fh.seek(response.content_range.start)
+    previous = response.response
+    response.response = file_wrapper(fh, READ_BLOCK)
+    previous.close()
+    return response
+
+
+def send_download(path, download_name=None, as_attachment=True, mimetype=None, etag=None, max_age=None):
+    """Respuesta para el archivo en `path` (ruta absoluta, ya validada por la vista)."""
+    path = os.path.realpath(path)
+    header = current_app.config['DOWNLOAD_OFFLOAD']
+    target = None
+    if header:
+        target = _accel_uri(path) if header.lower() == 'x-accel-redirect' else path
+
+    response = werkzeug_send_file(
+        path,
+        request.environ,
+        mimetype=mimetype,
+        as_attachment=as_attachment,
+        download_name=download_name,
+        # Con proxy, las condiciones y los rangos los resuelve él sobre el archivo real
+        conditional=target is None,
+        etag=etag or _etag(path),
+        max_age=max_age,
+        use_x_sendfile=target is not None,
+        response_class=current_app.response_class,
+    )
+    if target is not None:
+        del response.headers['X-Sendfile']
+        response.headers[header] = target
+    else:
+        response.accept_ranges = 'bytes'
+        if response.status_code == 206:
+            response = _sendfile_range(response, path)
+    return response
@@ -0,0 +1,246 @@
+"""Canal de eventos en vivo (Server-Sent Events) por usuario.
+
+Publicación: un listener after_flush detecta notificaciones nuevas, cambios de estado
+de flujos y tareas y comentarios nuevos, y los inserta en `stream_events` dentro de la
+misma transacción. Si la transacción se revierte, los eventos desaparecen con ella.
+
+Reparto: cada proceso tiene un EventBus con un hilo que lee los eventos nuevos de la
+tabla y los entrega a los streams suscritos a su canal (`user:<id>` o `task:<id>`).
+Un commit en el mismo proceso despierta al hilo de inmediato; los commits de otros
+workers se ven en la siguiente lectura (EVENTS_POLL_INTERVAL). Es una sola consulta
+por proceso, no una por cliente conectado. Con workers gevent el hilo y las colas son
+los parcheados por gevent.
+
+El cliente reanuda con Last-Event-ID (el id de la fila). Cada stream envía un
+heartbeat cada EVENTS_HEARTBEAT segundos y se cierra a los EVENTS_STREAM_MAX_AGE para
+liberar el worker; EventSource reconecta solo.
+"""
+import json
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, event, func, insert, inspect, select
+from app import db
+from app.models import ApprovalFlow, Comment, Project, ProjectTask, StreamEvent, SystemNotification
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def task_channel(task_id):
+    return f'task:{task_id}'
+
+
+# --- Publicación ---------------------------------------------------------------
+
+def _status_changed(obj):
+    return inspect(obj).attrs.status.history.has_changes()
+
+
+def _project_creators(connection, task_ids):
+    """{task_id: creator_id del proyecto de la tarea}."""
+    if not task_ids:
+        return {}
+    rows = connection.execute(
+        select(ProjectTask.id, Project.creator_id)
+        .join(Project, Project.id == ProjectTask.project_id)
+        .where(ProjectTask.id.in_(task_ids))
+    )
+    return dict(rows.all())
+
+
+def collect_events(session):
+    """[(canal, evento, datos)] de los cambios pendientes en la sesión."""
+    events = []
+    for obj in session.new:
+        if isinstance(obj, SystemNotification) and obj.user_id:
+            events.append((user_channel(obj.user_id), 'notificacion',
+                           {'id': obj.id, 'title': obj.title, 'message': obj.message}))
+        elif isinstance(obj, Comment) and obj.task_id:
+            events.append((task_channel(obj.task_id), 'comentario', {'id': obj.id, 'task_id': obj.task_id}))
+
+    changed = [obj for obj in session.dirty
+               if isinstance(obj, (ApprovalFlow, ProjectTask)) and _status_changed(obj)]
+    if not changed:
+        return events
+
+    task_ids = {obj.id for obj in changed if isinstance(obj, ProjectTask)}
+    creators = _project_creators(session.connection(), task_ids)
+    for obj in changed:
+        data = {'id': obj.id, 'name': obj.name, 'status': obj.status}
+        if isinstance(obj, ApprovalFlow):
+            # Al creador del proyecto ya le llega la notificación de actualizar_flujo
+            if obj.responsible_id:
+                events.append((user_channel(obj.responsible_id), 'flujo', data))
+        else:
+            for user_id in {obj.responsible_user_id, creators.get(obj.id)} - {None}:
+                events.append((user_channel(user_id), 'tarea', data))
+    return events
+
+
+def _publish_after_flush(session, flush_context):
+    events = collect_events(session)
+    if not events:
+        return
+    now = datetime.utcnow()
+    session.connection().execute(insert(StreamEvent), [
+        {'channel': channel, 'event': name, 'data': json.dumps(data), 'created_at': now}
+        for channel, name, data in events
+    ])
+    session.info['stream_events'] = True
+
+
+def _wake_after_commit(session):
+    if session.info.pop('stream_events', False):
+        event_bus.wake()
+
+
+def _discard_after_rollback(session, previous_transaction):
+    session.info.pop('stream_events', None)
+
+
+def register_event_listeners():
+    for name, listener in (('after_flush', _publish_after_flush),
+                           ('after_commit', _wake_after_commit),
+                           ('after_soft_rollback', _discard_after_rollback)):
+        if not event.contains(db.session, name, listener):
+            event.listen(db.session, name, listener)
+
+
+# --- Reparto -------------------------------------------------------------------
+
+def fetch_events(connection, channels, after_id, limit=500):
+    """Eventos de esos canales con id mayor que `after_id`, en orden."""
+    return connection.execute(
+        select(StreamEvent.id, StreamEvent.channel, StreamEvent.event, StreamEvent.data)
+        .where(StreamEvent.channel.in_(channels), StreamEvent.id > after_id)
+        .order_by(StreamEvent.id)
+        .limit(limit)
+    ).all()
+
+
+def format_event(row):
+    return f'id: {row.id}\nevent: {row.event}\ndata: {row.data}\n\n'
+
+
+class Subscription:
+    def __init__(self, channels):
+        self.channels = frozenset(channels)
+        self.queue = queue.Queue()
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._subscribers = {}  # canal -> {Subscription}
+        self._thread = None
+        self._last_id = 0
+        self._last_prune = 0.0
+        self.engine = None
+
+    def init_app(self, app):
+        self.config = app.config
+        with app.app_context():
+            self.engine = db.engine
+
+    def wake(self):
+        self._wake.set()
+
+    def subscribe(self, channels):
+        sub = Subscription(channels)
+        with self._lock:
+            if not self._subscribers:
+                # Sin suscriptores el hilo no lee la tabla: se parte desde el último evento
+                with self.engine.connect() as conn:
+                    self._last_id = conn.execute(select(func.coalesce(func.max(StreamEvent.id), 0))).scalar()
+            for channel in sub.channels:
+                self._subscribers.setdefault(channel, set()).add(sub)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='event-bus', daemon=True)
+                self._thread.start()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            for channel in sub.channels:
+                subs = self._subscribers.get(channel)
+                if subs is not None:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._subscribers[channel]
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.config['EVENTS_POLL_INTERVAL'])
+            self._wake.clear()
+            try:
+                self._dispatch()
+                self._prune()
+            except Exception:
+                # Un error de la BD no debe matar el hilo: se reintenta en la próxima vuelta
+                time.sleep(self.config['EVENTS_POLL_INTERVAL'])
+
+    def _dispatch(self):
+        with self._lock:
+            if not self._subscribers:
+                return
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(StreamEvent.id, StreamEvent.channel, StreamEvent.event, StreamEvent.data)
+                .where(StreamEvent.id > self._last_id)
+                .order_by(StreamEvent.id)
+            ).all()
+        if not rows:
+            return
+        self._last_id = rows[-1].id
+        with self._lock:
+            for row in rows:
+                for sub in self._subscribers.get(row.channel, ()):
+                    sub.queue.put(row)
+
+    def _prune(self):
+        """Borra los eventos más viejos que EVENTS_RETENTION_HOURS (a lo sumo una vez por hora)."""
+        if time.monotonic() - self._last_prune < 3600:
+            return
+        self._last_prune = time.monotonic()
+        cutoff = datetime.utcnow() - timedelta(hours=self.config['EVENTS_RETENTION_HOURS'])
+        with self.engine.begin() as conn:
+            conn.execute(delete(StreamEvent).where(StreamEvent.created_at < cutoff))
+
+    def stream(self, channels, last_event_id=None):
+        """Generador SSE para esos canales; no usa db.session (corre fuera del request)."""
+        sub = self.subscribe(channels)
+        heartbeat = self.config['EVENTS_HEARTBEAT']
+        deadline = time.monotonic() + self.config['EVENTS_STREAM_MAX_AGE']
+        try:
+            yield f'retry: {self.config["EVENTS_RETRY_MS"]}\n\n'
+
+            # Reanudación: lo que quedó pendiente desde Last-Event-ID
+            delivered = last_event_id or 0
+            if last_event_id is not None:
+                with self.engine.connect() as conn:
+                    for row in fetch_events(conn, list(sub.channels), last_event_id):
+                        delivered = row.id
+                        yield format_event(row)
+
+            while time.monotonic() < deadline:
+                row = sub.get(timeout=heartbeat)
+                if row is None:
+                    yield ': heartbeat\n\n'
+                elif row.id > delivered:
+                    delivered = row.id
+                    yield format_event(row)
+        finally:
+            self.unsubscribe(sub)
+
+
+event_bus = EventBus()
@@ -0,0 +1,158 @@
+"""Caché de identidad para el user_loader de Flask-Login.
+
+Carga el usuario y sus roles con una sola consulta (JOIN) y guarda una copia
+desligada de la sesión en un LRU con TTL, indexado por id de usuario. En cada
+request se devuelve un `merge(load=False)` de esa copia: queda ligado a la sesión
+actual sin volver a consultar la base de datos.
+
+Invalidación entre procesos: al hacer flush de un AdminUser modificado (datos o
+roles) o borrado se inserta una fila en `stream_events` (canal `identity`) en la misma
+transacción; tras el commit, el proceso que hizo el cambio olvida al usuario en el
+acto. Los demás procesos recuerdan la última fila del canal que vieron y, a lo sumo
+cada IDENTITY_CACHE_CHECK segundos, tratan un acierto como si fuera un fallo: la
+consulta que vuelve a cargar al usuario trae también los ids invalidados desde
+entonces. Así ningún request hace más consultas que con la caché vacía.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event, func, literal, select
+from sqlalchemy.orm import Session, joinedload
+from app import db
+from app.models import AdminUser, StreamEvent
+
+# session.info: usuarios que hay que olvidar cuando la transacción haga commit
+PENDING_KEY = 'identity_invalidate'
+
+# Canal de stream_events con los usuarios que cada proceso debe olvidar
+IDENTITY_CHANNEL = 'identity'
+
+
+class IdentityCache:
+    def __init__(self, maxsize=512, ttl=60, check_interval=2):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_event_id = None  # última fila del canal identity ya aplicada
+        self._checked_at = 0.0
+
+    def init_app(self, app):
+        self.maxsize = app.config.get('IDENTITY_CACHE_SIZE', self.maxsize)
+        self.ttl = app.config.get('IDENTITY_CACHE_TTL', self.ttl)
+        self.check_interval = app.config.get('IDENTITY_CACHE_CHECK', self.check_interval)
+        self.clear()
+        for name, listener in (('before_flush', _publish_before_flush),
+                               ('after_commit', _invalidate_after_commit),
+                               ('after_soft_rollback', _discard_after_rollback)):
+            if not event.contains(db.session, name, listener):
+                event.listen(db.session, name, listener)
+
+    def get(self, user_id):
+        """Copia en caché del usuario, o None si no está o ya venció."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return user
+
+    def put(self, user_id, user):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        """Olvida al usuario solo en este proceso."""
+        with self._lock:
+            self._entries.pop(int(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._last_event_id = None
+
+    def _check_due(self):
+        """True si toca leer las invalidaciones de otros procesos (lo marca como hecho)."""
+        with self._lock:
+            if self._last_event_id is None or time.monotonic() - self._checked_at < self.check_interval:
+                return False
+            self._checked_at = time.monotonic()
+            return True
+
+    def load(self, user_id):
+        """Usuario ligado a la sesión actual, con sus roles ya cargados."""
+        cached = self.get(user_id)
+        if cached is not None and not self._check_due():
+            return db.session.merge(cached, load=False)
+
+        with self._lock:
+            since = self._last_event_id
+        last_event = (
+            select(func.coalesce(func.max(StreamEvent.id), 0))
+            .where(StreamEvent.channel == IDENTITY_CHANNEL)
+            .scalar_subquery()
+        )
+        if since is None:
+            invalidated = literal('[]')
+        else:
+            invalidated = (
+                select(func.json_group_array(func.json_extract(StreamEvent.data, '$.id')))
+                .where(StreamEvent.channel == IDENTITY_CHANNEL, StreamEvent.id > since)
+                .scalar_subquery()
+            )
+
+        # Sesión propia: al cerrarla, usuario y roles quedan desligados y con sus
+        # atributos cargados, sin que el commit de la request pueda expirarlos.
+        with Session(db.engine) as session:
+            row = session.execute(
+                select(AdminUser, last_event, invalidated)
+                .options(joinedload(AdminUser.roles))
+                .where(AdminUser.id == user_id)
+            ).unique().first()
+        if row is None:
+            return None
+        user, last_id, invalidated_ids = row
+
+        with self._lock:
+            for invalid_id in json.loads(invalidated_ids):
+                self._entries.pop(invalid_id, None)
+            if self._last_event_id is None or last_id > self._last_event_id:
+                self._last_event_id = last_id
+            if since is None:
+                self._checked_at = time.monotonic()
+        self.put(user_id, user)
+        return db.session.merge(user, load=False)
+
+
+identity_cache = IdentityCache()
+
+
+def _publish_before_flush(session, flush_context, instances):
+    changed = [obj for obj in session.dirty if isinstance(obj, AdminUser) and session.is_modified(obj)]
+    changed += [obj for obj in session.deleted if isinstance(obj, AdminUser)]
+    if not changed:
+        return
+    pending = session.info.setdefault(PENDING_KEY, set())
+    for user in changed:
+        if user.id not in pending:
+            pending.add(user.id)
+            session.add(StreamEvent(channel=IDENTITY_CHANNEL, event='invalidar',
+                                    data=json.dumps({'id': user.id})))
+
+
+def _invalidate_after_commit(session):
+    for user_id in session.info.pop(PENDING_KEY, ()):
+        identity_cache.invalidate(user_id)
+
+
+def _discard_after_rollback(session, previous_transaction):
+    session.info.pop(PENDING_KEY, None)
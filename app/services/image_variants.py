@@ -0,0 +1,170 @@
+"""Derivados de las fotos de avances e incidencias: miniatura y tamaño medio.
+
+Por cada foto se generan, junto al original, `<nombre>.thumb.{webp,jpg}` (recorte
+cuadrado de THUMB_SIZE px) y `<nombre>.medium.{webp,jpg}` (lado mayor de MEDIUM_SIZE
+px, sin ampliar), con la rotación EXIF ya aplicada. Las listas muestran esos
+derivados con srcset y carga diferida; el original solo se descarga al abrir la foto.
+
+El trabajo va a la cola (app/services/jobs.py) en la misma transacción que las fotos,
+así que el request no espera a Pillow. Mientras los derivados no existen,
+`photo_sources` cae al original. `flask images generate` genera los que falten para
+las fotos ya subidas.
+"""
+import os
+import tempfile
+import click
+from flask import current_app, url_for
+from flask.cli import AppGroup
+from PIL import Image, ImageOps, UnidentifiedImageError
+from sqlalchemy import select
+from app import db
+from app.models import IncidentReport, ProgressPhoto
+from app.services.jobs import PRIORITY_HIGH, enqueue, task
+
+THUMB_SIZE = 320
+MEDIUM_SIZE = 1280
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.jfif', '.png', '.webp', '.gif', '.bmp', '.tif', '.tiff'}
+
+# (extensión, formato de Pillow, opciones de guardado)
+FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+
+
+def is_image(path):
+    return bool(path) and os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+
+
+def variant_path(path, variant, extension):
+    """Ruta del derivado, junto al original: fotos/obra.jpg -> fotos/obra.thumb.webp."""
+    return f'{os.path.splitext(path)[0]}.{variant}.{extension}'
+
+
+def _save_atomic(image, target, fmt, options):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            image.save(fh, fmt, **options)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, target)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _flatten(image):
+    """RGB sobre fondo blanco (JPEG no tiene transparencia)."""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_variants(source):
+    """Genera los derivados de `source` (ruta absoluta). Corre en el pool, sin contexto de app."""
+    with Image.open(source) as original:
+        # JPEG: decodifica directo a una escala reducida cercana a la mayor salida
+        original.draft('RGB', (MEDIUM_SIZE, MEDIUM_SIZE))
+        image = _flatten(ImageOps.exif_transpose(original))
+
+    variants = {
+        'thumb': ImageOps.fit(image, (THUMB_SIZE, THUMB_SIZE), Image.LANCZOS),
+        'medium': image.copy(),
+    }
+    variants['medium'].thumbnail((MEDIUM_SIZE, MEDIUM_SIZE), Image.LANCZOS)
+
+    # El medium.jpg se escribe al final: su existencia indica que están todos
+    for name in ('thumb', 'medium'):
+        for extension, fmt, options in FORMATS:
+            _save_atomic(variants[name], variant_path(source, name, extension), fmt, options)
+
+
+class ImageVariants:
+    def init_app(self, app):
+        app.jinja_env.globals['photo_sources'] = photo_sources
+        app.cli.add_command(images_cli)
+
+    def schedule(self, *paths):
+        """Encola los derivados de las fotos (rutas relativas a static) que aún no los tienen.
+
+        Va antes del commit: el trabajo se guarda en la misma transacción que las fotos.
+        """
+        pending = []
+        for path in paths:
+            if not is_image(path):
+                continue
+            source = os.path.join(current_app.static_folder, path)
+            if os.path.exists(source) and not os.path.exists(variant_path(source, 'medium', 'jpg')):
+                pending.append(path)
+        if pending:
+            enqueue('imagenes.derivados', {'paths': pending})
+
+
+@task('imagenes.derivados', priority=PRIORITY_HIGH)
+def generate_variants(paths):
+    # Una imagen que Pillow no puede abrir no mejora con reintentos: se registra y se sigue
+    for path in paths:
+        source = os.path.join(current_app.static_folder, path)
+        try:
+            render_variants(source)
+        except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+            current_app.logger.warning('No se pudieron generar los derivados de %s', source, exc_info=True)
+
+
+image_variants = ImageVariants()
+
+
+def photo_sources(path, thumb=True):
+    """URLs para mostrar una foto: src, srcset WebP/JPEG (None sin derivados) y original.
+
+    Con `thumb=False` no se ofrece la miniatura, que va recortada al cuadrado: es para
+    las vistas que muestran la foto completa.
+    """
+    original = url_for('static', filename=path)
+    sources = {'src': original, 'webp': None, 'jpg': None, 'original': original}
+    if not is_image(path):
+        return sources
+    if not os.path.exists(os.path.join(current_app.static_folder, variant_path(path, 'medium', 'jpg'))):
+        return sources
+
+    widths = (('thumb', THUMB_SIZE), ('medium', MEDIUM_SIZE)) if thumb else (('medium', MEDIUM_SIZE),)
+
+    def srcset(extension):
+        return ', '.join(
+            f"{url_for('static', filename=variant_path(path, name, extension))} {width}w"
+            for name, width in widths
+        )
+
+    sources.update(
+        src=url_for('static', filename=variant_path(path, widths[0][0], 'jpg')),
+        webp=srcset('webp'),
+        jpg=srcset('jpg'),
+    )
+    return sources
+
+
+images_cli = AppGroup('images', help='Derivados de las fotos subidas.')
+
+
+@images_cli.command('generate')
+def generate_command():
+    """Genera (en este proceso) los derivados que falten de fotos de avances e incidencias."""
+    paths = set(db.session.scalars(select(ProgressPhoto.file_path)).all())
+    paths |= set(db.session.scalars(select(IncidentReport.photo_path).where(IncidentReport.photo_path.isnot(None))).all())
+    done, failed = 0, 0
+    for path in sorted(p for p in paths if is_image(p)):
+        source = os.path.join(current_app.static_folder, path.replace('\\', '/'))
+        if not os.path.exists(source) or os.path.exists(variant_path(source, 'medium', 'jpg')):
+            continue
+        try:
+            render_variants(source)
+            done += 1
+        except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as error:
+            click.echo(f'✗ {path}: {error}', err=True)
+            failed += 1
+    click.echo(f'{done} fotos procesadas, {failed} con error')
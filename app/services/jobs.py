@@ -0,0 +1,303 @@
+"""Cola de trabajos en segundo plano guardada en la base de la aplicación.
+
+Los efectos lentos de un request (miniaturas, PDF, extracción de texto, borrado de
+archivos) se encolan con `enqueue` dentro de la misma transacción que el cambio que
+los origina: si el request hace rollback, el trabajo desaparece con él. Cada tarea se
+registra con `@task(nombre)` junto al código que la implementa y recibe los
+argumentos del payload (JSON) como keywords.
+
+Un worker toma el trabajo listo de mayor prioridad con un UPDATE ... RETURNING, así
+que varios workers (y procesos) pueden compartir la tabla sin repartirse dos veces el
+mismo. Si la tarea falla se reintenta con backoff exponencial (JOB_BACKOFF_BASE,
+JOB_BACKOFF_MAX) hasta max_attempts y después queda como 'fallido' con el error. Un
+trabajo 'en_curso' por más de JOB_LOCK_TIMEOUT segundos es de un worker que murió y
+vuelve a la cola. Con `key` (clave de idempotencia) el mismo trabajo no se encola dos
+veces mientras siga en la tabla; los completados se purgan a los JOB_RETENTION_DAYS.
+
+No hay broker: `flask worker` corre el ciclo en su propio proceso. Con JOBS_INLINE
+cada proceso web además arranca un hilo tras el commit que vacía la cola y termina, de
+modo que la app funciona igual sin el worker aparte.
+"""
+import json
+import os
+import random
+import signal
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+from sqlalchemy import case, delete, event, func, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app import db
+from app.models import Job
+
+PENDING, RUNNING, DONE, FAILED = 'pendiente', 'en_curso', 'completado', 'fallido'
+PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW = 10, 0, -10
+
+ENQUEUED_KEY = 'jobs_enqueued'
+ERROR_CHARS = 4000
+MAINTENANCE_INTERVAL = 60
+
+
+class Task:
+    def __init__(self, name, func, priority, max_attempts):
+        self.name = name
+        self.func = func
+        self.priority = priority
+        self.max_attempts = max_attempts
+
+
+TASKS = {}
+
+
+def task(name, priority=PRIORITY_NORMAL, max_attempts=5):
+    """Registra la función como tarea de la cola con el nombre `name`."""
+    def decorator(func):
+        TASKS[name] = Task(name, func, priority, max_attempts)
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, priority=None, key=None, delay=0, session=None):
+    """Encola la tarea `name` en la transacción en curso; no hace commit.
+
+    `session` es para encolar desde un listener de la sesión (after_flush), donde no se
+    puede usar db.session. Con `key`, si ya existe un trabajo con esa clave no se hace nada.
+    """
+    spec = TASKS[name]
+    session = session or db.session
+    now = datetime.utcnow()
+    stmt = sqlite_insert(Job).values(
+        task=name,
+        payload=json.dumps(payload or {}),
+        priority=spec.priority if priority is None else priority,
+        status=PENDING,
+        attempts=0,
+        max_attempts=spec.max_attempts,
+        run_at=now + timedelta(seconds=delay),
+        idempotency_key=key,
+        created_at=now,
+    )
+    if key is not None:
+        stmt = stmt.on_conflict_do_nothing(index_elements=['idempotency_key'])
+    session.connection().execute(stmt)
+    session.info[ENQUEUED_KEY] = True
+
+
+# --- Worker ----------------------------------------------------------------------
+
+class Worker:
+    """Ciclo que toma y ejecuta trabajos; `run(until_idle=True)` vuelve cuando no quedan."""
+
+    def __init__(self, app, name=None):
+        self.app = app
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.poll_interval = app.config['JOB_POLL_INTERVAL']
+        self.backoff_base = app.config['JOB_BACKOFF_BASE']
+        self.backoff_max = app.config['JOB_BACKOFF_MAX']
+        self.lock_timeout = app.config['JOB_LOCK_TIMEOUT']
+        self.retention = timedelta(days=app.config['JOB_RETENTION_DAYS'])
+        self.stop = threading.Event()
+        self._maintained_at = 0
+
+    def _maintenance(self):
+        if time.monotonic() - self._maintained_at < MAINTENANCE_INTERVAL:
+            return
+        self._maintained_at = time.monotonic()
+        now = datetime.utcnow()
+        # Trabajos de un worker que murió a mitad de camino
+        db.session.execute(
+            update(Job)
+            .where(Job.status == RUNNING, Job.locked_at < now - timedelta(seconds=self.lock_timeout))
+            .values(
+                status=case((Job.attempts >= Job.max_attempts, FAILED), else_=PENDING),
+                locked_by=None,
+                last_error='El worker que lo ejecutaba no terminó',
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.session.execute(
+            delete(Job)
+            .where(Job.status == DONE, Job.finished_at < now - self.retention)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+    def _claim(self):
+        now = datetime.utcnow()
+        ready = (
+            select(Job.id)
+            .where(Job.status == PENDING, Job.run_at <= now)
+            .order_by(Job.priority.desc(), Job.run_at, Job.id)
+            .limit(1)
+            .scalar_subquery()
+        )
+        job = db.session.execute(
+            update(Job)
+            .where(Job.id == ready, Job.status == PENDING)
+            .values(status=RUNNING, attempts=Job.attempts + 1, locked_by=self.name, locked_at=now)
+            .returning(Job.id, Job.task, Job.payload, Job.attempts, Job.max_attempts)
+            .execution_options(synchronize_session=False)
+        ).first()
+        db.session.commit()
+        return job
+
+    def _backoff(self, attempts):
+        seconds = min(self.backoff_base * 2 ** (attempts - 1), self.backoff_max)
+        return timedelta(seconds=seconds * random.uniform(0.8, 1.2))
+
+    def _execute(self, job):
+        spec = TASKS.get(job.task)
+        try:
+            if spec is None:
+                raise LookupError(f'Tarea no registrada: {job.task}')
+            spec.func(**json.loads(job.payload))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            error = traceback.format_exc()[-ERROR_CHARS:]
+            retry = spec is not None and job.attempts < job.max_attempts
+            self.app.logger.warning('Trabajo %s (%s) falló, intento %s de %s', job.id, job.task,
+                                    job.attempts, job.max_attempts, exc_info=True)
+            now = datetime.utcnow()
+            values = (
+                {'status': PENDING, 'run_at': now + self._backoff(job.attempts)} if retry
+                else {'status': FAILED, 'finished_at': now}
+            )
+            values['last_error'] = error
+        else:
+            values = {'status': DONE, 'finished_at': datetime.utcnow(), 'last_error': None}
+        db.session.execute(
+            update(Job).where(Job.id == job.id).values(locked_by=None, **values)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+    def run(self, until_idle=False):
+        while not self.stop.is_set():
+            with self.app.app_context():
+                self._maintenance()
+                job = self._claim()
+                if job is not None:
+                    self._execute(job)
+                    continue
+                next_run = db.session.scalar(select(func.min(Job.run_at)).where(Job.status == PENDING))
+            if next_run is None and until_idle:
+                return
+            wait = self.poll_interval
+            if next_run is not None:
+                wait = min(wait, max((next_run - datetime.utcnow()).total_seconds(), 0))
+            self.stop.wait(wait)
+
+
+class JobQueue:
+    def __init__(self):
+        self.inline = False
+        self._thread = None
+        self._kicked = False
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.inline = app.config['JOBS_INLINE']
+        register_job_listeners()
+        app.cli.add_command(worker_command)
+        app.cli.add_command(jobs_cli)
+
+    def kick(self, app):
+        """Asegura un hilo de este proceso vaciando la cola (modo JOBS_INLINE)."""
+        with self._lock:
+            if self._thread is not None:
+                self._kicked = True
+                return
+            self._thread = threading.Thread(target=self._drain, args=(app,), name='jobs-inline', daemon=True)
+            self._thread.start()
+
+    def _drain(self, app):
+        worker = Worker(app, name=f'{socket.gethostname()}:{os.getpid()}:inline')
+        while True:
+            with self._lock:
+                self._kicked = False
+            try:
+                worker.run(until_idle=True)
+            except Exception:
+                app.logger.exception('Falló el hilo de la cola de trabajos')
+            # Un commit que llegó mientras el hilo terminaba lo vuelve a poner a trabajar
+            with self._lock:
+                if not self._kicked:
+                    self._thread = None
+                    return
+
+
+job_queue = JobQueue()
+
+
+def _kick_after_commit(session):
+    if session.info.pop(ENQUEUED_KEY, False) and job_queue.inline:
+        job_queue.kick(current_app._get_current_object())
+
+
+def _discard_after_rollback(session, previous_transaction):
+    session.info.pop(ENQUEUED_KEY, None)
+
+
+def register_job_listeners():
+    for name, listener in (('after_commit', _kick_after_commit),
+                           ('after_soft_rollback', _discard_after_rollback)):
+        if not event.contains(db.session, name, listener):
+            event.listen(db.session, name, listener)
+
+
+# --- CLI -------------------------------------------------------------------------
+
+@click.command('worker')
+@click.option('--once', is_flag=True, help='Vacía la cola y termina.')
+@with_appcontext
+def worker_command(once):
+    """Ejecuta los trabajos de la cola hasta recibir SIGINT o SIGTERM."""
+    app = current_app._get_current_object()
+    # Este proceso ya es el worker: sus commits no arrancan el hilo inline
+    job_queue.inline = False
+    worker = Worker(app)
+
+    def shutdown(signum, frame):
+        click.echo('Terminando después del trabajo en curso…')
+        worker.stop.set()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+    click.echo(f'Worker {worker.name}: {len(TASKS)} tareas registradas ({", ".join(sorted(TASKS))})')
+    worker.run(until_idle=once)
+
+
+jobs_cli = AppGroup('jobs', help='Cola de trabajos en segundo plano.')
+
+
+@jobs_cli.command('status')
+def status_command():
+    """Trabajos por tarea y estado."""
+    rows = db.session.execute(
+        select(Job.task, Job.status, func.count()).group_by(Job.task, Job.status).order_by(Job.task, Job.status)
+    ).all()
+    for name, status, count in rows:
+        click.echo(f'{name:24} {status:12} {count}')
+    if not rows:
+        click.echo('Cola vacía')
+
+
+@jobs_cli.command('retry')
+@click.option('--task', 'name', default=None, help='Solo los de esta tarea.')
+def retry_command(name):
+    """Devuelve a la cola los trabajos fallidos, con los intentos en cero."""
+    stmt = update(Job).where(Job.status == FAILED)
+    if name:
+        stmt = stmt.where(Job.task == name)
+    result = db.session.execute(
+        stmt.values(status=PENDING, attempts=0, run_at=datetime.utcnow(), finished_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    click.echo(f'{result.rowcount} trabajos reencolados')
@@ -0,0 +1,246 @@
+"""KPIs del dashboard de control.
+
+Los indicadores se calculan con agregación condicional en una sola sentencia y se
+guardan en la tabla `kpi_snapshot`. Cada flush que crea, cambia o borra un Project,
+ProjectTask, TechnicalReport o IncidentReport suma a cada KPI lo que aportaba la
+fila antes y después (un UPDATE por flush), dentro de la misma transacción; solo se
+recalcula desde cero cuando falta el snapshot, cuando está viejo o cuando no se
+conoce el valor anterior de una fila.
+
+El dashboard lee el snapshot con una consulta y nunca escribe: si está viejo calcula
+los KPIs sin guardarlos, y la siguiente escritura que los toque lo regenera.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import and_, case, event, func, inspect, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm.base import NO_VALUE
+from app import db
+from app.models import IncidentReport, KpiSnapshot, Project, ProjectTask, TechnicalReport
+
+# Rangos del histograma de avance: 0-9, 10-19, ..., 90-100
+PROGRESS_BUCKETS = [(lo, lo + 10) for lo in range(0, 100, 10)]
+
+
+# "Atrasados" depende de la hora actual: pasado este tiempo el snapshot se recalcula entero
+SNAPSHOT_MAX_AGE = timedelta(minutes=15)
+
+
+def bucket_key(lo):
+    return f'progreso_{lo}'
+
+
+def _count_if(condition):
+    return func.sum(case((condition, 1), else_=0))
+
+
+def project_stats_stmt(now):
+    """Contadores de proyectos, promedio de avance e histograma en una sola sentencia."""
+    progress = func.coalesce(Project.progress, 0)
+    columns = [
+        func.count().label('total_proyectos'),
+        _count_if(Project.status == 'activo').label('proyectos_activos'),
+        _count_if(Project.status == 'finalizado').label('proyectos_finalizados'),
+        _count_if(and_(Project.end_date < now, Project.status != 'finalizado')).label('proyectos_atrasados'),
+        # El promedio se arma al leer: así la suma y la cuenta se pueden actualizar por fila
+        func.sum(Project.progress).label('progreso_suma'),
+        func.count(Project.progress).label('progreso_contados'),
+    ]
+    for lo, hi in PROGRESS_BUCKETS:
+        upper = progress <= hi if hi == 100 else progress < hi
+        columns.append(_count_if(and_(progress >= lo, upper)).label(bucket_key(lo)))
+    return select(*columns).select_from(Project)
+
+
+# Contadores simples: grupo -> (clave, subconsulta escalar)
+COUNTERS = {
+    'tareas': ('tareas_completadas',
+               select(func.count()).select_from(ProjectTask).where(ProjectTask.status == 'completada')),
+    'reportes': ('reportes_tecnicos', select(func.count()).select_from(TechnicalReport)),
+    'incidentes': ('incidentes', select(func.count()).select_from(IncidentReport)),
+}
+
+GROUP_KEYS = {
+    'proyectos': ['total_proyectos', 'proyectos_activos', 'proyectos_finalizados', 'proyectos_atrasados',
+                  'progreso_suma', 'progreso_contados'] + [bucket_key(lo) for lo, _ in PROGRESS_BUCKETS],
+    **{group: [key] for group, (key, _) in COUNTERS.items()},
+}
+ALL_GROUPS = frozenset(GROUP_KEYS)
+KPI_KEYS = [key for keys in GROUP_KEYS.values() for key in keys]
+
+
+def compute(connection, groups=ALL_GROUPS, now=None):
+    """Calcula los KPIs de los grupos indicados en una sentencia; devuelve {clave: valor}."""
+    now = now or datetime.utcnow()
+    counters = [
+        stmt.scalar_subquery().label(key)
+        for group, (key, stmt) in sorted(COUNTERS.items()) if group in groups
+    ]
+    if 'proyectos' in groups:
+        stmt = project_stats_stmt(now).add_columns(*counters)
+    else:
+        stmt = select(*counters)
+    row = connection.execute(stmt).one()
+    return {key: value or 0 for key, value in row._mapping.items()}
+
+
+def store(connection, values, now=None):
+    """Upsert de los valores en kpi_snapshot."""
+    if not values:
+        return
+    now = now or datetime.utcnow()
+    table = KpiSnapshot.__table__
+    stmt = sqlite_insert(table).values(
+        [{'key': key, 'value': value, 'updated_at': now} for key, value in values.items()]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.key],
+        set_={'value': stmt.excluded.value, 'updated_at': stmt.excluded.updated_at},
+    )
+    connection.execute(stmt)
+
+
+def refresh(groups=ALL_GROUPS, connection=None, now=None):
+    """Recalcula y guarda los grupos indicados (sin commit)."""
+    connection = connection or db.session.connection()
+    now = now or datetime.utcnow()
+    values = compute(connection, groups, now)
+    store(connection, values, now)
+    return values
+
+
+def dashboard_kpis():
+    """KPIs para el dashboard: los del snapshot, o calculados sin guardar si falta o está viejo."""
+    rows = db.session.execute(
+        select(KpiSnapshot.key, KpiSnapshot.value, KpiSnapshot.updated_at).where(KpiSnapshot.key.in_(KPI_KEYS))
+    ).all()
+    values = {key: value for key, value, _ in rows}
+    oldest = min((updated_at for _, _, updated_at in rows), default=None)
+
+    if len(values) < len(KPI_KEYS) or oldest < datetime.utcnow() - SNAPSHOT_MAX_AGE:
+        # Sin commit: una lectura no toma el lock de escritura ni expira current_user
+        values = compute(db.session.connection())
+    values['progreso_promedio'] = (
+        values['progreso_suma'] / values['progreso_contados'] if values['progreso_contados'] else 0
+    )
+    return values
+
+
+def progress_histogram(values):
+    """[(etiqueta, cantidad de proyectos)] por rango de avance."""
+    return [
+        (f'{lo}–{hi if hi == 100 else hi - 1}%', int(values.get(bucket_key(lo), 0)))
+        for lo, hi in PROGRESS_BUCKETS
+    ]
+
+
+# --- Actualización por fila ------------------------------------------------------
+
+def _project_kpis(row, now):
+    progress = row['progress']
+    value = progress or 0
+    kpis = {
+        'total_proyectos': 1,
+        'proyectos_activos': row['status'] == 'activo',
+        'proyectos_finalizados': row['status'] == 'finalizado',
+        # Igual que en SQL: un estado o fecha NULL no cuenta como atrasado
+        'proyectos_atrasados': (row['end_date'] is not None and row['end_date'] < now
+                                and row['status'] is not None and row['status'] != 'finalizado'),
+        'progreso_suma': value if progress is not None else 0,
+        'progreso_contados': progress is not None,
+    }
+    for lo, hi in PROGRESS_BUCKETS:
+        if lo <= value and (value <= hi if hi == 100 else value < hi):
+            kpis[bucket_key(lo)] = 1
+    return kpis
+
+
+# Modelo -> (grupo, columnas que lee, aporte de una fila a cada KPI)
+MODEL_KPIS = {
+    Project: ('proyectos', ('status', 'end_date', 'progress'), _project_kpis),
+    ProjectTask: ('tareas', ('status',), lambda row, now: {'tareas_completadas': row['status'] == 'completada'}),
+    TechnicalReport: ('reportes', (), lambda row, now: {'reportes_tecnicos': 1}),
+    IncidentReport: ('incidentes', (), lambda row, now: {'incidentes': 1}),
+}
+
+
+def _row_values(state, columns, before):
+    """Valores de la fila antes o después del flush; None si alguno no está cargado."""
+    row = {}
+    for column in columns:
+        value = state.dict.get(column, NO_VALUE)
+        if before:
+            value = state.committed_state.get(column, value)
+        if value is NO_VALUE:
+            return None
+        row[column] = value
+    return row
+
+
+def _kpi_deltas(session, now):
+    """({clave: delta}, grupos a recalcular enteros) de los cambios del flush."""
+    deltas = Counter()
+    recompute = set()
+
+    def add(obj, before, sign):
+        group, columns, kpis = MODEL_KPIS[type(obj)]
+        row = _row_values(inspect(obj), columns, before)
+        if row is None:
+            recompute.add(group)
+            return
+        for key, value in kpis(row, now).items():
+            deltas[key] += sign * value
+
+    for obj in session.new:
+        if type(obj) in MODEL_KPIS:
+            add(obj, False, 1)
+    for obj in session.dirty:
+        if type(obj) in MODEL_KPIS:
+            add(obj, True, -1)
+            add(obj, False, 1)
+    for obj in session.deleted:
+        if type(obj) in MODEL_KPIS:
+            add(obj, True, -1)
+
+    skipped = {key for group in recompute for key in GROUP_KEYS[group]}
+    return {key: delta for key, delta in deltas.items() if delta and key not in skipped}, recompute
+
+
+def _snapshot_is_fresh(connection, now):
+    table = KpiSnapshot.__table__
+    count, oldest = connection.execute(
+        select(func.count(), func.min(table.c.updated_at)).where(table.c.key.in_(KPI_KEYS))
+    ).one()
+    return count == len(KPI_KEYS) and oldest >= now - SNAPSHOT_MAX_AGE
+
+
+def apply_deltas(connection, deltas):
+    """Suma `deltas` ({clave: delta}) a los valores del snapshot en un solo UPDATE."""
+    table = KpiSnapshot.__table__
+    connection.execute(
+        update(table)
+        .where(table.c.key.in_(list(deltas)))
+        .values(value=table.c.value + case(deltas, value=table.c.key))
+    )
+
+
+def _update_after_flush(session, flush_context):
+    now = datetime.utcnow()
+    deltas, recompute = _kpi_deltas(session, now)
+    if not deltas and not recompute:
+        return
+    connection = session.connection()
+    # El flush ya escribió, así que esta transacción tiene el lock de escritura: lo que
+    # se lea acá no cambia hasta el commit
+    if not _snapshot_is_fresh(connection, now):
+        refresh(ALL_GROUPS, connection, now)
+        return
+    if recompute:
+        refresh(recompute, connection, now)
+    if deltas:
+        apply_deltas(connection, deltas)
+
+
+def register_kpi_listeners():
+    if not event.contains(db.session, 'after_flush', _update_after_flush):
+        event.listen(db.session, 'after_flush', _update_after_flush)
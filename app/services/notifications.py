@@ -0,0 +1,55 @@
+"""Notificaciones del sistema y contador desnormalizado de no leídas por usuario."""
+from flask_login import current_user
+from sqlalchemy import select, update
+from app import db
+from app.models import AdminUser, SystemNotification
+
+
+def notify(user_id, title, message):
+    """Crea una notificación y suma uno al contador del destinatario.
+
+    No hace commit: la notificación queda en la misma transacción que el cambio que la origina.
+    """
+    noti = SystemNotification(title=title, message=message, user_id=user_id)
+    db.session.add(noti)
+    db.session.execute(
+        update(AdminUser)
+        .where(AdminUser.id == user_id)
+        .values(unread_notifications=AdminUser.unread_notifications + 1)
+    )
+    return noti
+
+
+def mark_all_read(user_id):
+    """Marca como leídas todas las notificaciones del usuario y deja su contador en cero."""
+    db.session.execute(
+        update(SystemNotification)
+        .where(SystemNotification.user_id == user_id, SystemNotification.read.is_(False))
+        .values(read=True)
+    )
+    db.session.execute(
+        update(AdminUser)
+        .where(AdminUser.id == user_id)
+        .values(unread_notifications=0)
+    )
+
+
+def unread_count(user_id):
+    """Lee el contador por clave primaria; no toca la tabla de notificaciones.
+
+    No usa el usuario de identity_cache: esa copia no se invalida cuando cambia el
+    contador (notify y mark_all_read lo actualizan con UPDATE, sin pasar por el ORM).
+    """
+    count = db.session.scalar(select(AdminUser.unread_notifications).where(AdminUser.id == user_id))
+    return count or 0
+
+
+def inject_unread_notifications():
+    """Context processor: expone `unread_notifications()` a layout.html.
+
+    Es una función para que la consulta se haga solo al dibujar la campana (menú de
+    admin), no en cada render_template de parciales o páginas de otros roles.
+    """
+    if not current_user.is_authenticated:
+        return {}
+    return {'unread_notifications': lambda: unread_count(current_user.id)}
@@ -0,0 +1,106 @@
+"""Paginación por keyset (seek) sobre (fecha, id).
+
+En vez de OFFSET, cada página se pide "a partir de" la clave de la última fila vista:
+WHERE (fecha, id) < (:fecha, :id) ORDER BY fecha DESC, id DESC LIMIT n. Con un índice
+que termine en la columna de fecha (SQLite agrega el rowid/id al final de cada índice)
+cualquier página cuesta lo mismo que la primera.
+
+El cursor que viaja en la URL (?cursor=...) es opaco: la clave y la dirección en JSON
+codificado en base64 url-safe. Las columnas de la clave no deben tener NULL.
+"""
+import base64
+import binascii
+import json
+from flask import abort, current_app, request, url_for
+from sqlalchemy import tuple_
+
+NEXT = 'n'
+PREV = 'p'
+
+
+def encode_cursor(values, direction):
+    payload = json.dumps({'k': [v.isoformat() if hasattr(v, 'isoformat') else v for v in values],
+                          'd': direction})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, columns):
+    """(valores de la clave, dirección) o 400 si el cursor no es válido."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        raw, direction = data['k'], data['d']
+        if direction not in (NEXT, PREV) or len(raw) != len(columns):
+            raise ValueError(direction)
+        values = []
+        for column, value in zip(columns, raw):
+            python_type = column.type.python_type
+            values.append(python_type.fromisoformat(value) if hasattr(python_type, 'fromisoformat')
+                          else python_type(value))
+        return values, direction
+    except (binascii.Error, ValueError, TypeError, KeyError, NotImplementedError):
+        abort(400, description='Cursor de paginación inválido.')
+
+
+class KeysetPage:
+    def __init__(self, items, has_next, has_prev, columns):
+        self.items = items
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self._columns = columns
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def _key(self, item):
+        return [getattr(item, column.key) for column in self._columns]
+
+    @property
+    def next_cursor(self):
+        return encode_cursor(self._key(self.items[-1]), NEXT) if self.has_next else None
+
+    @property
+    def prev_cursor(self):
+        return encode_cursor(self._key(self.items[0]), PREV) if self.has_prev else None
+
+    def url(self, cursor):
+        """URL del mismo endpoint con el cursor indicado, conservando los demás filtros."""
+        args = {k: v for k, v in request.args.items() if k != 'cursor'}
+        return url_for(request.endpoint, **(request.view_args or {}), **args, cursor=cursor)
+
+    @property
+    def next_url(self):
+        return self.url(self.next_cursor) if self.has_next else None
+
+    @property
+    def prev_url(self):
+        return self.url(self.prev_cursor) if self.has_prev else None
+
+
+def paginate_keyset(query, timestamp_column, id_column, per_page=None, cursor=None):
+    """Página de `query` ordenada por (timestamp_column, id_column) descendente.
+
+    `query` es un Query sin ORDER BY. El cursor se lee de ?cursor= si no se pasa.
+    Devuelve un KeysetPage con items, has_next/has_prev y next_url/prev_url.
+    """
+    columns = (timestamp_column, id_column)
+    per_page = per_page or current_app.config['PAGE_SIZE']
+    cursor = cursor if cursor is not None else request.args.get('cursor')
+    key = tuple_(*columns)
+
+    if not cursor:
+        rows = query.order_by(*(c.desc() for c in columns)).limit(per_page + 1).all()
+        return KeysetPage(rows[:per_page], len(rows) > per_page, False, columns)
+
+    values, direction = decode_cursor(cursor, columns)
+    if direction == NEXT:
+        rows = (query.filter(key < tuple_(*values))
+                .order_by(*(c.desc() for c in columns)).limit(per_page + 1).all())
+        return KeysetPage(rows[:per_page], len(rows) > per_page, True, columns)
+
+    # Hacia atrás: se recorre en orden ascendente y se invierte la página
+    rows = (query.filter(key > tuple_(*values))
+            .order_by(*(c.asc() for c in columns)).limit(per_page + 1).all())
+    return KeysetPage(rows[:per_page][::-1], True, len(rows) > per_page, columns)
@@ -0,0 +1,180 @@
+"""PDF de incidencias: render con estilos reutilizados, caché en disco y pool de procesos.
+
+El PDF se arma a partir de un `payload` (dict de textos ya formateados) y se guarda
+como incidencia_<id>_<versión>.pdf, donde la versión es un hash del payload: cualquier
+cambio en lo que se imprime (estado, gravedad, responsable, nombre del proyecto...)
+genera otro archivo y una descarga sin cambios se sirve directo del disco.
+
+ReportLab corre en un ProcessPoolExecutor (PDF_RENDER_WORKERS procesos, 0 = en el
+mismo proceso) para no ocupar la CPU del worker web; cada proceso arma la hoja de
+estilos una sola vez. `actualizar_incidencia` encola el trabajo 'pdf.incidencia', que
+renderiza la versión nueva fuera del request y borra las viejas.
+"""
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from io import BytesIO
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+from app import db
+from app.models import IncidentReport
+from app.services.jobs import task
+
+DATETIME_FORMAT = '%d/%m/%Y %H:%M'
+
+INFO_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+])
+FOLLOWUP_TABLE_STYLE = TableStyle([
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+])
+COL_WIDTHS = [6 * cm, 10 * cm]
+
+
+@lru_cache(maxsize=1)
+def _styles():
+    return getSampleStyleSheet()
+
+
+def incident_payload(incidencia):
+    """Textos que se imprimen en el PDF de una incidencia."""
+    return {
+        'id': incidencia.id,
+        'proyecto': incidencia.project.name,
+        'fecha_reporte': incidencia.report_datetime.strftime(DATETIME_FORMAT),
+        'info': [
+            ["Reportado por", incidencia.reporter_name],
+            ["Cargo", incidencia.reporter_role or "No especificado"],
+            ["Correo", incidencia.reporter_email],
+            ["Teléfono", incidencia.reporter_phone or "No especificado"],
+            ["Ubicación", incidencia.location],
+            ["Tipo de incidente", incidencia.incident_type],
+            ["Fecha y hora del incidente", incidencia.incident_datetime.strftime(DATETIME_FORMAT)],
+        ],
+        'descripcion': incidencia.description,
+        'acciones_correctivas': incidencia.corrective_actions or "No registradas",
+        'causa_raiz': incidencia.root_cause or "No determinada",
+        'acciones_preventivas': incidencia.preventive_actions or "No registradas",
+        'seguimiento': [
+            ["Gravedad", incidencia.severity.capitalize()],
+            ["Estado", incidencia.status.capitalize()],
+            ["Responsable asignado",
+             incidencia.responsible_user.nombre if incidencia.responsible_user else "No asignado"],
+            ["Fecha de cierre",
+             incidencia.closure_date.strftime(DATETIME_FORMAT) if incidencia.closure_date else "No cerrada"],
+        ],
+    }
+
+
+def payload_version(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def render_incident_pdf(payload):
+    """Bytes del PDF; corre en el pool, así que solo recibe y devuelve datos simples."""
+    styles = _styles()
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=2*cm, leftMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm)
+
+    def section(title, text, space):
+        return [Paragraph(f"<b>{title}</b>", styles['Heading3']), Paragraph(text, styles['Normal']), Spacer(1, space)]
+
+    story = [
+        Paragraph(f"<b>Reporte de Incidencia #{payload['id']}</b>", styles['Title']),
+        Spacer(1, 12),
+        Paragraph(f"<b>Proyecto:</b> {payload['proyecto']}", styles['Normal']),
+        Paragraph(f"<b>Fecha de reporte:</b> {payload['fecha_reporte']}", styles['Normal']),
+        Spacer(1, 12),
+        Table(payload['info'], colWidths=COL_WIDTHS, style=INFO_TABLE_STYLE),
+        Spacer(1, 12),
+        *section("Descripción del incidente:", payload['descripcion'], 12),
+        *section("Acciones correctivas inmediatas:", payload['acciones_correctivas'], 8),
+        *section("Causa raíz:", payload['causa_raiz'], 8),
+        *section("Acciones preventivas:", payload['acciones_preventivas'], 12),
+        Paragraph("<b>Seguimiento</b>", styles['Heading2']),
+        Table(payload['seguimiento'], colWidths=COL_WIDTHS, style=FOLLOWUP_TABLE_STYLE),
+    ]
+    doc.build(story)
+    return buffer.getvalue()
+
+
+class IncidentPdfCache:
+    def __init__(self):
+        self.directory = None
+        self.workers = 0
+        self.timeout = None
+        self._pool = None
+
+    def init_app(self, app):
+        self.directory = app.config['PDF_CACHE_DIR']
+        self.workers = app.config['PDF_RENDER_WORKERS']
+        self.timeout = app.config['PDF_RENDER_TIMEOUT']
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, incident_id, version):
+        return os.path.join(self.directory, f'incidencia_{incident_id}_{version}.pdf')
+
+    def _executor(self):
+        # Se crea en el primer uso (ya dentro del worker) y con spawn: los hijos no heredan
+        # conexiones ni hilos del proceso web
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def _write(self, path, data):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(data)
+        os.replace(tmp, path)
+
+    def _render(self, payload):
+        if not self.workers:
+            return render_incident_pdf(payload)
+        try:
+            return self._executor().submit(render_incident_pdf, payload).result(self.timeout)
+        except BrokenProcessPool:
+            self._pool = None
+            return render_incident_pdf(payload)
+
+    def get(self, payload):
+        """(ruta del PDF, versión); lo renderiza solo si esa versión no está en caché."""
+        version = payload_version(payload)
+        path = self.path(payload['id'], version)
+        if not os.path.exists(path):
+            self._write(path, self._render(payload))
+        return path, version
+
+    def invalidate(self, incident_id, keep=None):
+        """Borra las versiones cacheadas de la incidencia (salvo `keep`)."""
+        for path in glob.glob(self.path(incident_id, '*')):
+            if path != keep:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+incident_pdf_cache = IncidentPdfCache()
+
+
+@task('pdf.incidencia')
+def render_incident_task(incident_id):
+    """Deja en caché el PDF vigente de la incidencia y borra las versiones anteriores."""
+    incidencia = db.session.get(IncidentReport, incident_id)
+    if incidencia is None:
+        return
+    path, _ = incident_pdf_cache.get(incident_payload(incidencia))
+    incident_pdf_cache.invalidate(incident_id, keep=path)
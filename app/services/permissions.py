@@ -0,0 +1,106 @@
+"""Permisos por request: roles globales y roles por proyecto del usuario actual.
+
+La matriz se arma una sola vez por request (roles globales desde el usuario ya
+cargado + a lo sumo una consulta a project_user_role) y se guarda en `g`. Las rutas la
+consultan con el decorador `requires` o con `get_permissions()`.
+"""
+from functools import wraps
+from flask import abort, flash, g, redirect, url_for
+from flask_login import current_user
+from sqlalchemy import select
+from app import db
+from app.models import ProjectUserRole, Role
+
+# Rol global que tiene acceso a todos los proyectos sin estar asignado
+ADMIN_ROLE = 'admin'
+
+# Roles que pueden seguir cualquier tarea; el resto solo las tareas de las que es responsable
+TASK_WATCHER_ROLES = ('admin', 'editor')
+
+
+class PermissionMatrix:
+    def __init__(self, user_id, global_roles, project_roles=None):
+        self.user_id = user_id
+        self.global_roles = frozenset(global_roles)
+        self._project_roles = project_roles  # {project_id: nombre del rol en minúsculas}
+
+    @classmethod
+    def load(cls, user):
+        # Los roles globales ya vienen cargados con el usuario (ver services/identity.py)
+        return cls(user.id, (role.name.lower() for role in user.roles))
+
+    @property
+    def project_roles(self):
+        """Roles por proyecto; se consultan la primera vez que una ruta los necesita."""
+        if self._project_roles is None:
+            rows = db.session.execute(
+                select(ProjectUserRole.project_id, Role.name)
+                .join(Role, Role.id == ProjectUserRole.role_id)
+                .where(ProjectUserRole.user_id == self.user_id)
+            ).all()
+            self._project_roles = {project_id: name.lower() for project_id, name in rows}
+        return self._project_roles
+
+    @property
+    def is_admin(self):
+        return ADMIN_ROLE in self.global_roles
+
+    @property
+    def accessible_project_ids(self):
+        """Proyectos en los que el usuario tiene algún rol asignado."""
+        return frozenset(self.project_roles)
+
+    def project_ids_with_role(self, *names):
+        """Proyectos en los que el usuario tiene alguno de esos roles."""
+        wanted = {n.lower() for n in names}
+        return frozenset(pid for pid, role in self.project_roles.items() if role in wanted)
+
+    def has_role(self, *names):
+        return any(name.lower() in self.global_roles for name in names)
+
+    def project_role(self, project_id):
+        return self.project_roles.get(project_id)
+
+    def has_project_role(self, project_id, *names):
+        """True si el usuario tiene uno de esos roles en el proyecto (el admin siempre)."""
+        if self.is_admin:
+            return True
+        role = self.project_roles.get(project_id)
+        return role is not None and (not names or role in {n.lower() for n in names})
+
+
+def get_permissions():
+    """Matriz de permisos del usuario actual, cargada una sola vez por request."""
+    if 'permissions' not in g:
+        g.permissions = PermissionMatrix.load(current_user)
+    return g.permissions
+
+
+def requires(role=None, project_role=None, project_arg='project_id', redirect_to=None, message=None):
+    """Restringe una ruta por rol global y/o por rol en el proyecto de la URL.
+
+    `role` y `project_role` aceptan un nombre o una tupla de nombres. Si se indica
+    `redirect_to`, un acceso denegado muestra `message` y redirige a ese endpoint;
+    si no, responde 403. Debe ir debajo de @login_required.
+    """
+    roles = (role,) if isinstance(role, str) else role
+    project_roles = (project_role,) if isinstance(project_role, str) else project_role
+
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            perms = get_permissions()
+            allowed = True
+            if roles and not perms.has_role(*roles):
+                allowed = False
+            if allowed and project_roles and not perms.has_project_role(kwargs.get(project_arg), *project_roles):
+                allowed = False
+
+            if not allowed:
+                if redirect_to:
+                    flash(message or 'No tienes permisos para acceder a esta página.', 'danger')
+                    return redirect(url_for(redirect_to))
+                abort(403, description=message)
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
@@ -0,0 +1,48 @@
+"""Métricas por proyecto calculadas en lote.
+
+Una sola sentencia sobre todos los ids pedidos, con subconsultas correlacionadas
+que usan los índices por project_id (tareas, documentos y avances).
+"""
+from sqlalchemy import func, select
+from app import db
+from app.models import Project, ProjectDocument, ProjectProgress, ProjectTask
+
+
+def _metrics_stmt(project_ids):
+    def count(model, *conditions):
+        return (
+            select(func.count())
+            .select_from(model)
+            .where(model.project_id == Project.id, *conditions)
+            .scalar_subquery()
+        )
+
+    return select(
+        Project.id,
+        count(ProjectTask).label('tareas_total'),
+        count(ProjectTask, ProjectTask.status == 'completada').label('tareas_completadas'),
+        count(ProjectDocument).label('documentos_total'),
+        select(func.max(ProjectProgress.date))
+        .where(ProjectProgress.project_id == Project.id)
+        .scalar_subquery()
+        .label('ultimo_avance'),
+    ).where(Project.id.in_(project_ids))
+
+
+def project_metrics(project_ids):
+    """{project_id: métricas} para los proyectos indicados, en un solo viaje a la BD.
+
+    Cada entrada trae tareas_total, tareas_completadas, tareas_pendientes,
+    documentos_total y ultimo_avance (fecha del avance más reciente o None).
+    """
+    project_ids = list(project_ids)
+    if not project_ids:
+        return {}
+
+    metrics = {}
+    for row in db.session.execute(_metrics_stmt(project_ids)):
+        data = dict(row._mapping)
+        project_id = data.pop('id')
+        data['tareas_pendientes'] = data['tareas_total'] - data['tareas_completadas']
+        metrics[project_id] = data
+    return metrics
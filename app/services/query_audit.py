@@ -0,0 +1,166 @@
+"""Auditoría de consultas SQL por request: conteo, detección de N+1 y presupuestos.
+
+Con QUERY_AUDIT activo, cada sentencia que llega al cursor se anota en `g` junto con
+el lugar que la originó (línea de la plantilla si viene de Jinja, si no la línea del
+código de la app). Al terminar el request:
+
+- las sentencias idénticas (mismo SQL, distintos parámetros) repetidas
+  QUERY_AUDIT_REPEAT veces o más se reportan como posible N+1;
+- si el endpoint tiene presupuesto en QUERY_BUDGETS y lo supera, se reporta o, con
+  QUERY_BUDGET_STRICT (por defecto en TESTING), se lanza QueryBudgetExceeded.
+
+La respuesta lleva la cabecera X-Query-Count. `flask audit-queries` recorre URLs con
+el cliente de pruebas y termina con error si encuentra N+1 o presupuestos excedidos.
+"""
+import os
+import sys
+from collections import Counter, defaultdict
+import click
+from flask import current_app, g, has_request_context, request, request_started
+from flask.cli import with_appcontext
+from sqlalchemy import event
+from app import db
+
+HEADER = 'X-Query-Count'
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryAudit:
+    def __init__(self):
+        self.statements = []  # [(sql, origen, parámetros)]
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def repeated(self, threshold):
+        """[(sql, veces, orígenes)] de las sentencias ejecutadas `threshold` veces o más."""
+        counts = Counter(sql for sql, _, _ in self.statements)
+        origins = defaultdict(Counter)
+        for sql, origin, _ in self.statements:
+            origins[sql][origin] += 1
+        return [
+            (sql, times, origins[sql].most_common())
+            for sql, times in counts.most_common()
+            if times >= threshold
+        ]
+
+
+def _origin():
+    """Plantilla:línea (o archivo:línea de la app) desde donde se emitió la consulta."""
+    app_root = current_app.root_path
+    app_frame = None
+    frame = sys._getframe(2)
+    while frame is not None:
+        template = frame.f_globals.get('__jinja_template__')
+        if template is not None:
+            return f'{template.name}:{template.get_corresponding_lineno(frame.f_lineno)}'
+        filename = frame.f_code.co_filename
+        if app_frame is None and filename.startswith(app_root) and filename != __file__:
+            app_frame = f'{os.path.relpath(filename, app_root)}:{frame.f_lineno}'
+        frame = frame.f_back
+    return app_frame or '?'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'query_audit' in g:
+        g.query_audit.statements.append((statement, _origin(), parameters))
+
+
+def _start_audit():
+    if current_app.config['QUERY_AUDIT']:
+        g.setdefault('query_audit', QueryAudit())
+
+
+def _finish_audit(response):
+    audit = g.pop('query_audit', None)
+    if audit is None:
+        return response
+
+    config = current_app.config
+    endpoint = request.endpoint
+    response.headers[HEADER] = str(audit.count)
+
+    for sql, times, origins in audit.repeated(config['QUERY_AUDIT_REPEAT']):
+        where = ', '.join(f'{origin} (x{n})' for origin, n in origins)
+        current_app.logger.warning('Posible N+1 en %s: %d ejecuciones desde %s\n    %s',
+                                   endpoint, times, where, ' '.join(sql.split()))
+
+    budget = config['QUERY_BUDGETS'].get(endpoint)
+    if budget is not None and audit.count > budget:
+        message = f'{endpoint} ejecutó {audit.count} consultas (presupuesto: {budget})'
+        if config.get('QUERY_BUDGET_STRICT', config['TESTING']):
+            raise QueryBudgetExceeded(message)
+        current_app.logger.warning(message)
+    return response
+
+
+def init_query_audit(app):
+    app.config.setdefault('QUERY_AUDIT', False)
+    app.config.setdefault('QUERY_AUDIT_REPEAT', 3)
+    app.config.setdefault('QUERY_BUDGETS', {})
+    app.before_request(_start_audit)
+    app.after_request(_finish_audit)
+    with app.app_context():
+        if not event.contains(db.engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(db.engine, 'before_cursor_execute', _before_cursor_execute)
+    app.cli.add_command(audit_queries_command)
+
+
+def login_client(client, user_id):
+    """Deja al cliente de pruebas autenticado como ese usuario (sin pasar por el login)."""
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+
+
+def audited_get(client, url):
+    """GET con el cliente de pruebas; devuelve (respuesta, endpoint, QueryAudit del request)."""
+    app = client.application
+    audit = QueryAudit()
+    with app.test_request_context(url):
+        endpoint = request.url_rule.endpoint if request.url_rule else None
+
+    # Se entrega un QueryAudit propio al request para poder leerlo al terminar
+    def capture(sender, **extra):
+        g.query_audit = audit
+    with request_started.connected_to(capture, app):
+        response = client.get(url)
+    return response, endpoint, audit
+
+
+@click.command('audit-queries')
+@click.option('--user', 'user_id', type=int, help='Id del usuario con el que se hacen los requests.')
+@click.argument('urls', nargs=-1, required=True)
+@with_appcontext
+def audit_queries_command(user_id, urls):
+    """Cuenta las consultas de cada URL (GET) y reporta N+1 y presupuestos excedidos."""
+    app = current_app._get_current_object()
+    app.config.update(QUERY_AUDIT=True, QUERY_BUDGET_STRICT=False)
+    threshold = app.config['QUERY_AUDIT_REPEAT']
+    budgets = app.config['QUERY_BUDGETS']
+    failures = 0
+
+    client = app.test_client()
+    if user_id:
+        login_client(client, user_id)
+
+    for url in urls:
+        response, endpoint, audit = audited_get(client, url)
+        budget = budgets.get(endpoint)
+        over = budget is not None and audit.count > budget
+        repeated = audit.repeated(threshold)
+        status = 'FALLA' if over or repeated else 'ok'
+        budget_text = f' / {budget}' if budget is not None else ''
+        click.echo(f'{status:5} {response.status_code} {audit.count:3}{budget_text} consultas  {url}')
+        for sql, times, origins in repeated:
+            where = ', '.join(f'{origin} (x{n})' for origin, n in origins)
+            click.echo(f'      N+1 x{times} desde {where}')
+            click.echo(f'        {" ".join(sql.split())[:160]}')
+        failures += bool(over or repeated)
+
+    if failures:
+        raise SystemExit(1)
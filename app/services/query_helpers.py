@@ -0,0 +1,37 @@
+"""Ayudas de consulta reutilizables."""
+from collections import defaultdict
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased, selectinload
+from app import db
+
+
+def top_n_per_group_stmt(model, group_column, order_by, n, *criteria, load=()):
+    """SELECT de las `n` primeras filas de cada grupo según ROW_NUMBER().
+
+    ROW_NUMBER() OVER (PARTITION BY group_column ORDER BY order_by) sobre `model`
+    filtrado por `criteria`; el resultado sale ordenado por grupo y posición.
+    `load` son nombres de relaciones a cargar en lote con selectinload.
+    """
+    order_by = order_by if isinstance(order_by, (list, tuple)) else (order_by,)
+    row_number = func.row_number().over(partition_by=group_column, order_by=order_by).label('row_number')
+    ranked = select(model, row_number).where(*criteria).subquery()
+    entity = aliased(model, ranked)
+
+    return (
+        select(entity)
+        .where(ranked.c.row_number <= n)
+        .order_by(ranked.c[group_column.key], ranked.c.row_number)
+        .options(*[selectinload(getattr(entity, name)) for name in load])
+    )
+
+
+def top_n_per_group(model, group_column, order_by, n, *criteria, load=()):
+    """{valor del grupo: [las `n` primeras filas]} en un solo viaje a la BD.
+
+    Reemplaza el patrón "una consulta con .limit(n) por cada grupo".
+    """
+    stmt = top_n_per_group_stmt(model, group_column, order_by, n, *criteria, load=load)
+    groups = defaultdict(list)
+    for obj in db.session.execute(stmt).scalars():
+        groups[getattr(obj, group_column.key)].append(obj)
+    return groups
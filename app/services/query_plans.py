@@ -0,0 +1,253 @@
+"""Revisión de planes de consulta (EXPLAIN QUERY PLAN) de las rutas más usadas.
+
+`flask check-query-plans` recorre con el cliente de pruebas las páginas de cada rol
+(ROUTES), toma de la auditoría de consultas (services/query_audit.py) las sentencias
+que cada request ejecutó de verdad y corre EXPLAIN QUERY PLAN sobre cada una con sus
+mismos parámetros. Termina con error si alguna recorre una tabla completa o si una
+ruta no responde 200 (sus consultas quedarían sin revisar).
+
+Cada request corre dentro de una transacción que se revierte al terminar: algunas
+páginas escriben al abrirse (las notificaciones se marcan como leídas) y el chequeo no
+debe cambiar la base. Los ids de ejemplo (proyecto, tarea, incidencia y un usuario por
+rol) salen de la misma base, así que necesita datos: al menos una tarea a cargo de un
+miembro.
+"""
+import re
+from contextlib import contextmanager
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import func, select
+from app import db
+from app.models import Comment, IncidentReport, ProjectTask, Role, UserRoles
+from app.services.pagination import NEXT, encode_cursor
+from app.services.query_audit import audited_get, login_client
+
+# Cursor con una clave mayor que cualquier fila: la "página siguiente" desde el principio
+NEXT_PAGE = '?cursor=' + encode_cursor(['9999-12-31', 2 ** 31], NEXT)
+
+# (rol del usuario, URL) de las páginas a revisar; {project}, {task} e {incident} se
+# completan con los ids de ejemplo
+ROUTES = [
+    ('admin', '/admin/dashboard_control'),
+    ('admin', '/admin/flujos_aprobacion'),
+    ('admin', '/admin/incidencias'),
+    ('admin', '/admin/incidencias' + NEXT_PAGE),
+    ('admin', '/admin/incidencias/ver/{incident}'),
+    ('admin', '/admin/notificaciones'),
+    ('admin', '/admin/notificaciones' + NEXT_PAGE),
+    ('admin', '/admin/notificaciones/no_leidas'),
+    ('admin', '/admin/project_details/{project}'),
+    ('admin', '/admin/reportes'),
+    ('admin', '/admin/reportes' + NEXT_PAGE),
+    ('admin', '/admin/usuarios'),
+    ('admin', '/buscar?q=tarea'),
+
+    ('editor', '/editor/avances/proyecto/{project}'),
+    ('editor', '/editor/avances/proyecto/{project}' + NEXT_PAGE),
+    ('editor', '/editor/flujos'),
+    ('editor', '/editor/project/{project}/create_task'),
+    ('editor', '/editor/project/{project}/documents'),
+    ('editor', '/editor/project/{project}/documents' + NEXT_PAGE),
+    ('editor', '/editor/project/{project}/tasks'),
+    ('editor', '/editor/project/{project}/task/{task}/comments'),
+    ('editor', '/editor/project/{project}/task/{task}/comments/feed?after=0'),
+    ('editor', '/editor/project/{project}/task/{task}/comments/feed?before=2147483648'),
+    ('editor', '/editor/proyecto/{project}/checklist'),
+    ('editor', '/editor/reportes'),
+
+    ('miembro', '/miembro/proyectos'),
+    ('miembro', '/miembro/tareas'),
+    ('miembro', '/miembro/incidencias/ver/{project}'),
+    ('miembro', '/miembro/incidencias/ver/{project}' + NEXT_PAGE),
+    ('miembro', '/miembro/proyecto/{project}/avances'),
+    ('miembro', '/miembro/proyecto/{project}/checklist'),
+    ('miembro', '/miembro/tarea/{task}/comentarios'),
+    ('miembro', '/miembro/tarea/{task}/comentarios/feed?after=0'),
+    ('miembro', '/buscar?q=tarea'),
+
+    ('invitado', '/invitado/dashboard'),
+    ('invitado', '/invitado/proyecto/{project}'),
+    ('invitado', '/invitado/avances/proyecto/{project}'),
+    ('invitado', '/invitado/documentos'),
+    ('invitado', '/invitado/project/{project}/documents'),
+
+    ('lector', '/lector/dashboard'),
+    ('lector', '/lector/documentos'),
+    ('lector', '/lector/project/{project}/documents'),
+
+    ('mensajero', '/mensajero/'),
+    ('mensajero', '/mensajero/' + NEXT_PAGE),
+]
+
+# Lecturas completas a propósito: agregados globales, listados sin filtro y tablas de
+# catálogo. (ruta, tabla) -> motivo; no cubre las consultas paginadas (con LIMIT)
+WHOLE_TABLE_READS = {
+    ('admin.dashboard_control', 'projects'): 'KPIs globales al recalcular el snapshot',
+    ('admin.dashboard_control', 'project_tasks'): 'KPIs globales al recalcular el snapshot',
+    ('admin.dashboard_control', 'incident_reports'): 'KPIs globales al recalcular el snapshot',
+    ('admin.dashboard_control', 'technical_reports'): 'KPIs globales al recalcular el snapshot',
+    ('admin.dashboard_control', 'approval_flows'): 'flujos revisados y pendientes por responsable',
+    ('admin.flujos_aprobacion', 'approval_flows'): 'lista todos los flujos',
+    ('admin.flujos_aprobacion', 'user_roles'): 'editores para el formulario (una fila por usuario)',
+    ('admin.listar_incidencias', 'admin_users'): 'usuarios para asignar responsable',
+    ('admin.usuarios', 'admin_users'): 'lista todos los usuarios',
+    ('admin.project_details', 'roles'): 'catálogo de roles',
+    ('admin.ver_reportes', 'technical_reports'): 'total de reportes',
+    ('admin.ver_reportes', 'projects'): 'proyectos para el formulario',
+    ('lector.dashboard', 'projects'): 'el lector ve todos los proyectos',
+    ('lector.lector_documentos', 'projects'): 'el lector ve todos los proyectos',
+    ('mensajero.dashboard', 'mensajes'): 'totales del buzón',
+}
+
+# Sentencias que tienen plan; BEGIN, PRAGMA, SAVEPOINT y similares no
+PLANNED_RE = re.compile(r'^\s*(SELECT|WITH|UPDATE|DELETE|INSERT)\b', re.IGNORECASE)
+SCAN_RE = re.compile(r'^SCAN (\w+)')
+# Un recorrido por índice solo vale si corta temprano: ORDER BY ... LIMIT
+ORDER_LIMIT_RE = re.compile(r'\bORDER BY\b.*\bLIMIT\b', re.IGNORECASE | re.DOTALL)
+
+
+def sample_ids():
+    """Ids de ejemplo de la base: {'project', 'task', 'incident', 'users': {rol: id}}.
+
+    La tarea es la de más comentarios entre las que están a cargo de un miembro, y ese
+    miembro es el usuario del recorrido.
+    """
+    role_users = db.session.execute(
+        select(func.lower(Role.name), func.min(UserRoles.user_id))
+        .join(UserRoles, UserRoles.role_id == Role.id)
+        .group_by(func.lower(Role.name))
+    ).all()
+    users = dict(role_users)
+
+    members = (select(UserRoles.user_id)
+               .join(Role, Role.id == UserRoles.role_id)
+               .where(func.lower(Role.name) == 'miembro'))
+    comments = (select(func.count()).where(Comment.task_id == ProjectTask.id)
+                .correlate(ProjectTask).scalar_subquery())
+    task = db.session.execute(
+        select(ProjectTask.id, ProjectTask.project_id, ProjectTask.responsible_user_id)
+        .where(ProjectTask.responsible_user_id.in_(members))
+        .order_by(comments.desc(), ProjectTask.id)
+        .limit(1)
+    ).first()
+    if task is None:
+        raise click.ClickException('La base no tiene tareas a cargo de un miembro; no hay ids de ejemplo.')
+    users['miembro'] = task.responsible_user_id
+
+    incident = db.session.scalar(select(func.min(IncidentReport.id)))
+    return {'project': task.project_id, 'task': task.id, 'incident': incident or 0, 'users': users}
+
+
+@contextmanager
+def rolled_back():
+    """Todo lo que use la base dentro del bloque va a una transacción que se revierte al salir.
+
+    Flask-SQLAlchemy elige el bind por `db.engines`: con una conexión en su lugar, la
+    sesión se une a su transacción y el commit de la ruta no la confirma.
+    """
+    engines = db.engines
+    engine = engines[None]
+    connection = engine.connect()
+    transaction = connection.begin()
+    engines[None] = connection
+    try:
+        yield
+    finally:
+        engines[None] = engine
+        transaction.rollback()
+        connection.close()
+
+
+def captured_statements(samples):
+    """Recorre ROUTES; devuelve ({sql: (parámetros, {rutas})}, [(url, problema)])."""
+    app = current_app._get_current_object()
+    app.config.update(QUERY_BUDGET_STRICT=False)
+    statements = {}
+    problems = []
+    for role, template in ROUTES:
+        url = template.format(**samples)
+        user_id = samples['users'].get(role)
+        if user_id is None:
+            problems.append((url, f'no hay usuarios con el rol {role}'))
+            continue
+
+        client = app.test_client()
+        login_client(client, user_id)
+        # Contexto de app propio: si no, el request reusa el del comando y con él `g`
+        # (permisos del usuario anterior) y la sesión
+        with app.app_context(), rolled_back():
+            response, endpoint, audit = audited_get(client, url)
+        if response.status_code != 200:
+            problems.append((url, f'respondió {response.status_code} como {role} (usuario {user_id})'))
+
+        for sql, _, parameters in audit.statements:
+            if not PLANNED_RE.match(sql) or isinstance(parameters, list):
+                continue  # sin plan, o executemany (INSERT de varias filas)
+            statements.setdefault(sql, (parameters, set()))[1].add(endpoint)
+    return statements, problems
+
+
+def explain(sql, parameters):
+    """Líneas de detalle de EXPLAIN QUERY PLAN para la sentencia con esos parámetros."""
+    with db.engine.connect() as connection:
+        rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}', parameters).all()
+    return [row[3] for row in rows]
+
+
+def full_scans(plan, sql, endpoints=()):
+    """Recorridos completos sobre tablas reales que no están en WHOLE_TABLE_READS.
+
+    `SCAN tabla USING INDEX` también recorre todo el índice; se acepta solo si la
+    sentencia tiene ORDER BY ... LIMIT, donde el índice da el orden y el recorrido se
+    corta al llegar al límite. WHOLE_TABLE_READS solo vale para sentencias sin ese
+    corte, y si la emiten varias rutas, todas deben tener permitido el recorrido.
+    """
+    stops_early = ORDER_LIMIT_RE.search(sql) is not None
+    scans = []
+    for detail in plan:
+        match = SCAN_RE.match(detail)
+        if not match or match.group(1) not in db.metadata.tables:
+            continue
+        if ' USING ' in detail and stops_early:
+            continue
+        table = match.group(1)
+        if (not stops_early and endpoints
+                and all((endpoint, table) in WHOLE_TABLE_READS for endpoint in endpoints)):
+            continue
+        scans.append(detail)
+    return scans
+
+
+def check_query_plans(samples):
+    """Revisión completa: ([(rutas, sql, plan, recorridos)] de cada sentencia, [(url, problema)])."""
+    statements, problems = captured_statements(samples)
+    results = []
+    for sql, (parameters, endpoints) in statements.items():
+        plan = explain(sql, parameters)
+        results.append((sorted(endpoints), sql, plan, full_scans(plan, sql, endpoints)))
+    return results, problems
+
+
+@click.command('check-query-plans')
+@click.option('--verbose', '-v', is_flag=True, help='Muestra el plan de todas las consultas.')
+@with_appcontext
+def check_query_plans_command(verbose):
+    """Falla si alguna consulta de las rutas revisadas recorre una tabla completa."""
+    results, problems = check_query_plans(sample_ids())
+    if verbose:
+        for endpoints, sql, plan, _ in results:
+            click.echo(f'{", ".join(endpoints)}: {" ".join(sql.split())[:160]}')
+            for detail in plan:
+                click.echo(f'    {detail}')
+
+    failures = [result for result in results if result[3]]
+    for url, problem in problems:
+        click.echo(f'✗ {url}: {problem}', err=True)
+    for endpoints, sql, plan, scans in failures:
+        click.echo(f'✗ {", ".join(endpoints)}: {"; ".join(scans)}', err=True)
+        click.echo(f'    {" ".join(sql.split())[:240]}', err=True)
+
+    if failures or problems:
+        raise SystemExit(1)
+    click.echo(f'✓ {len(results)} consultas de {len(ROUTES)} rutas usan índices')
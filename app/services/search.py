@@ -0,0 +1,190 @@
+"""Búsqueda de texto completo con SQLite FTS5.
+
+Cada tabla con texto tiene su índice FTS5 de contenido externo (fts_<nombre>): el
+índice guarda solo los términos y lee el texto de la tabla original al armar los
+fragmentos. Los triggers creados en la migración lo mantienen al día con cada
+INSERT, DELETE o UPDATE de las columnas indexadas, también los que no pasan por el
+ORM y los borrados en cascada. El tokenizador ignora tildes y mayúsculas:
+"filtracion LOSA" encuentra "Filtración en losa". Los documentos, adjuntos de
+reportes y plantillas entran con el texto que sacó de sus archivos
+app/services/text_extraction.py.
+
+`search` consulta todos los índices en una sola sentencia (UNION ALL), ordena por
+BM25 y devuelve un fragmento con los términos marcados; el filtro por proyectos
+accesibles, y por dueño para quien solo ve sus propias tareas e incidencias, va en la
+misma consulta. `flask search rebuild` vuelve a crear índices y
+triggers (por ejemplo si una migración con batch_alter_table recreó una tabla, lo que
+borra sus triggers) y reindexa todo.
+"""
+import re
+import click
+from flask.cli import AppGroup
+from markupsafe import Markup, escape
+from sqlalchemy import bindparam, text
+from app import db
+
+TOKENIZE = 'unicode61 remove_diacritics 2'
+SNIPPET_TOKENS = 16
+
+# Delimitadores de los términos encontrados en el fragmento: caracteres de uso privado
+# que no aparecen en el texto, para escapar el HTML antes de poner las marcas
+MARK_OPEN, MARK_CLOSE = '\ue000', '\ue001'
+TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+class SearchSource:
+    """Una tabla indexada: columnas de texto con su peso en BM25 y cómo mostrar el resultado."""
+
+    def __init__(self, kind, table, columns, title, project_column='project_id', task_column='NULL',
+                 id_column='t.id', condition=None, owner_column=None):
+        self.kind = kind
+        self.table = table
+        self.fts = f'fts_{table}'
+        self.columns = columns            # {columna: peso}
+        self.title = title                # expresión SQL sobre el alias t
+        self.project_column = project_column  # None: filas sin proyecto (plantillas)
+        self.task_column = task_column
+        self.id_column = id_column        # id del resultado; varias filas con el mismo id cuentan una vez
+        self.condition = condition        # filtro extra cuando varias fuentes comparten tabla
+        self.owner_column = owner_column  # usuario dueño de la fila, para search(owner_id=...)
+
+    def ddl(self):
+        """Sentencias que crean el índice y sus triggers si no existen."""
+        cols = ', '.join(self.columns)
+        new = ', '.join(f'new.{c}' for c in self.columns)
+        old = ', '.join(f'old.{c}' for c in self.columns)
+        insert = f'INSERT INTO {self.fts}(rowid, {cols}) VALUES (new.id, {new});'
+        delete = f"INSERT INTO {self.fts}({self.fts}, rowid, {cols}) VALUES ('delete', old.id, {old});"
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.fts} USING fts5({cols}, content='{self.table}', "
+            f"content_rowid='id', tokenize='{TOKENIZE}', prefix='2 3')",
+            f'CREATE TRIGGER IF NOT EXISTS {self.fts}_ai AFTER INSERT ON {self.table} BEGIN {insert} END',
+            f'CREATE TRIGGER IF NOT EXISTS {self.fts}_ad AFTER DELETE ON {self.table} BEGIN {delete} END',
+            f'CREATE TRIGGER IF NOT EXISTS {self.fts}_au AFTER UPDATE OF {cols} ON {self.table} '
+            f'BEGIN {delete} {insert} END',
+        ]
+
+    def select(self):
+        weights = ', '.join(str(w) for w in self.columns.values())
+        condition = f' AND {self.condition}' if self.condition else ''
+        if self.project_column is None:
+            project, join = 'NULL AS project_id, NULL AS project_name', ''
+        else:
+            project = 'p.id AS project_id, p.name AS project_name'
+            join = f'JOIN projects p ON p.id = t.{self.project_column} '
+        return (
+            f"SELECT '{self.kind}' AS kind, {self.id_column} AS id, {project}, "
+            f"{self.title} AS title, {self.task_column} AS task_id, "
+            f"snippet({self.fts}, -1, '{MARK_OPEN}', '{MARK_CLOSE}', '…', {SNIPPET_TOKENS}) AS snippet, "
+            f"bm25({self.fts}, {weights}) AS rank "
+            f"FROM {self.fts} JOIN {self.table} t ON t.id = {self.fts}.rowid "
+            f"{join}WHERE {self.fts} MATCH :query{condition}"
+        )
+
+
+SOURCES = [
+    SearchSource('proyecto', 'projects', {'name': 5.0, 'description': 1.0}, 't.name', project_column='id'),
+    SearchSource('tarea', 'project_tasks', {'name': 3.0, 'description': 1.0}, 't.name', task_column='t.id',
+                 owner_column='t.responsible_user_id'),
+    SearchSource('reporte', 'technical_reports', {
+        'title': 4.0, 'content': 1.0, 'general_progress': 1.0, 'next_tasks': 1.0,
+        'problems_found': 1.5, 'actions_taken': 1.0, 'additional_notes': 1.0,
+    }, 't.title'),
+    SearchSource('incidencia', 'incident_reports', {'description': 1.5, 'corrective_actions': 1.0},
+                 "t.incident_type || ' · ' || t.location", owner_column='t.reporter_id'),
+    SearchSource('avance', 'project_progress', {'description': 1.0},
+                 "'Avance del ' || strftime('%d/%m/%Y', t.date)"),
+    SearchSource('comentario', 'comments', {'content': 1.0}, "'Comentario'", task_column='t.task_id',
+                 owner_column='(SELECT responsible_user_id FROM project_tasks WHERE id = t.task_id)'),
+    # Texto extraído de archivos (ver app/services/text_extraction.py), un resultado por archivo
+    SearchSource('documento', 'document_texts', {'title': 3.0, 'content': 1.0}, 't.title',
+                 id_column='t.document_id', condition='t.document_id IS NOT NULL'),
+    SearchSource('adjunto', 'document_texts', {'title': 3.0, 'content': 1.0}, 't.title',
+                 id_column='t.report_id', condition='t.report_id IS NOT NULL'),
+    # Plantillas activas: no son de un proyecto, solo para quien ve todos
+    SearchSource('plantilla', 'document_texts', {'title': 3.0, 'content': 1.0}, 't.title',
+                 project_column=None, id_column='t.template_id',
+                 condition='(SELECT is_active FROM config_templates WHERE id = t.template_id)'),
+]
+
+
+def match_expression(query):
+    """Consulta FTS5 a partir de lo que escribió el usuario: todos los términos, por prefijo.
+
+    Cada término va entre comillas, así que los operadores de FTS5 (AND, NEAR, *, ")
+    escritos por el usuario no rompen la consulta.
+    """
+    return ' '.join(f'"{token}"*' for token in TOKEN.findall(query.lower()))
+
+
+def _highlight(snippet):
+    html = str(escape(snippet or ''))
+    return Markup(html.replace(MARK_OPEN, '<mark>').replace(MARK_CLOSE, '</mark>'))
+
+
+def search(query, project_ids=None, kinds=None, owner_id=None, limit=30):
+    """Resultados ordenados por relevancia; `project_ids=None` no filtra (administrador).
+
+    Con `owner_id`, las fuentes que tienen dueño (tareas y sus comentarios, incidencias)
+    solo devuelven las filas de ese usuario. Con `project_ids` se omiten las fuentes sin
+    proyecto (plantillas).
+    """
+    expression = match_expression(query)
+    if not expression or (project_ids is not None and not project_ids):
+        return []
+
+    sources = [s for s in SOURCES if not kinds or s.kind in kinds]
+    parts = []
+    for source in sources:
+        if project_ids is not None and source.project_column is None:
+            continue
+        sql = source.select()
+        if project_ids is not None:
+            sql += ' AND p.id IN :project_ids'
+        if owner_id is not None and source.owner_column:
+            sql += f' AND {source.owner_column} = :owner_id'
+        parts.append(sql)
+    if not parts:
+        return []
+    # Un archivo largo tiene varios fragmentos: queda el mejor de cada uno (con min(), SQLite
+    # toma las demás columnas de la fila del mínimo). MATERIALIZED: con un solo tipo, SQLite
+    # aplanaría la subconsulta en el GROUP BY y bm25()/snippet() fallan fuera del MATCH
+    stmt = text(
+        f"WITH hits AS MATERIALIZED ({' UNION ALL '.join(parts)}) "
+        f"SELECT kind, id, project_id, project_name, title, task_id, snippet, min(rank) AS rank "
+        f"FROM hits GROUP BY kind, id ORDER BY rank LIMIT :limit"
+    )
+    params = {'query': expression, 'limit': limit, 'owner_id': owner_id}
+    if project_ids is not None:
+        stmt = stmt.bindparams(bindparam('project_ids', expanding=True))
+        params['project_ids'] = sorted(project_ids)
+
+    results = []
+    for row in db.session.execute(stmt, params).mappings():
+        result = dict(row)
+        result['snippet'] = _highlight(result['snippet'])
+        results.append(result)
+    return results
+
+
+def rebuild_index():
+    """Crea índices y triggers que falten y reindexa todo; devuelve {tabla: filas}."""
+    counts = {}
+    for source in {s.table: s for s in SOURCES}.values():
+        for statement in source.ddl():
+            db.session.execute(text(statement))
+        db.session.execute(text(f"INSERT INTO {source.fts}({source.fts}) VALUES ('rebuild')"))
+        db.session.execute(text(f"INSERT INTO {source.fts}({source.fts}) VALUES ('optimize')"))
+        counts[source.table] = db.session.execute(text(f'SELECT count(*) FROM {source.table}')).scalar()
+    db.session.commit()
+    return counts
+
+
+search_cli = AppGroup('search', help='Índice de búsqueda de texto completo (FTS5).')
+
+
+@search_cli.command('rebuild')
+def rebuild_command():
+    """Recrea índices y triggers y reindexa todas las tablas de la búsqueda."""
+    for table, count in rebuild_index().items():
+        click.echo(f'{table}: {count} filas indexadas')
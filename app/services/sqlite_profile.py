@@ -0,0 +1,43 @@
+"""Perfil del motor SQLite: pragmas al abrir cada conexión y limpieza del pool tras un fork."""
+import os
+import weakref
+from sqlalchemy import event
+
+# Motores cuyo pool se descarta en los procesos hijos (workers de gunicorn)
+_forked_engines = weakref.WeakSet()
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    """Aplica los pragmas del perfil sobre una conexión DBAPI recién abierta."""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def configure_engine(engine, pragmas):
+    """Engancha los pragmas al evento `connect` y protege el pool ante forks."""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    if pragmas:
+        @event.listens_for(engine, 'connect')
+        def _on_connect(dbapi_connection, connection_record):
+            apply_pragmas(dbapi_connection, pragmas)
+
+    _forked_engines.add(engine)
+
+
+def _reset_pools():
+    for engine in list(_forked_engines):
+        # close=False: no cerrar las conexiones del padre, solo olvidarlas
+        engine.dispose(close=False)
+
+
+# Una conexión SQLite no puede compartirse entre procesos: si gunicorn hace fork
+# con la app ya cargada (--preload), cada worker debe abrir las suyas.
+# os.register_at_fork no existe en Windows, donde tampoco hay fork.
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pools)
@@ -0,0 +1,372 @@
+"""Texto de los documentos, adjuntos de reportes y plantillas, para la búsqueda.
+
+Al subir o reemplazar el archivo de un ProjectDocument, el adjunto de un
+TechnicalReport o una plantilla (ConfigTemplate, las XLSX/DOCX/PDF de
+static/uploads/plantillas), un listener after_flush encola el trabajo 'texto.extraer' (ver
+app/services/jobs.py) en la misma transacción: PDF (pypdf), XLSX y DOCX (el XML que va
+dentro del zip), DXF (los textos de las entidades; es texto plano) y TXT/CSV. El
+parseo corre en un ProcessPoolExecutor (TEXT_EXTRACT_WORKERS procesos, 0 = en el
+proceso del worker) con TEXT_EXTRACT_TIMEOUT segundos por archivo: un archivo que se
+pasa de tiempo hace que se terminen los procesos del pool y se arme otro.
+
+El texto queda en fragmentos de hasta CHUNK_CHARS caracteres, cada uno con el SHA-256
+del archivo de origen: si el archivo nuevo tiene el mismo hash que el ya extraído no se
+vuelve a procesar (los blobs se llaman por su hash, así que ni se leen). Aunque no salga
+texto (un plano escaneado, un DWG, un PDF dañado) queda una fila con el nombre, que
+también se busca. Si el parseo falla o se pasa de tiempo, la fila con el nombre se
+guarda sin hash y el trabajo falla para que la cola lo reintente; `flask texts
+extract` procesa lo que falte, haya cambiado o no se haya podido extraer.
+
+Las plantillas no son de un proyecto: sus fragmentos van sin project_id y solo los
+encuentran quienes ven todos los proyectos (ver app/services/search.py).
+"""
+import hashlib
+import multiprocessing
+import os
+import re
+import threading
+import zipfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from xml.etree import ElementTree
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from pypdf import PdfReader
+from sqlalchemy import delete, event, inspect, select
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import ConfigTemplate, DocumentText, ProjectDocument, TechnicalReport
+from app.services.blob_store import READ_BLOCK, is_blob, resolve_upload
+from app.services.jobs import enqueue, task
+
+CHUNK_CHARS = 2000
+MAX_CHARS = 2_000_000               # tope de texto por archivo
+MAX_XML_BYTES = 64 * 1024 * 1024    # tope por parte descomprimida de un XLSX/DOCX
+
+SPREADSHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+WORDPROCESSING_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+SHEET_NAME = re.compile(r'^xl/worksheets/sheet(\d+)\.xml$')
+
+# DXF: en BLOCKS y ENTITIES el grupo 1 es el texto (TEXT, MTEXT, ATTRIB, cotas) y el 3
+# las partes anteriores de un MTEXT largo
+DXF_SECTIONS = {'BLOCKS', 'ENTITIES'}
+DXF_SYMBOLS = {'%%c': 'Ø', '%%C': 'Ø', '%%d': '°', '%%D': '°', '%%p': '±', '%%P': '±'}
+MTEXT_UNICODE = re.compile(r'\\U\+([0-9A-Fa-f]{4})')
+MTEXT_FORMAT = re.compile(r'\\[ACFHQTWfhqtwcp][^;\\{}]*;|\\[LlOoKkS]|[{}]')
+
+SPACES = re.compile(r'[ \t\r\f\v\x00]+')
+BLANK_LINES = re.compile(r'\n\s*\n+')
+
+# Dueños del texto: modelo, columna con la ruta, columna de document_texts y título
+OWNERS = {
+    'documento': (ProjectDocument, 'file_path', 'document_id', lambda owner: owner.file_name),
+    'adjunto': (TechnicalReport, 'attachment_path', 'report_id', lambda owner: owner.title),
+    'plantilla': (ConfigTemplate, 'file_path', 'template_id', lambda owner: owner.name),
+}
+OWNER_KINDS = {model: kind for kind, (model, *_) in OWNERS.items()}
+
+
+# --- Extracción (corre en el pool, solo recibe y devuelve datos simples) ----------
+
+def _pdf_text(path):
+    pages, size = [], 0
+    for page in PdfReader(path).pages:
+        text = page.extract_text() or ''
+        pages.append(text)
+        size += len(text)
+        if size >= MAX_CHARS:
+            break
+    return '\n\n'.join(pages)
+
+
+def _xml_root(archive, name):
+    if archive.getinfo(name).file_size > MAX_XML_BYTES:
+        raise ValueError(f'{name} supera {MAX_XML_BYTES} bytes descomprimido')
+    return ElementTree.fromstring(archive.read(name))
+
+
+def _joined_text(element, namespace):
+    return ''.join(t.text or '' for t in element.iter(f'{namespace}t'))
+
+
+def _xlsx_text(path):
+    """Celdas de texto de cada hoja, una fila por línea (los números no aportan a la búsqueda)."""
+    with zipfile.ZipFile(path) as archive:
+        names = archive.namelist()
+        shared = []
+        if 'xl/sharedStrings.xml' in names:
+            shared = [_joined_text(si, SPREADSHEET_NS)
+                      for si in _xml_root(archive, 'xl/sharedStrings.xml').iter(f'{SPREADSHEET_NS}si')]
+        sheets = sorted((n for n in names if SHEET_NAME.match(n)), key=lambda n: int(SHEET_NAME.match(n).group(1)))
+
+        lines = []
+        for name in sheets:
+            for row in _xml_root(archive, name).iter(f'{SPREADSHEET_NS}row'):
+                cells = []
+                for cell in row.iter(f'{SPREADSHEET_NS}c'):
+                    kind = cell.get('t')
+                    value = cell.find(f'{SPREADSHEET_NS}v')
+                    if kind == 's' and value is not None:
+                        cells.append(shared[int(value.text)])
+                    elif kind == 'inlineStr':
+                        cells.append(_joined_text(cell, SPREADSHEET_NS))
+                    elif kind == 'str' and value is not None:
+                        cells.append(value.text or '')
+                if any(cells):
+                    lines.append('\t'.join(cells))
+        return '\n'.join(lines)
+
+
+def _docx_text(path):
+    with zipfile.ZipFile(path) as archive:
+        body = _xml_root(archive, 'word/document.xml')
+    return '\n'.join(_joined_text(p, WORDPROCESSING_NS) for p in body.iter(f'{WORDPROCESSING_NS}p'))
+
+
+def _mtext_plain(value):
+    value = MTEXT_UNICODE.sub(lambda m: chr(int(m.group(1), 16)), value)
+    value = value.replace('\\P', '\n').replace('\\~', ' ')
+    value = MTEXT_FORMAT.sub('', value).replace('\\\\', '\\')
+    for code, symbol in DXF_SYMBOLS.items():
+        value = value.replace(code, symbol)
+    return value
+
+
+def _dxf_line(raw):
+    # Antes de AutoCAD 2007 el DXF va en la página de códigos del dibujo (en Chile, cp1252)
+    try:
+        return raw.decode('utf-8').strip()
+    except UnicodeDecodeError:
+        return raw.decode('cp1252', 'replace').strip()
+
+
+def _dxf_text(path):
+    texts, size = [], 0
+    with open(path, 'rb') as fh:
+        if fh.read(18) == b'AutoCAD Binary DXF':
+            return ''
+        fh.seek(0)
+        section, previous, pending = None, None, []
+        lines = iter(fh)
+        for raw_code in lines:
+            code, value = raw_code.strip(), _dxf_line(next(lines, b''))
+            if code == b'0':
+                if value == 'ENDSEC':
+                    section = None
+            elif code == b'2' and previous == (b'0', 'SECTION'):
+                section = value
+            elif section in DXF_SECTIONS and code == b'3':
+                pending.append(value)
+            elif section in DXF_SECTIONS and code == b'1':
+                text = _mtext_plain(''.join(pending) + value).strip()
+                pending = []
+                if text and text != '<>':   # '<>' es la medida de la cota, sin texto propio
+                    texts.append(text)
+                    size += len(text)
+                    if size >= MAX_CHARS:
+                        break
+            previous = (code, value)
+    return '\n'.join(texts)
+
+
+def _plain_text(path):
+    with open(path, 'rb') as fh:
+        data = fh.read(MAX_CHARS * 2)
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data.decode('cp1252', 'replace')
+
+
+EXTRACTORS = {
+    '.pdf': _pdf_text,
+    '.xlsx': _xlsx_text,
+    '.xlsm': _xlsx_text,
+    '.docx': _docx_text,
+    '.dxf': _dxf_text,
+    '.txt': _plain_text,
+    '.csv': _plain_text,
+}
+
+
+def extract_text(path):
+    """Texto del archivo en `path` con los espacios normalizados; '' si el formato no se lee."""
+    extractor = EXTRACTORS.get(os.path.splitext(path)[1].lower())
+    if extractor is None:
+        return ''
+    text = SPACES.sub(' ', extractor(path)[:MAX_CHARS])
+    return BLANK_LINES.sub('\n\n', text).strip()
+
+
+def split_chunks(text, size=CHUNK_CHARS):
+    """Fragmentos de hasta `size` caracteres, cortados en un salto de línea o un espacio."""
+    chunks = []
+    while len(text) > size:
+        cut = text.rfind('\n', size // 2, size)
+        if cut == -1:
+            cut = text.rfind(' ', size // 2, size)
+        if cut == -1:
+            cut = size
+        chunks.append(text[:cut].strip())
+        text = text[cut:].lstrip()
+    chunks.append(text.strip())
+    return [c for c in chunks if c] or ['']
+
+
+def file_sha256(stored_path, path):
+    if is_blob(stored_path):
+        return os.path.basename(path).split('.', 1)[0]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        while block := fh.read(READ_BLOCK):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# --- Extracción y guardado -------------------------------------------------------
+
+class TextExtractor:
+    def __init__(self):
+        self.workers = 0
+        self.timeout = None
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.workers = app.config['TEXT_EXTRACT_WORKERS']
+        self.timeout = app.config['TEXT_EXTRACT_TIMEOUT']
+        register_extraction_listeners()
+        app.cli.add_command(texts_cli)
+
+    def _executor(self):
+        # Con spawn, como el pool de PDF: los hijos no heredan conexiones ni hilos del proceso
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def _discard(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        # Un ProcessPoolExecutor no cancela una tarea que ya empezó: se terminan sus procesos.
+        # Las demás extracciones en curso reciben BrokenProcessPool y se reintentan en el nuevo
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _parse(self, path):
+        """Texto del archivo; None (con aviso en el log) si falla o se pasa de tiempo."""
+        try:
+            if not self.workers:
+                return extract_text(path)
+            for attempt in range(2):
+                pool = self._executor()
+                try:
+                    return pool.submit(extract_text, path).result(self.timeout)
+                except FutureTimeoutError:
+                    self._discard(pool)
+                    current_app.logger.warning('Extracción de texto de %s: más de %s s', path, self.timeout)
+                    return None
+                except BrokenProcessPool:
+                    self._discard(pool)
+            return None
+        except Exception:
+            current_app.logger.warning('No se pudo extraer el texto de %s', path, exc_info=True)
+            return None
+
+    def extract(self, kind, owner_id, force=False):
+        """Extrae y guarda el texto del archivo de un documento, adjunto o plantilla (ver OWNERS)."""
+        model, column, owner_column, title = OWNERS[kind]
+        owner_filter = getattr(DocumentText, owner_column) == owner_id
+        owner = db.session.get(model, owner_id)
+        if owner is None:
+            return 'sin archivo'    # ya borrado: sus fragmentos se fueron en cascada
+        stored_path = getattr(owner, column)
+        path = resolve_upload(current_app.static_folder, stored_path)
+        if path is None:
+            db.session.execute(delete(DocumentText).where(owner_filter))
+            db.session.commit()
+            return 'sin archivo'
+
+        sha256 = file_sha256(stored_path, path)
+        current = db.session.scalar(select(DocumentText.sha256).where(owner_filter).limit(1))
+        if current == sha256 and not force:
+            return 'sin cambios'
+        db.session.rollback()   # no tener la transacción abierta mientras se parsea
+
+        text = self._parse(path)
+        if text is None:
+            # Solo el nombre y sin hash: la próxima extracción no lo da por procesado
+            text, sha256 = '', ''
+
+        # Si el archivo se reemplazó mientras tanto, el texto ya es de otro: lo guarda esa extracción
+        owner = db.session.get(model, owner_id)
+        if owner is None or getattr(owner, column) != stored_path:
+            return 'sin cambios'
+        db.session.execute(delete(DocumentText).where(owner_filter))
+        db.session.add_all([
+            DocumentText(project_id=getattr(owner, 'project_id', None), sha256=sha256, chunk=position, title=title(owner)[:255],
+                         content=chunk, **{owner_column: owner_id})
+            for position, chunk in enumerate(split_chunks(text))
+        ])
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Otra extracción del mismo archivo guardó primero
+            db.session.rollback()
+            return 'sin cambios'
+        if not sha256:
+            return 'fallido'
+        return 'extraído' if text else 'sin texto'
+
+
+text_extractor = TextExtractor()
+
+
+@task('texto.extraer')
+def extract_task(kind, owner_id):
+    if text_extractor.extract(kind, owner_id) == 'fallido':
+        # La cola lo reintenta con backoff (ver app/services/jobs.py)
+        raise RuntimeError(f'No se pudo extraer el texto ({kind} {owner_id})')
+
+
+# --- Listener: qué archivos cambiaron en la transacción ----------------------------
+
+def _enqueue_after_flush(session, flush_context):
+    changed = set()
+    for obj in session.new:
+        kind = OWNER_KINDS.get(type(obj))
+        if kind and getattr(obj, OWNERS[kind][1]):
+            changed.add((kind, obj.id))
+    for obj in session.dirty:
+        kind = OWNER_KINDS.get(type(obj))
+        if kind and inspect(obj).attrs[OWNERS[kind][1]].history.has_changes():
+            changed.add((kind, obj.id))
+    for kind, owner_id in sorted(changed):
+        enqueue('texto.extraer', {'kind': kind, 'owner_id': owner_id}, session=session)
+
+
+def register_extraction_listeners():
+    if not event.contains(db.session, 'after_flush', _enqueue_after_flush):
+        event.listen(db.session, 'after_flush', _enqueue_after_flush)
+
+
+# --- Mantenimiento ---------------------------------------------------------------
+
+texts_cli = AppGroup('texts', help='Texto de documentos, adjuntos y plantillas para la búsqueda.')
+
+
+@texts_cli.command('extract')
+@click.option('--force', is_flag=True, help='Vuelve a extraer aunque el archivo no haya cambiado.')
+def extract_command(force):
+    """Extrae el texto de los documentos, adjuntos y plantillas que falten o hayan cambiado (espera a cada uno)."""
+    counts = Counter()
+    for kind, (model, column, *_) in OWNERS.items():
+        owner_ids = db.session.scalars(select(model.id).where(getattr(model, column).isnot(None))).all()
+        for owner_id in owner_ids:
+            counts[text_extractor.extract(kind, owner_id, force=force)] += 1
+    click.echo(', '.join(f'{count} {status}' for status, count in sorted(counts.items())) or 'Nada que extraer')
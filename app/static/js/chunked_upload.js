@@ -0,0 +1,130 @@
+// Subida por partes reanudable (ver app/services/chunked_upload.py).
+//
+// Se activa en los formularios con data-chunked-upload="<url de /uploads>": al enviar,
+// el archivo del input name="file" se sube en partes con PUT + Upload-Offset, y el
+// formulario se envía con upload_id en lugar del archivo. El id queda en localStorage,
+// así que si la conexión se corta (o se recarga la página) al volver a elegir el mismo
+// archivo la subida sigue desde el último offset confirmado.
+(function () {
+  const MAX_RETRIES = 6;
+
+  function storageKey(file) {
+    return `kodesk-upload:${file.name}:${file.size}:${file.lastModified}`;
+  }
+
+  async function sha256Hex(blob) {
+    // crypto.subtle solo existe en contextos seguros (https o localhost)
+    if (!window.crypto || !crypto.subtle) return null;
+    const hash = await crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+    return Array.from(new Uint8Array(hash)).map(b => b.toString(16).padStart(2, '0')).join('');
+  }
+
+  function sleep(ms) {
+    return new Promise(resolve => setTimeout(resolve, ms));
+  }
+
+  async function json(response) {
+    const data = await response.json().catch(() => ({}));
+    if (!response.ok && response.status !== 409) {
+      const error = new Error(data.error || `Error ${response.status}`);
+      error.status = response.status;
+      error.offset = data.offset;
+      throw error;
+    }
+    return data;
+  }
+
+  async function resumeOrStart(baseUrl, file) {
+    const saved = localStorage.getItem(storageKey(file));
+    if (saved) {
+      const response = await fetch(`${baseUrl}/${saved}`, { credentials: 'same-origin' });
+      if (response.ok) return response.json();
+      localStorage.removeItem(storageKey(file));
+    }
+    const upload = await json(await fetch(baseUrl, {
+      method: 'POST',
+      credentials: 'same-origin',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ filename: file.name, size: file.size }),
+    }));
+    localStorage.setItem(storageKey(file), upload.id);
+    return upload;
+  }
+
+  async function sendChunk(url, file, offset, chunkSize) {
+    const chunk = file.slice(offset, Math.min(offset + chunkSize, file.size));
+    const headers = { 'Upload-Offset': String(offset), 'Content-Type': 'application/octet-stream' };
+    const checksum = await sha256Hex(chunk);
+    if (checksum) headers['X-Chunk-Sha256'] = checksum;
+    const response = await fetch(url, { method: 'PUT', credentials: 'same-origin', headers, body: chunk });
+    const data = await json(response);
+    // 409: el servidor tiene otro offset confirmado; se sigue desde ahí
+    return data.offset;
+  }
+
+  async function upload(baseUrl, file, onProgress) {
+    const state = await resumeOrStart(baseUrl, file);
+    const url = `${baseUrl}/${state.id}`;
+    let offset = state.offset;
+    let retries = 0;
+    onProgress(offset, file.size);
+
+    while (offset < file.size) {
+      try {
+        offset = await sendChunk(url, file, offset, state.chunk_size);
+        retries = 0;
+        onProgress(offset, file.size);
+      } catch (error) {
+        // Errores del protocolo (4xx) no se arreglan reintentando, salvo el checksum
+        if (error.status && error.status < 500 && error.status !== 422) throw error;
+        if (++retries > MAX_RETRIES) throw error;
+        await sleep(Math.min(30000, 1000 * 2 ** retries));
+        const current = await fetch(url, { credentials: 'same-origin' }).then(json).catch(() => null);
+        if (current) offset = current.offset;
+      }
+    }
+    return state.id;
+  }
+
+  function setup(form) {
+    const input = form.querySelector('input[type="file"][name="file"]');
+    const progress = form.querySelector('[data-upload-progress]');
+    const bar = progress && progress.querySelector('[data-upload-bar]');
+    const label = progress && progress.querySelector('[data-upload-label]');
+    if (!input || !window.fetch || !window.Blob || !Blob.prototype.slice) return;
+
+    form.addEventListener('submit', async event => {
+      const file = input.files && input.files[0];
+      if (!file || form.dataset.uploading) return;
+      event.preventDefault();
+      form.dataset.uploading = '1';
+      const buttons = form.querySelectorAll('button[type="submit"]');
+      buttons.forEach(b => { b.disabled = true; });
+      if (progress) progress.classList.remove('hidden');
+
+      try {
+        const id = await upload(form.dataset.chunkedUpload, file, (sent, total) => {
+          const pct = total ? Math.floor(sent * 100 / total) : 100;
+          if (bar) bar.style.width = `${pct}%`;
+          if (label) label.textContent = `${pct}% (${(sent / 1048576).toFixed(1)} de ${(total / 1048576).toFixed(1)} MB)`;
+        });
+        localStorage.removeItem(storageKey(file));
+
+        const hidden = document.createElement('input');
+        hidden.type = 'hidden';
+        hidden.name = 'upload_id';
+        hidden.value = id;
+        form.appendChild(hidden);
+        // El archivo ya está en el servidor: no se vuelve a enviar con el formulario
+        input.disabled = true;
+        form.submit();
+      } catch (error) {
+        delete form.dataset.uploading;
+        buttons.forEach(b => { b.disabled = false; });
+        if (label) label.textContent = `La subida se interrumpió: ${error.message}. Vuelve a enviar para continuar.`;
+      }
+    });
+  }
+
+  document.querySelectorAll('form[data-chunked-upload]').forEach(setup);
+})();
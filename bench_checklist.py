@@ -0,0 +1,145 @@
+"""Benchmark del guardado de la checklist diaria: una consulta por ítem vs. upsert en bloque.
+
+Simula las 8:00: --submissions envíos simultáneos repartidos entre --processes procesos
+(como los workers de gunicorn). Cada usuario envía dos veces, así que la mitad de los
+envíos actualiza filas que ya existen.
+
+- 'por-item': el camino anterior, un SELECT y luego un INSERT o UPDATE por ítem en la
+  misma transacción, sin índice único (cuenta las filas duplicadas que deja).
+- 'upsert': app/services/checklist.py, un INSERT ... ON CONFLICT DO UPDATE por envío
+  sobre el índice único (checklist_id, user_id, date).
+
+    python bench_checklist.py --submissions 200 --processes 16 --items 15
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+from datetime import date
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+import config
+from app.services.checklist import completion_upsert
+from app.services.sqlite_profile import configure_engine
+
+SCHEMA = [
+    "CREATE TABLE checklist_completion (id INTEGER PRIMARY KEY, checklist_id INTEGER NOT NULL, "
+    "user_id INTEGER NOT NULL, date DATE, completed BOOLEAN)",
+    "CREATE INDEX ix_checklist_completion_user_date ON checklist_completion (user_id, date)",
+]
+UNIQUE_INDEX = ("CREATE UNIQUE INDEX ix_checklist_completion_item_user_date "
+                "ON checklist_completion (checklist_id, user_id, date)")
+
+
+def make_engine(path, profile):
+    engine = create_engine(f"sqlite:///{path}")
+    configure_engine(engine, config.SQLITE_PROFILES[profile])
+    return engine
+
+
+def save_per_item(conn, user_id, day, states):
+    for checklist_id, completed in states.items():
+        params = {'checklist_id': checklist_id, 'user_id': user_id, 'date': day.isoformat(), 'completed': completed}
+        existing = conn.execute(text(
+            "SELECT id FROM checklist_completion "
+            "WHERE checklist_id = :checklist_id AND user_id = :user_id AND date = :date LIMIT 1"
+        ), params).scalar()
+        if existing:
+            conn.execute(text("UPDATE checklist_completion SET completed = :completed WHERE id = :id"),
+                         {'completed': completed, 'id': existing})
+        else:
+            conn.execute(text(
+                "INSERT INTO checklist_completion (checklist_id, user_id, date, completed) "
+                "VALUES (:checklist_id, :user_id, :date, :completed)"
+            ), params)
+
+
+def save_upsert(conn, user_id, day, states):
+    conn.execute(*completion_upsert(user_id, day, states))
+
+
+STRATEGIES = {'por-item': save_per_item, 'upsert': save_upsert}
+
+
+def worker(path, profile, strategy, items, submissions, start, results):
+    engine = make_engine(path, profile)
+    save = STRATEGIES[strategy]
+    day = date.today()
+    latencies, errors = [], 0
+    start.wait()
+    for n, user_id in enumerate(submissions):
+        states = {item: (item + n) % 3 != 0 for item in range(1, items + 1)}
+        began = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                save(conn, user_id, day, states)
+            latencies.append(time.perf_counter() - began)
+        except OperationalError:
+            errors += 1
+    engine.dispose()
+    results.put((latencies, errors))
+
+
+def run(strategy, profile, submissions, processes, items):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        engine = make_engine(path, profile)
+        with engine.begin() as conn:
+            for statement in SCHEMA + ([UNIQUE_INDEX] if strategy == 'upsert' else []):
+                conn.execute(text(statement))
+
+        # Cada usuario aparece dos veces: primero inserta y después actualiza su checklist
+        users = [n % (submissions // 2 or 1) + 1 for n in range(submissions)]
+        start = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=worker, args=(path, profile, strategy, items,
+                                                              users[p::processes], start, results))
+                 for p in range(processes)]
+        for p in procs:
+            p.start()
+        time.sleep(0.5)     # que todos estén conectados antes de largar
+        began = time.perf_counter()
+        start.set()
+        latencies, errors = [], 0
+        for _ in procs:
+            lat, err = results.get()
+            latencies += lat
+            errors += err
+        elapsed = time.perf_counter() - began
+        for p in procs:
+            p.join()
+
+        with engine.connect() as conn:
+            rows = conn.execute(text("SELECT count(*) FROM checklist_completion")).scalar()
+            duplicates = conn.execute(text(
+                "SELECT coalesce(sum(n - 1), 0) FROM (SELECT count(*) AS n FROM checklist_completion "
+                "GROUP BY checklist_id, user_id, date)"
+            )).scalar()
+        engine.dispose()
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+    print(f"{strategy:>9}: {elapsed:6.2f}s total  {len(latencies) / elapsed:7.1f} envíos/s  "
+          f"p50 {statistics.median(latencies) * 1000 if latencies else 0:6.1f} ms  p95 {p95 * 1000:6.1f} ms  "
+          f"{errors} bloqueos  {rows} filas ({duplicates} duplicadas)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--submissions', type=int, default=200)
+    parser.add_argument('--processes', type=int, default=16)
+    parser.add_argument('--items', type=int, default=15)
+    parser.add_argument('--profile', default=config.DB_PROFILE, choices=list(config.SQLITE_PROFILES))
+    parser.add_argument('--strategies', nargs='+', default=list(STRATEGIES), choices=list(STRATEGIES))
+    args = parser.parse_args()
+
+    print(f"{args.submissions} envíos de {args.items} ítems, {args.processes} procesos, perfil {args.profile}")
+    for strategy in args.strategies:
+        run(strategy, args.profile, args.submissions, args.processes, args.items)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Benchmark de contención SQLite: compara los perfiles de config.SQLITE_PROFILES.
+
+Simula el inicio de turno: varios procesos guardan checklists mientras otros leen.
+
+    python bench_sqlite.py --writers 8 --readers 4 --seconds 10
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from datetime import date
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+import config
+from app.services.sqlite_profile import configure_engine
+
+ITEMS_PER_CHECKLIST = 15
+
+
+def make_engine(path, profile):
+    engine = create_engine(f"sqlite:///{path}")
+    configure_engine(engine, config.SQLITE_PROFILES[profile])
+    return engine
+
+
+def writer(path, profile, seconds, user_id, results):
+    engine = make_engine(path, profile)
+    commits = locked = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        try:
+            with engine.begin() as conn:
+                conn.execute(
+                    text("INSERT INTO checklist_completion (checklist_id, user_id, date, completed) "
+                         "VALUES (:checklist_id, :user_id, :date, 1)"),
+                    [{'checklist_id': i, 'user_id': user_id, 'date': date.today().isoformat()}
+                     for i in range(ITEMS_PER_CHECKLIST)],
+                )
+            commits += 1
+        except OperationalError:
+            locked += 1
+    results.put(('write', commits, locked))
+
+
+def reader(path, profile, seconds, results):
+    engine = make_engine(path, profile)
+    reads = locked = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT user_id, COUNT(*) FROM checklist_completion GROUP BY user_id")).all()
+            reads += 1
+        except OperationalError:
+            locked += 1
+    results.put(('read', reads, locked))
+
+
+def run(profile, writers, readers, seconds):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        with make_engine(path, profile).begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE checklist_completion (id INTEGER PRIMARY KEY, checklist_id INTEGER NOT NULL, "
+                "user_id INTEGER NOT NULL, date DATE, completed BOOLEAN)"
+            ))
+
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=writer, args=(path, profile, seconds, n, results))
+                 for n in range(writers)]
+        procs += [multiprocessing.Process(target=reader, args=(path, profile, seconds, results))
+                  for _ in range(readers)]
+        for p in procs:
+            p.start()
+        totals = {'write': [0, 0], 'read': [0, 0]}
+        for _ in procs:
+            kind, ok, locked = results.get()
+            totals[kind][0] += ok
+            totals[kind][1] += locked
+        for p in procs:
+            p.join()
+
+    print(f"{profile:>10}: {totals['write'][0] / seconds:8.1f} checklists/s "
+          f"({totals['write'][1]} bloqueos)  {totals['read'][0] / seconds:8.1f} lecturas/s "
+          f"({totals['read'][1]} bloqueos)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--profiles', nargs='+', default=list(config.SQLITE_PROFILES))
+    args = parser.parse_args()
+
+    print(f"{args.writers} escritores, {args.readers} lectores, {args.seconds}s por perfil")
+    for profile in args.profiles:
+        run(profile, args.writers, args.readers, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,123 @@ BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
 SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(BASE_DIR, 'kodesk.db')
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Perfil del motor SQLite, se elige con la variable de entorno KODESK_DB_PROFILE.
+# 'production' usa WAL para que las escrituras no bloqueen a los lectores;
+# 'legacy' vuelve a la configuración por defecto de SQLite (rollback journal).
+DB_PROFILE = os.environ.get('KODESK_DB_PROFILE', 'production')
+SQLITE_PROFILES = {
+    'production': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,          # ms de espera antes de "database is locked"
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64000,          # negativo = KiB (~64 MB por conexión)
+        'foreign_keys': 'ON',
+    },
+    'legacy': {
+        'journal_mode': 'DELETE',
+    },
+}
+
+# Caché del usuario autenticado (user_loader): segundos de vida, cantidad de usuarios y
+# cada cuántos segundos se leen las invalidaciones de otros procesos (services/identity.py)
+IDENTITY_CACHE_TTL = 60
+IDENTITY_CACHE_SIZE = 512
+IDENTITY_CACHE_CHECK = 2
+
+# Filas por página en los listados paginados por keyset (app/services/pagination.py)
+PAGE_SIZE = 20
+
+# Comentarios que muestra de entrada la página de una tarea (el resto con "cargar anteriores")
+COMMENTS_PAGE_SIZE = 30
+
+# Stream de eventos en vivo (SSE, ver app/services/events.py), en segundos salvo indicación
+EVENTS_POLL_INTERVAL = 1.0       # cada cuánto cada proceso lee eventos de otros workers
+EVENTS_HEARTBEAT = 15
+EVENTS_STREAM_MAX_AGE = 300      # luego se cierra y EventSource reconecta con Last-Event-ID
+EVENTS_RETRY_MS = 3000
+EVENTS_RETENTION_HOURS = 24
+
+# PDF de incidencias (ver app/services/pdf_render.py): carpeta de caché, procesos
+# del pool de render (0 = renderiza en el mismo proceso) y espera máxima en segundos
+PDF_CACHE_DIR = os.path.join(BASE_DIR, 'cache', 'pdf')
+PDF_RENDER_WORKERS = 2
+PDF_RENDER_TIMEOUT = 30
+
+# Subidas por partes (ver app/services/chunked_upload.py). Cada parte pasa por un
+# request normal, así que UPLOAD_CHUNK_SIZE debe quedar bajo MAX_CONTENT_LENGTH (16 MB)
+UPLOAD_TMP_DIR = os.path.join(BASE_DIR, 'cache', 'uploads')
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_MAX_SIZE = 2 * 1024 * 1024 * 1024
+UPLOAD_EXPIRY_HOURS = 24
+UPLOAD_MAX_OPEN = 5              # subidas sin terminar por usuario
+
+# Cola de trabajos en segundo plano (ver app/services/jobs.py). Con JOBS_INLINE cada
+# proceso web vacía la cola en un hilo después del commit; con KODESK_JOBS_INLINE=0 lo
+# hace solo `flask worker`. Segundos: espera entre consultas a la tabla, backoff de los
+# reintentos (base que se duplica en cada intento, y tope) y tiempo tras el cual un
+# trabajo en curso se da por abandonado (más que el trabajo más largo)
+JOBS_INLINE = os.environ.get('KODESK_JOBS_INLINE', '1') == '1'
+JOB_POLL_INTERVAL = 1.0
+JOB_BACKOFF_BASE = 10
+JOB_BACKOFF_MAX = 3600
+JOB_LOCK_TIMEOUT = 900
+JOB_RETENTION_DAYS = 7
+
+# Extracción del texto de documentos y adjuntos para la búsqueda (ver
+# app/services/text_extraction.py): procesos del pool (0 = sin pool ni límite de
+# tiempo) y segundos como máximo por archivo
+TEXT_EXTRACT_WORKERS = 2
+TEXT_EXTRACT_TIMEOUT = 60
+
+# Auditoría de consultas por request (ver app/services/query_audit.py).
+# Se activa con KODESK_QUERY_AUDIT=1; avisa de N+1 a partir de QUERY_AUDIT_REPEAT
+# sentencias iguales y compara cada endpoint con su presupuesto de consultas.
+QUERY_AUDIT = os.environ.get('KODESK_QUERY_AUDIT') == '1'
+QUERY_AUDIT_REPEAT = 3
+# Máximo de consultas por endpoint, contando la carga del usuario cuando no está en caché.
+# Las páginas de admin suman la lectura del contador de la campana (ver notifications.py)
+QUERY_BUDGETS = {
+    'admin.dashboard_control': 5,            # snapshot viejo: lectura + recálculo sin guardar
+    'admin.flujos_aprobacion': 5,
+    'admin.listar_incidencias': 6,
+    'admin.notificaciones': 6,
+    'admin.notificaciones_no_leidas': 2,
+    'admin.project_details': 5,
+    'admin.usuarios': 4,
+    'admin.ver_reportes': 5,
+    'editor.editor_dashboard': 2,
+    'editor.listar_avances': 4,
+    'editor.listar_reportes': 2,
+    'editor.task_comments': 3,
+    'editor.task_comments_feed': 3,
+    'editor.view_documents': 3,
+    'editor.view_tasks': 3,
+    'invitado.dashboard_invitado': 4,
+    'invitado.listar_avances': 5,
+    'invitado.ver_proyecto': 7,
+    'lector.dashboard': 5,
+    'mensajero.dashboard': 3,
+    'miembro.comentarios_tarea': 3,
+    'miembro.comentarios_tarea_feed': 3,
+    'miembro.listar_avances': 5,
+    'miembro.ver_incidencias_proyecto': 4,
+}
+
 SECRET_KEY = 'tu-clave-super-secreta'
 WHATSAPP_PHONE = "56920576206"
 
+
+# Ejecutable de Tailwind para `flask assets css` (ver app/services/assets.py); el
+# paquete tailwindcss-bin de requirements-dev.txt lo instala en el entorno
+TAILWIND_CLI = 'tailwindcss'
+
+# Descargas de archivos (ver app/services/downloads.py). DOWNLOAD_OFFLOAD es el header
+# con que el proxy toma la transferencia: None (la sirve el worker), 'X-Accel-Redirect'
+# (nginx, con las ubicaciones internas de abajo) o 'X-Sendfile'
+DOWNLOAD_OFFLOAD = None
+DOWNLOAD_ACCEL_LOCATIONS = {
+    '/_protegido/static/': os.path.join(BASE_DIR, 'app', 'static'),
+    '/_protegido/cache/': os.path.join(BASE_DIR, 'cache'),
+}
@@ -0,0 +1,22 @@
+"""Configuración de gunicorn: `gunicorn run:app` la toma sola desde la raíz del repo.
+
+Cada pestaña abierta mantiene un stream SSE (/eventos/stream) ocupando un hilo hasta
+EVENTS_STREAM_MAX_AGE segundos, así que los workers sync por defecto se agotan con
+unas pocas pestañas. Con gthread cada worker atiende `threads` requests a la vez: el
+máximo de pestañas conectadas es workers × threads menos lo que quede para el resto.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('KODESK_BIND', '127.0.0.1:8000')
+worker_class = 'gthread'
+workers = int(os.environ.get('KODESK_WORKERS', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+threads = int(os.environ.get('KODESK_THREADS', 32))
+
+# Un stream manda heartbeat cada EVENTS_HEARTBEAT segundos; con gthread el timeout
+# vigila al worker, no a cada request, así que no corta los streams
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
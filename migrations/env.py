@@ -51,6 +51,13 @@ def get_metadata():
     return target_db.metadata
 
 
+def include_object(object, name, type_, reflected, compare_to):
+    # Índices FTS5 de búsqueda (y sus tablas internas): se crean a mano en su migración
+    if type_ == 'table' and reflected and compare_to is None and name.startswith('fts_'):
+        return False
+    return True
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -93,10 +100,18 @@ def run_migrations_online():
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    conf_args.setdefault("include_object", include_object)
 
     connectable = get_engine()
 
     with connectable.connect() as connection:
+        # Con foreign_keys=ON (perfil production), las tablas que batch_alter_table
+        # recrea dispararían los ON DELETE CASCADE al borrarse la tabla original.
+        if connection.dialect.name == 'sqlite':
+            connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+            # Cerrar el autobegin para que Alembic abra (y confirme) su propia transacción
+            connection.commit()
+
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
@@ -0,0 +1,94 @@
+"""Indices de claves foraneas y orden
+
+Revision ID: 9c1d7a42e5b3
+Revises: ee4b321db902
+Create Date: 2026-10-18 10:41:03.552871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c1d7a42e5b3'
+down_revision = 'ee4b321db902'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('project_user_role', schema=None) as batch_op:
+        batch_op.create_index('ix_project_user_role_user_id', ['user_id'], unique=False)
+
+    with op.batch_alter_table('project_documents', schema=None) as batch_op:
+        batch_op.create_index('ix_project_documents_project_upload', ['project_id', 'upload_date'], unique=False)
+
+    with op.batch_alter_table('project_tasks', schema=None) as batch_op:
+        batch_op.create_index('ix_project_tasks_project_status', ['project_id', 'status'], unique=False)
+        batch_op.create_index('ix_project_tasks_responsible_start', ['responsible_user_id', 'start_date'], unique=False)
+
+    with op.batch_alter_table('project_progress', schema=None) as batch_op:
+        batch_op.create_index('ix_project_progress_project_date', ['project_id', 'date'], unique=False)
+
+    with op.batch_alter_table('progress_photos', schema=None) as batch_op:
+        batch_op.create_index('ix_progress_photos_progress_id', ['progress_id'], unique=False)
+
+    with op.batch_alter_table('daily_checklists', schema=None) as batch_op:
+        batch_op.create_index('ix_daily_checklists_project_active', ['project_id', 'is_active'], unique=False)
+
+    with op.batch_alter_table('checklist_completion', schema=None) as batch_op:
+        batch_op.create_index('ix_checklist_completion_user_date', ['user_id', 'date'], unique=False)
+
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.create_index('ix_comments_task_created', ['task_id', 'created_at'], unique=False)
+
+    with op.batch_alter_table('incident_reports', schema=None) as batch_op:
+        batch_op.create_index('ix_incident_reports_project_reporter_datetime', ['project_id', 'reporter_id', 'report_datetime'], unique=False)
+        batch_op.create_index('ix_incident_reports_report_datetime', ['report_datetime'], unique=False)
+
+    with op.batch_alter_table('technical_reports', schema=None) as batch_op:
+        batch_op.create_index('ix_technical_reports_user_created', ['user_id', 'created_at'], unique=False)
+        batch_op.create_index('ix_technical_reports_project_id', ['project_id'], unique=False)
+
+    with op.batch_alter_table('approval_flows', schema=None) as batch_op:
+        batch_op.create_index('ix_approval_flows_responsible_created', ['responsible_id', 'created_at'], unique=False)
+        batch_op.create_index('ix_approval_flows_project_task_id', ['project_task_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('approval_flows', schema=None) as batch_op:
+        batch_op.drop_index('ix_approval_flows_project_task_id')
+        batch_op.drop_index('ix_approval_flows_responsible_created')
+
+    with op.batch_alter_table('technical_reports', schema=None) as batch_op:
+        batch_op.drop_index('ix_technical_reports_project_id')
+        batch_op.drop_index('ix_technical_reports_user_created')
+
+    with op.batch_alter_table('incident_reports', schema=None) as batch_op:
+        batch_op.drop_index('ix_incident_reports_report_datetime')
+        batch_op.drop_index('ix_incident_reports_project_reporter_datetime')
+
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.drop_index('ix_comments_task_created')
+
+    with op.batch_alter_table('checklist_completion', schema=None) as batch_op:
+        batch_op.drop_index('ix_checklist_completion_user_date')
+
+    with op.batch_alter_table('daily_checklists', schema=None) as batch_op:
+        batch_op.drop_index('ix_daily_checklists_project_active')
+
+    with op.batch_alter_table('progress_photos', schema=None) as batch_op:
+        batch_op.drop_index('ix_progress_photos_progress_id')
+
+    with op.batch_alter_table('project_progress', schema=None) as batch_op:
+        batch_op.drop_index('ix_project_progress_project_date')
+
+    with op.batch_alter_table('project_tasks', schema=None) as batch_op:
+        batch_op.drop_index('ix_project_tasks_responsible_start')
+        batch_op.drop_index('ix_project_tasks_project_status')
+
+    with op.batch_alter_table('project_documents', schema=None) as batch_op:
+        batch_op.drop_index('ix_project_documents_project_upload')
+
+    with op.batch_alter_table('project_user_role', schema=None) as batch_op:
+        batch_op.drop_index('ix_project_user_role_user_id')
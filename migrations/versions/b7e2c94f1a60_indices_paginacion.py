@@ -0,0 +1,38 @@
+"""Indices para la paginacion por keyset
+
+Revision ID: b7e2c94f1a60
+Revises: 5a8e0f3c7d21
+Create Date: 2026-10-18 15:12:44.381902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2c94f1a60'
+down_revision = '5a8e0f3c7d21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('mensajes', schema=None) as batch_op:
+        batch_op.create_index('ix_mensajes_fecha', ['fecha'], unique=False)
+
+    with op.batch_alter_table('technical_reports', schema=None) as batch_op:
+        batch_op.create_index('ix_technical_reports_report_date', ['report_date'], unique=False)
+
+    with op.batch_alter_table('system_notifications', schema=None) as batch_op:
+        batch_op.create_index('ix_system_notifications_user_created', ['user_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('system_notifications', schema=None) as batch_op:
+        batch_op.drop_index('ix_system_notifications_user_created')
+
+    with op.batch_alter_table('technical_reports', schema=None) as batch_op:
+        batch_op.drop_index('ix_technical_reports_report_date')
+
+    with op.batch_alter_table('mensajes', schema=None) as batch_op:
+        batch_op.drop_index('ix_mensajes_fecha')
@@ -0,0 +1,55 @@
+"""Índices de búsqueda FTS5
+
+Revision ID: c5d92e7a1f38
+Revises: a6c31f9e0d47
+Create Date: 2026-10-18 21:06:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d92e7a1f38'
+down_revision = 'a6c31f9e0d47'
+branch_labels = None
+depends_on = None
+
+# Tablas indexadas y sus columnas de texto (ver app/services/search.py)
+INDEXED = {
+    'projects': ('name', 'description'),
+    'project_tasks': ('name', 'description'),
+    'technical_reports': ('title', 'content', 'general_progress', 'next_tasks', 'problems_found',
+                          'actions_taken', 'additional_notes'),
+    'incident_reports': ('description', 'corrective_actions'),
+    'project_progress': ('description',),
+    'comments': ('content',),
+}
+
+
+def upgrade():
+    # Autogenerate no conoce las tablas virtuales: índice de contenido externo + triggers
+    for table, columns in INDEXED.items():
+        fts = f'fts_{table}'
+        cols = ', '.join(columns)
+        new = ', '.join(f'new.{c}' for c in columns)
+        old = ', '.join(f'old.{c}' for c in columns)
+        insert = f'INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new});'
+        delete = f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old});"
+
+        op.execute(
+            f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{table}', content_rowid='id', "
+            f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        op.execute(f'CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN {insert} END')
+        op.execute(f'CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN {delete} END')
+        op.execute(f'CREATE TRIGGER {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN {delete} {insert} END')
+        op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def downgrade():
+    for table in INDEXED:
+        fts = f'fts_{table}'
+        for suffix in ('ai', 'ad', 'au'):
+            op.execute(f'DROP TRIGGER IF EXISTS {fts}_{suffix}')
+        op.execute(f'DROP TABLE IF EXISTS {fts}')
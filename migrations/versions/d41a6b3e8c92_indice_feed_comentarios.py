@@ -0,0 +1,28 @@
+"""Indice del feed de comentarios por tarea e id
+
+Revision ID: d41a6b3e8c92
+Revises: b7e2c94f1a60
+Create Date: 2026-10-18 16:40:09.215377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41a6b3e8c92'
+down_revision = 'b7e2c94f1a60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.drop_index('ix_comments_task_created')
+        batch_op.create_index('ix_comments_task_id', ['task_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.drop_index('ix_comments_task_id')
+        batch_op.create_index('ix_comments_task_created', ['task_id', 'created_at'], unique=False)
@@ -0,0 +1,39 @@
+"""Contador de notificaciones no leidas
+
+Revision ID: ee4b321db902
+Revises: 373f1d147628
+Create Date: 2026-10-18 09:12:40.118203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ee4b321db902'
+down_revision = '373f1d147628'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('admin_users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('unread_notifications', sa.Integer(), nullable=False, server_default='0'))
+
+    with op.batch_alter_table('system_notifications', schema=None) as batch_op:
+        batch_op.create_index('ix_system_notifications_user_read_created', ['user_id', 'read', 'created_at'], unique=False)
+
+    # Inicializar el contador con las notificaciones pendientes existentes
+    op.execute(
+        "UPDATE admin_users SET unread_notifications = ("
+        "SELECT COUNT(*) FROM system_notifications "
+        "WHERE system_notifications.user_id = admin_users.id AND system_notifications.read = 0)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('system_notifications', schema=None) as batch_op:
+        batch_op.drop_index('ix_system_notifications_user_read_created')
+
+    with op.batch_alter_table('admin_users', schema=None) as batch_op:
+        batch_op.drop_column('unread_notifications')